@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Product, Order, OrderItem, Review
+from .models import Category, Product, Order, OrderItem, Review, Job
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -8,9 +8,10 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-	list_display = ('name', 'category', 'price', 'roast_level', 'is_available')
+	list_display = ('name', 'category', 'price', 'stock', 'roast_level', 'is_available')
 	list_filter = ('category', 'roast_level', 'is_available')
 	search_fields = ('name', 'description', 'origin')
+	readonly_fields = Product.RATING_FIELDS
 
 class OrderItemInline(admin.TabularInline):
 	model = OrderItem
@@ -27,4 +28,11 @@ class OrderAdmin(admin.ModelAdmin):
 class ReviewAdmin(admin.ModelAdmin):
 	list_display = ('product', 'user', 'rating', 'created_at')
 	list_filter = ('rating', 'created_at')
-	search_fields = ('product__name', 'user__username')
\ No newline at end of file
+	search_fields = ('product__name', 'user__username')
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+	list_display = ('id', 'queue', 'name', 'status', 'attempts', 'run_at', 'finished_at')
+	list_filter = ('status', 'queue', 'name')
+	search_fields = ('idempotency_key',)
+	readonly_fields = ('attempts', 'locked_at', 'locked_by', 'last_error', 'created_at', 'finished_at')
@@ -0,0 +1,194 @@
+"""
+Дневные сводки продаж: DailySales, DailyCategorySales и DailyProductSales.
+
+Заказ попадает в сводки заданием analytics.sync_order (api.tasks) после создания
+и каждой смены статуса: задание переносит вклад заказа из строк статуса, под
+которым он учтён (Order.rollup_status), в строки текущего статуса. Повтор задания
+или задания, выполненные не по порядку, не учтут заказ дважды, а оформление заказа
+не ждёт блокировки общих для всех заказов дня строк сводки
+"""
+from collections import defaultdict
+from decimal import Decimal
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import Category, DailyCategorySales, DailyProductSales, DailySales, Order, OrderItem, Product
+
+ROLLUPS = (DailySales, DailyCategorySales, DailyProductSales)
+# Статусы, которые отчёт учитывает по умолчанию
+REPORT_STATUSES = ('pending', 'processing', 'shipped', 'delivered')
+REBUILD_BATCH_SIZE = 1000
+
+
+def order_contributions(day, lines):
+	"""
+	Вклад заказа в строки сводок: [(модель, ключ строки, (заказы, единицы, выручка))].
+	lines - позиции заказа (product_id, category_id, quantity, price)
+	"""
+	day_units, day_revenue = 0, Decimal(0)
+	categories = defaultdict(lambda: [0, Decimal(0)])
+	contributions = []
+	for product_id, category_id, quantity, price in lines:
+		revenue = price * quantity
+		contributions.append((DailyProductSales, {'date': day, 'product_id': product_id}, (1, quantity, revenue)))
+		categories[category_id][0] += quantity
+		categories[category_id][1] += revenue
+		day_units += quantity
+		day_revenue += revenue
+	contributions.extend(
+		(DailyCategorySales, {'date': day, 'category_id': category_id}, (1, units, revenue))
+		for category_id, (units, revenue) in categories.items()
+	)
+	contributions.append((DailySales, {'date': day}, (1, day_units, day_revenue)))
+	return contributions
+
+
+def apply_changes(changes):
+	"""
+	Применяет [(модель, ключ строки со статусом, дельты)] в одном порядке для всех
+	заданий, чтобы параллельные задания не блокировали друг друга взаимно
+	"""
+	def order_key(change):
+		model, keys, _ = change
+		return ROLLUPS.index(model), sorted((name, str(value)) for name, value in keys.items())
+
+	for model, keys, (orders, units, revenue) in sorted(changes, key=order_key):
+		increment(model, keys, orders, units, revenue)
+
+
+def increment(model, keys, orders, units, revenue):
+	"""Прибавляет дельты к строке сводки одним UPDATE, при отсутствии строки создаёт её"""
+	changes = {'orders': F('orders') + orders, 'units': F('units') + units, 'revenue': F('revenue') + revenue}
+	if model.objects.filter(**keys).update(**changes):
+		return
+	try:
+		with transaction.atomic():
+			model.objects.create(**keys, orders=orders, units=units, revenue=revenue)
+	except IntegrityError:
+		# Строку только что создало параллельное задание
+		model.objects.filter(**keys).update(**changes)
+
+
+def order_changes(order_id, created_at, status, sign):
+	lines = OrderItem.objects.filter(order_id=order_id).values_list(
+		'product_id', 'product__category_id', 'quantity', 'price',
+	)
+	day = timezone.localdate(created_at)
+	return [
+		(model, {**keys, 'status': status}, tuple(sign * value for value in deltas))
+		for model, keys, deltas in order_contributions(day, lines)
+	]
+
+
+def sync_order(order_id):
+	"""Приводит вклад заказа в сводках к его текущему статусу"""
+	with transaction.atomic():
+		order = Order.objects.select_for_update().filter(pk=order_id).values(
+			'status', 'rollup_status', 'created_at',
+		).first()
+		if order is None or order['status'] == order['rollup_status']:
+			return
+		changes = order_changes(order_id, order['created_at'], order['status'], 1)
+		if order['rollup_status']:
+			changes += order_changes(order_id, order['created_at'], order['rollup_status'], -1)
+		apply_changes(changes)
+		Order.objects.filter(pk=order_id).update(rollup_status=order['status'])
+
+
+def remove_order(order):
+	"""Вычитает удаляемый заказ из сводок (до удаления его позиций)"""
+	if order.rollup_status:
+		with transaction.atomic():
+			apply_changes(order_changes(order.pk, order.created_at, order.rollup_status, -1))
+
+
+def rebuild_rollups(date_from=None, date_to=None):
+	"""
+	Пересчитывает сводки за период (без границ - полностью) из заказов GROUP BY-запросами.
+	Тяжёлый проход по заказам периода - для первичного заполнения и восстановления
+	после изменений в обход save() (bulk_create, QuerySet.update). Возвращает число заказов
+	"""
+	orders = Order.objects.all()
+	rollup_dates = {}
+	if date_from:
+		orders = orders.filter(created_at__date__gte=date_from)
+		rollup_dates['date__gte'] = date_from
+	if date_to:
+		orders = orders.filter(created_at__date__lte=date_to)
+		rollup_dates['date__lte'] = date_to
+
+	items = OrderItem.objects.filter(order__in=orders).annotate(
+		day=TruncDate('order__created_at'), order_status=F('order__status'),
+	)
+	item_totals = {
+		'orders': Count('order_id', distinct=True),
+		'units': Sum('quantity'),
+		'revenue': Sum(F('price') * F('quantity')),
+	}
+	# Дневные итоги - от заказов: заказ без позиций тоже учитывается (как в sync_order)
+	order_totals = {
+		'orders': Count('pk', distinct=True),
+		'units': Coalesce(Sum('items__quantity'), 0),
+		'revenue': Coalesce(Sum(F('items__price') * F('items__quantity')), Decimal(0), output_field=DecimalField()),
+	}
+	groups = (
+		(DailySales, orders.values(day=TruncDate('created_at'), order_status=F('status')).annotate(**order_totals), ()),
+		(
+			DailyCategorySales, items.values('day', 'order_status', 'product__category_id').annotate(**item_totals),
+			(('category_id', 'product__category_id'),),
+		),
+		(DailyProductSales, items.values('day', 'order_status', 'product_id').annotate(**item_totals), (('product_id', 'product_id'),)),
+	)
+	with transaction.atomic():
+		for model, rows, dimensions in groups:
+			model.objects.filter(**rollup_dates).delete()
+			rows = (
+				model(
+					date=row['day'], status=row['order_status'], orders=row['orders'],
+					units=row['units'], revenue=row['revenue'],
+					**{field: row[source] for field, source in dimensions},
+				)
+				for row in rows.order_by().iterator(chunk_size=REBUILD_BATCH_SIZE)
+			)
+			while batch := list(islice(rows, REBUILD_BATCH_SIZE)):
+				model.objects.bulk_create(batch)
+		return orders.update(rollup_status=F('status'))
+
+
+def sales_report(date_from, date_to, statuses=REPORT_STATUSES, group_by=None, interval='day', ids=None, limit=None):
+	"""
+	Продажи за период из сводок. group_by - None, 'category' или 'product'
+	(ids ограничивает категории/товары), interval - 'day', 'month' или 'total'.
+	Возвращает (строки, итоги) с total_orders, total_units и total_revenue;
+	строки упорядочены по периоду и убыванию выручки
+	"""
+	model = {None: DailySales, 'category': DailyCategorySales, 'product': DailyProductSales}[group_by]
+	rows = model.objects.filter(date__range=(date_from, date_to), status__in=statuses)
+	if ids:
+		rows = rows.filter(**{f'{group_by}_id__in': ids})
+	# Имена агрегатов не должны совпадать с полями модели
+	aggregates = {'total_orders': Sum('orders'), 'total_units': Sum('units'), 'total_revenue': Sum('revenue')}
+	totals = rows.aggregate(**aggregates)
+
+	columns, ordering = [], ['-total_revenue']
+	if interval != 'total':
+		rows = rows.annotate(period=F('date') if interval == 'day' else TruncMonth('date'))
+		columns.append('period')
+		ordering.insert(0, 'period')
+	if group_by:
+		columns.append(f'{group_by}_id')
+		ordering.append(f'{group_by}_id')
+	rows = list(rows.values(*columns).annotate(**aggregates).order_by(*ordering)[:limit])
+
+	if group_by:
+		# Названия отдельным запросом: история продаж хранится и для удалённых категорий и товаров
+		related = Category if group_by == 'category' else Product
+		names = dict(related.objects.filter(pk__in={row[f'{group_by}_id'] for row in rows}).values_list('pk', 'name'))
+		for row in rows:
+			row[group_by] = row.pop(f'{group_by}_id')
+			row['name'] = names.get(row[group_by])
+	return rows, {name: value or 0 for name, value in totals.items()}
@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import pre_migrate
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import signals, tasks  # noqa: F401
+        pre_migrate.connect(self.create_search_extensions, sender=self)
+
+    @staticmethod
+    def create_search_extensions(using, **kwargs):
+        # Расширения PostgreSQL не создаются миграциями из makemigrations
+        if connections[using].vendor == 'postgresql':
+            from .search import create_trigram_extension
+            create_trigram_extension(using)
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.urls import path, include
+
+from .async_views import AsyncCategoryView, AsyncProductView
+
+# URLconf для GET/HEAD-запросов под ASGI (см. api.middleware.AsyncCatalogRoutingMiddleware):
+# read-only endpoints каталога обслуживаются асинхронно, остальное - как обычно
+urlpatterns = [
+	path('api/categories/', AsyncCategoryView.as_view('list')),
+	path('api/categories/<int:pk>/', AsyncCategoryView.as_view('retrieve')),
+	path('api/products/', AsyncProductView.as_view('list')),
+	path('api/products/featured/', AsyncProductView.as_view('featured')),
+	path('api/products/<int:pk>/', AsyncProductView.as_view('retrieve')),
+	path('api/products/<int:pk>/reviews/', AsyncProductView.as_view('reviews')),
+	path('', include(settings.ROOT_URLCONF)),
+]
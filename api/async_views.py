@@ -0,0 +1,170 @@
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Page
+from django.http import Http404, HttpResponseBase
+from django.utils.cache import get_conditional_response
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import Review
+from .projections import Projection
+from .serializers import ReviewSerializer
+from .views import CategoryViewSet, ProductViewSet
+
+
+class AsyncCatalogView:
+	"""
+	Асинхронная версия read-only endpoints каталога поверх существующих ViewSet'ов.
+
+	Подготовка запроса (аутентификация, согласование формата, кэш, построение
+	queryset фильтрами DRF) выполняется одним вызовом в потоке - там нет тяжёлых
+	запросов. Сами выборки (COUNT, строки, валидаторы ETag) идут через async ORM,
+	строки сериализуются через Projection, поэтому JSON совпадает с синхронным путём.
+	Форматы кроме JSON и keyset-пагинация обслуживаются синхронным ViewSet'ом
+	"""
+	viewset_class = None
+	actions = ()
+	cached_actions = ('list', 'retrieve', 'featured')
+
+	@classmethod
+	def as_view(cls, action):
+		assert action in cls.actions, f'{cls.__name__} does not support {action!r}'
+
+		async def view(request, *args, **kwargs):
+			return await cls().dispatch(request, action, **kwargs)
+
+		view.csrf_exempt = True
+		view.cls = cls
+		return view
+
+	@property
+	def basename(self):
+		# Так же, как DefaultRouter: ключи кэша совпадают с синхронным путём
+		return self.viewset_class.queryset.model._meta.object_name.lower()
+
+	async def dispatch(self, request, action, **kwargs):
+		view = self.viewset_class(
+			action_map={'get': action, 'head': action},
+			basename=self.basename, detail=action != 'list',
+		)
+		view.args, view.kwargs = (), kwargs
+		view.headers = view.default_response_headers
+		view.request = view.initialize_request(request, **kwargs)
+
+		try:
+			prepared = await sync_to_async(self.prepare)(view, action)
+			if prepared is None:
+				return await sync_to_async(self.sync_view(action))(request, **kwargs)
+			if isinstance(prepared, HttpResponseBase):
+				response = prepared
+			else:
+				response = await getattr(self, action)(view, prepared)
+				if action in self.cached_actions:
+					await sync_to_async(view.store_cached_response)(view.cache_key, response)
+		except Exception as exc:
+			response = view.handle_exception(exc)
+
+		response = view.finalize_response(view.request, response)
+		return response.render() if hasattr(response, 'render') else response
+
+	def sync_view(self, action):
+		return self.viewset_class.as_view({'get': action}, basename=self.basename, detail=action != 'list')
+
+	def prepare(self, view, action):
+		"""
+		Синхронная часть запроса. Возвращает queryset для async-выборки,
+		готовый ответ (из кэша) или None, если запрос нужно отдать синхронному ViewSet
+		"""
+		view.initial(view.request)
+		if not isinstance(view.request.accepted_renderer, JSONRenderer):
+			return None
+		wants_keyset = getattr(view.paginator, 'wants_keyset', None)
+		if wants_keyset is not None and wants_keyset(view.request):
+			return None
+
+		if action in self.cached_actions:
+			view.cache_key, cached = view.lookup_cached_response(view.request)
+			if cached is not None:
+				return cached
+
+		if action == 'featured':
+			return view.get_featured_queryset()
+		queryset = view.filter_queryset(view.get_queryset())
+		if action in ('retrieve', 'reviews'):
+			try:
+				queryset = queryset.filter(pk=view.kwargs['pk'])
+			except (TypeError, ValueError, ValidationError):
+				raise Http404(self.not_found_message(queryset))
+		return queryset
+
+	@staticmethod
+	def not_found_message(queryset):
+		return f'No {queryset.model._meta.object_name} matches the given query.'
+
+	async def get_validated(self, view, queryset):
+		"""ETag/Last-Modified через async aggregate; возвращает (304 или None, валидаторы)"""
+		values = await queryset.order_by().aaggregate(**view.get_validator_aggregates())
+		etag, last_modified = view.build_validators(view.request, values)
+		return get_conditional_response(view.request, etag=etag, last_modified=last_modified), (etag, last_modified)
+
+	async def paginate(self, view, queryset, projection):
+		"""Асинхронный аналог PageNumberPagination.paginate_queryset + get_paginated_response"""
+		paginator = view.paginator
+		context = view.get_serializer_context()
+		page_size = paginator.get_page_size(view.request) if paginator is not None else None
+		rows_queryset = queryset.values(*projection.lookups)
+		if not page_size:
+			return Response(projection.serialize([row async for row in rows_queryset], context))
+
+		django_paginator = paginator.django_paginator_class(rows_queryset, page_size)
+		django_paginator.__dict__['count'] = await queryset.acount()
+		page_number = paginator.get_page_number(view.request, django_paginator)
+		try:
+			number = django_paginator.validate_number(page_number)
+		except InvalidPage as exc:
+			raise NotFound(paginator.invalid_page_message.format(page_number=page_number, message=str(exc)))
+		bottom = (number - 1) * page_size
+		rows = [row async for row in rows_queryset[bottom:bottom + page_size]]
+
+		paginator.request, paginator.keyset = view.request, None
+		paginator.page = Page(rows, number, django_paginator)
+		return paginator.get_paginated_response(projection.serialize(rows, context))
+
+	async def list(self, view, queryset):
+		not_modified, validators = await self.get_validated(view, queryset)
+		if not_modified is not None:
+			return view.set_validator_headers(not_modified, *validators)
+		response = await self.paginate(view, queryset, view.projection)
+		return view.set_validator_headers(response, *validators)
+
+	async def retrieve(self, view, queryset):
+		not_modified, validators = await self.get_validated(view, queryset)
+		if not_modified is not None:
+			return view.set_validator_headers(not_modified, *validators)
+		row = await queryset.values(*view.projection.lookups).afirst()
+		if row is None:
+			raise Http404(self.not_found_message(queryset))
+		response = Response(view.projection.serialize([row], view.get_serializer_context())[0])
+		return view.set_validator_headers(response, *validators)
+
+
+class AsyncCategoryView(AsyncCatalogView):
+	viewset_class = CategoryViewSet
+	actions = ('list', 'retrieve')
+
+
+class AsyncProductView(AsyncCatalogView):
+	viewset_class = ProductViewSet
+	actions = ('list', 'retrieve', 'featured', 'reviews')
+	review_projection = Projection(ReviewSerializer)
+
+	async def featured(self, view, queryset):
+		rows = [row async for row in queryset.values(*view.projection.lookups)]
+		return Response(view.projection.serialize(rows, view.get_serializer_context()))
+
+	async def reviews(self, view, queryset):
+		if not await queryset.aexists():
+			raise Http404(self.not_found_message(queryset))
+		reviews = Review.objects.filter(product_id=view.kwargs['pk']).select_related('user')
+		return await self.paginate(view, reviews, self.review_projection)
@@ -0,0 +1,121 @@
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+# Поля пользователя, которые кладутся в токен и доступны без обращения к БД
+USER_CLAIMS = ('username', 'is_active')
+# Поля пользователя в кэше аутентификации
+CACHED_USER_FIELDS = (
+	'id', 'username', 'email', 'first_name', 'last_name', 'is_staff', 'is_superuser', 'is_active', 'date_joined',
+)
+
+
+def user_cache_key(user_id):
+	return f'auth:user:{user_id}'
+
+
+def get_cached_user(user_id):
+	"""
+	Пользователь из кэша (на AUTH_USER_CACHE_TIMEOUT секунд) или из БД. В кэше только
+	CACHED_USER_FIELDS - хэш пароля туда не попадает: остальные поля отложены
+	(загружаются из БД при обращении), save() записывает только загруженные поля
+	"""
+	User = get_user_model()
+	key = user_cache_key(user_id)
+	values = cache.get(key)
+	if values is None:
+		values = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values(*CACHED_USER_FIELDS).first()
+		if values is None:
+			raise AuthenticationFailed(_('User not found'), code='user_not_found')
+		cache.set(key, values, settings.AUTH_USER_CACHE_TIMEOUT)
+	# from_db ждёт значения в порядке полей модели
+	field_names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+	return User.from_db(User.objects.db, field_names, [values[name] for name in field_names])
+
+
+def invalidate_cached_user(user_id):
+	cache.delete(user_cache_key(user_id))
+
+
+class ClaimsUser(SimpleLazyObject):
+	"""
+	request.user по подписанным claims токена: id, username и is_active
+	доступны сразу, остальные поля (email, is_staff, ...) и сам экземпляр User
+	загружаются при первом обращении через get_cached_user
+	"""
+	is_authenticated = True
+	is_anonymous = False
+
+	def __init__(self, user_id, **claims):
+		super().__init__(partial(get_cached_user, user_id))
+		# Мимо LazyObject.__setattr__, который загрузил бы пользователя
+		self.__dict__.update(id=user_id, pk=user_id, **claims)
+
+	def __setattr__(self, name, value):
+		# После изменения поля (например, в профиле) значение из токена устарело
+		self.__dict__.pop(name, None)
+		super().__setattr__(name, value)
+
+	def __bool__(self):
+		# IsAuthenticated проверяет bool(request.user) - без загрузки
+		return True
+
+	def get_username(self):
+		return self.username
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+	"""Добавляет в токены USER_CLAIMS (access-токен копирует их из refresh)"""
+
+	@classmethod
+	def get_token(cls, user):
+		token = super().get_token(user)
+		for claim in USER_CLAIMS:
+			token[claim] = getattr(user, claim)
+		return token
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+	"""
+	USER_CLAIMS нового access-токена читаются из БД, а не копируются из refresh-токена:
+	переименованный пользователь получает новое имя, деактивированный - отказ
+	"""
+
+	def validate(self, attrs):
+		refresh = self.token_class(attrs['refresh'])
+		user = get_user_model().objects.filter(
+			**{api_settings.USER_ID_FIELD: refresh.payload.get(api_settings.USER_ID_CLAIM)}
+		).first()
+		if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+			raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+		for claim in USER_CLAIMS:
+			refresh[claim] = getattr(user, claim)
+		return super().validate({**attrs, 'refresh': str(refresh)})
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+	"""
+	JWT-аутентификация без запроса к БД: пользователь строится из claims
+	токена. Токены без USER_CLAIMS (выданные раньше) проверяются как обычно
+	"""
+
+	def get_user(self, validated_token):
+		try:
+			# simplejwt хранит id строкой, приводим к типу поля (для сравнений user_id == pk)
+			user_id = get_user_model()._meta.get_field(api_settings.USER_ID_FIELD).to_python(
+				validated_token[api_settings.USER_ID_CLAIM]
+			)
+			claims = {claim: validated_token[claim] for claim in USER_CLAIMS}
+		except KeyError:
+			return super().get_user(validated_token)
+		if not claims['is_active']:
+			raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+		return ClaimsUser(user_id, **claims)
@@ -0,0 +1,85 @@
+"""
+Пакетные GET-запросы (/api/batch/): несколько endpoints API за один HTTP-запрос.
+
+Подзапросы выполняются теми же view в текущем процессе, без повторной
+аутентификации: пользователь пакета передаётся view напрямую. Ответы view
+не рендерятся по отдельности - их данные попадают в общий JSON пакета.
+Одинаковые подзапросы выполняются один раз, ответы каталога берутся из общего кэша
+"""
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.http import Http404, HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework import status
+
+from .replicas import read_routing
+
+# Заголовки ответа подзапроса, которые передаются клиенту
+BATCH_RESPONSE_HEADERS = ('ETag', 'Last-Modified')
+
+
+class BatchSubRequest(HttpRequest):
+	"""GET-запрос к path от имени пользователя пакетного запроса parent"""
+
+	def __init__(self, parent, path, query):
+		super().__init__()
+		self.method = 'GET'
+		self.path = self.path_info = path
+		self.META = {
+			name: value for name, value in parent.META.items()
+			if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE')
+		}
+		self.META.update(REQUEST_METHOD='GET', PATH_INFO=path, QUERY_STRING=query, HTTP_ACCEPT='application/json')
+		self.GET = QueryDict(query)
+		self.COOKIES = parent.COOKIES
+		self._scheme = parent.scheme
+		if parent.user.is_authenticated:
+			# DRF использует готового пользователя вместо классов аутентификации.
+			# Анонимный подзапрос проходит обычную аутентификацию: 401 с WWW-Authenticate
+			self._force_auth_user = parent.user
+			self._force_auth_token = parent.auth
+
+	def _get_scheme(self):
+		return self._scheme
+
+
+def run_subrequest(request, path, query):
+	"""{'status', 'headers', 'body'} ответа view на GET path?query"""
+	try:
+		match = resolve(path)
+	except Resolver404:
+		return {'status': status.HTTP_404_NOT_FOUND, 'headers': {}, 'body': {'detail': 'Not found.'}}
+	if match.url_name == 'batch':
+		return {'status': status.HTTP_400_BAD_REQUEST, 'headers': {}, 'body': {'detail': 'Nested batches are not allowed.'}}
+
+	sub_request = BatchSubRequest(request, path, query)
+	sub_request.resolver_match = match
+	try:
+		if settings.DATABASE_REPLICAS:
+			with read_routing(sub_request):
+				response = match.func(sub_request, *match.args, **match.kwargs)
+		else:
+			response = match.func(sub_request, *match.args, **match.kwargs)
+	except Http404:
+		return {'status': status.HTTP_404_NOT_FOUND, 'headers': {}, 'body': {'detail': 'Not found.'}}
+
+	if response.streaming:
+		return {
+			'status': status.HTTP_400_BAD_REQUEST, 'headers': {},
+			'body': {'detail': 'Streaming endpoints are not supported in batches.'},
+		}
+	headers = {name: response[name] for name in BATCH_RESPONSE_HEADERS if response.has_header(name)}
+	# Ответ DRF - данные до рендеринга, остальные - тело как текст
+	body = response.data if hasattr(response, 'data') else response.content.decode() or None
+	return {'status': response.status_code, 'headers': headers, 'body': body}
+
+
+def run_batch(request, paths):
+	"""Ответы на пути paths (путь с параметрами) в том же порядке; повторы выполняются один раз"""
+	results = {}
+	for path in paths:
+		if path not in results:
+			url = urlsplit(path)
+			results[path] = run_subrequest(request, url.path, url.query)
+	return [results[path] for path in paths]
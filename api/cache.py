@@ -0,0 +1,147 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+from .replicas import primary_reads
+
+# Ключ с текущей версией каталога. Версия входит в ключи всех закэшированных
+# ответов, поэтому после её увеличения старые записи просто перестают читаться
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_HITS_KEY = 'catalog:stats:hits'
+CATALOG_MISSES_KEY = 'catalog:stats:misses'
+# Время последнего изменения каталога (для чтения с реплик)
+CATALOG_CHANGED_KEY = 'catalog:changed_at'
+
+
+def _incr(key):
+	"""Атомарный инкремент счётчика в кэше с созданием ключа при отсутствии"""
+	try:
+		return cache.incr(key)
+	except ValueError:
+		if cache.add(key, 1, timeout=None):
+			return 1
+		return cache.incr(key)
+
+
+def get_version(key):
+	"""Текущая версия данных под ключом key (каталога, поискового индекса)"""
+	version = cache.get(key)
+	if version is None:
+		# Начальная версия от времени: после очистки кэша она не совпадёт с
+		# версиями, под которыми процессы уже держат свои данные в памяти
+		initial = int(time.time() * 1000)
+		cache.add(key, initial, timeout=None)
+		version = cache.get(key, initial)
+	return version
+
+
+def bump_version(key):
+	"""Увеличивает версию под ключом key после фиксации текущей транзакции"""
+	def bump():
+		get_version(key)  # Гарантирует, что ключ версии существует
+		_incr(key)
+	transaction.on_commit(bump)
+
+
+def get_catalog_version():
+	"""Текущая версия каталога"""
+	return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+	"""Увеличивает версию каталога после фиксации текущей транзакции"""
+	bump_version(CATALOG_VERSION_KEY)
+	if settings.DATABASE_REPLICAS:
+		transaction.on_commit(
+			lambda: cache.set(CATALOG_CHANGED_KEY, time.time(), settings.READ_YOUR_WRITES_SECONDS)
+		)
+
+
+def catalog_changed_recently():
+	"""Каталог менялся последние READ_YOUR_WRITES_SECONDS: реплики могли ещё не получить изменение"""
+	return cache.get(CATALOG_CHANGED_KEY) is not None
+
+
+def catalog_cache_key(request, view_name, action):
+	"""Ключ ответа: версия каталога + view + action + путь с отсортированными параметрами"""
+	query = sorted(request.query_params.lists())
+	# Формат ответа входит в ключ: у JSON и HTML разные ETag
+	raw = f'{request.path}?{query}|{getattr(request, "accepted_media_type", "")}'.encode()
+	digest = hashlib.md5(raw).hexdigest()
+	return f'catalog:{get_catalog_version()}:{view_name}:{action}:{digest}'
+
+
+def catalog_cache_stats():
+	"""Счётчики попаданий и промахов кэша каталога"""
+	return {
+		'version': get_catalog_version(),
+		'hits': cache.get(CATALOG_HITS_KEY, 0),
+		'misses': cache.get(CATALOG_MISSES_KEY, 0),
+	}
+
+
+class CatalogCacheMixin:
+	"""
+	Mixin для ViewSet'ов публичного каталога: кэширует сериализованные ответы
+	list/retrieve под ключом, содержащим версию каталога.
+	Вместе с данными сохраняются ETag и Last-Modified (см. api/conditional.py),
+	поэтому условный GET по закэшированному ответу не обращается к БД
+	"""
+	# Ответы каталога одинаковы для всех пользователей
+	etag_per_user = False
+
+	def list(self, request, *args, **kwargs):
+		return self.get_cached_response(request, super().list, *args, **kwargs)
+
+	def retrieve(self, request, *args, **kwargs):
+		return self.get_cached_response(request, super().retrieve, *args, **kwargs)
+
+	def get_cached_response(self, request, handler, *args, **kwargs):
+		"""Возвращает ответ из кэша или вызывает handler и сохраняет его данные"""
+		key, response = self.lookup_cached_response(request)
+		if response is not None:
+			return response
+		if settings.DATABASE_REPLICAS and catalog_changed_recently():
+			# Иначе данные с отстающей реплики попали бы в кэш под новой версией каталога
+			with primary_reads():
+				response = handler(request, *args, **kwargs)
+		else:
+			response = handler(request, *args, **kwargs)
+		self.store_cached_response(key, response)
+		return response
+
+	def lookup_cached_response(self, request):
+		"""Возвращает (ключ, ответ из кэша или None); учитывает условный GET"""
+		key = catalog_cache_key(request, self.basename, self.action)
+		cached = cache.get(key)
+		if cached is None:
+			_incr(CATALOG_MISSES_KEY)
+			return key, None
+
+		_incr(CATALOG_HITS_KEY)
+		headers = {name: value for name, value in cached['headers'].items() if value}
+		response = get_conditional_response(
+			request, etag=headers.get('ETag'),
+			last_modified=parse_http_date_safe(headers.get('Last-Modified', '')),
+		)
+		if response is None:
+			response = Response(cached['data'])
+		for name, value in headers.items():
+			response[name] = value
+		response['X-Cache'] = 'HIT'
+		return key, response
+
+	def store_cached_response(self, key, response):
+		"""Сохраняет данные и валидаторы успешного ответа"""
+		if response.status_code == 200:
+			cache.set(key, {
+				'data': response.data,
+				'headers': {name: response.get(name) for name in ('ETag', 'Last-Modified')},
+			}, settings.CATALOG_CACHE_TIMEOUT)
+		response['X-Cache'] = 'MISS'
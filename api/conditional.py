@@ -0,0 +1,88 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+	"""
+	Mixin для ViewSet: ETag для list и retrieve, Last-Modified - только для retrieve.
+
+	Валидаторы считаются одним агрегирующим запросом (MAX по полям
+	last_modified_fields, COUNT и сумма id) по тому же отфильтрованному queryset, что
+	и ответ, без сериализации. При совпадении If-None-Match / If-Modified-Since
+	возвращается 304 и сериализаторы не вызываются. У списка Last-Modified нет:
+	удаление строки или её выход из фильтра не сдвигает MAX(updated_at),
+	такие изменения видны только в ETag по числу и id строк
+	"""
+	# Поля, изменение которых меняет представление объекта (можно через связи)
+	last_modified_fields = ('updated_at',)
+	# Дополнительные агрегаты для ETag: связанные строки без updated_at
+	etag_aggregates = {}
+	# Зависит ли представление от пользователя (например, заказы - только свои)
+	etag_per_user = True
+
+	def list(self, request, *args, **kwargs):
+		queryset = self.filter_queryset(self.get_queryset())
+		return self.get_conditional_response(request, queryset, super().list, *args, **kwargs)
+
+	def retrieve(self, request, *args, **kwargs):
+		lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+		try:
+			queryset = self.filter_queryset(self.get_queryset()).filter(
+				**{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+			)
+		except (TypeError, ValueError, ValidationError):
+			# Некорректный идентификатор - пусть обычный retrieve ответит 404
+			return super().retrieve(request, *args, **kwargs)
+		return self.get_conditional_response(request, queryset, super().retrieve, *args, **kwargs)
+
+	def get_validator_aggregates(self):
+		"""Агрегаты для aggregate(): COUNT и MAX по каждому полю last_modified_fields"""
+		aggregates = {
+			f'last_modified_{index}': Max(field)
+			for index, field in enumerate(self.last_modified_fields)
+		}
+		return {'count': Count('pk'), 'ids': Sum('pk'), **self.etag_aggregates, **aggregates}
+
+	def get_validators(self, request, queryset):
+		"""Возвращает (ETag, Last-Modified как timestamp) для queryset"""
+		values = queryset.order_by().aggregate(**self.get_validator_aggregates())
+		return self.build_validators(request, values)
+
+	def build_validators(self, request, values):
+		"""Строит ETag и Last-Modified из результата get_validator_aggregates()"""
+		values = dict(values)
+		checksum = [str(values.pop(name)) for name in ('count', 'ids', *self.etag_aggregates)]
+		last_modified = max((value for value in values.values() if value is not None), default=None)
+
+		# Представление зависит от пути с параметрами, формата ответа и пользователя
+		parts = [
+			request.get_full_path(),
+			request.accepted_media_type,
+			str(request.user.pk) if self.etag_per_user and request.user.is_authenticated else '',
+			*checksum,
+			last_modified.isoformat() if last_modified else '',
+		]
+		etag = quote_etag(hashlib.md5('|'.join(parts).encode()).hexdigest())
+		if not self.detail or last_modified is None:
+			return etag, None
+		return etag, int(last_modified.timestamp())
+
+	def get_conditional_response(self, request, queryset, handler, *args, **kwargs):
+		etag, last_modified = self.get_validators(request, queryset)
+		response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+		if response is None:
+			response = handler(request, *args, **kwargs)
+			if response.status_code != 200:
+				return response
+		return self.set_validator_headers(response, etag, last_modified)
+
+	@staticmethod
+	def set_validator_headers(response, etag, last_modified):
+		response['ETag'] = etag
+		if last_modified is not None:
+			response['Last-Modified'] = http_date(last_modified)
+		return response
@@ -0,0 +1,150 @@
+"""
+Потоковая выгрузка заказов в CSV и NDJSON. Заказы читаются порциями через
+QuerySet.iterator(chunk_size) (на PostgreSQL - серверный курсор, а при
+DISABLE_SERVER_SIDE_CURSORS - запросами по ключу), позиции
+подгружаются одним запросом на порцию, ответ отдаётся кусками по EXPORT_BUFFER_SIZE:
+память процесса не зависит от числа выгружаемых заказов. Под ASGI куски отдаёт
+асинхронный итератор (async_chunks)
+"""
+import csv
+import io
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+from .models import Order, OrderItem
+
+EXPORT_BUFFER_SIZE = 64 * 1024  # Символов в одном куске ответа
+CSV_COLUMNS = (
+	'order_id', 'created_at', 'status', 'user', 'shipping_address', 'total_amount',
+	'product_id', 'product_name', 'quantity', 'price',
+)
+# Начало ячейки, которое табличные редакторы считают формулой
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# Даты в том же формате, что и в ответах API
+_datetime = serializers.DateTimeField()
+
+
+def export_queryset():
+	"""Заказы с пользователем и позициями - только поля, которые попадают в выгрузку"""
+	items = OrderItem.objects.select_related('product').only(
+		'order', 'product', 'quantity', 'price', 'product__name',
+	).order_by('id')
+	return Order.objects.select_related('user').only(
+		'status', 'total_amount', 'shipping_address', 'created_at', 'updated_at', 'user', 'user__username',
+	).prefetch_related(Prefetch('items', queryset=items)).order_by('id')
+
+
+def iterate(orders):
+	"""Заказы порциями по ORDER_EXPORT_CHUNK_SIZE, позиции - одним запросом на порцию"""
+	chunk_size = settings.ORDER_EXPORT_CHUNK_SIZE
+	if connections[orders.db].settings_dict.get('DISABLE_SERVER_SIDE_CURSORS'):
+		# Без серверного курсора драйвер получил бы весь результат запроса сразу
+		return keyset_chunks(orders, chunk_size)
+	return orders.iterator(chunk_size=chunk_size)
+
+
+def keyset_chunks(orders, chunk_size):
+	"""Порции отдельными запросами WHERE id > последний id (orders упорядочены по id)"""
+	last_id = 0
+	while chunk := list(orders.filter(pk__gt=last_id)[:chunk_size]):
+		yield from chunk
+		last_id = chunk[-1].pk
+
+
+def buffered(lines):
+	"""Склеивает строки в куски около EXPORT_BUFFER_SIZE: меньше накладных расходов на кусок ответа"""
+	buffer, size = [], 0
+	for line in lines:
+		buffer.append(line)
+		size += len(line)
+		if size >= EXPORT_BUFFER_SIZE:
+			yield ''.join(buffer)
+			buffer, size = [], 0
+	if buffer:
+		yield ''.join(buffer)
+
+
+async def async_chunks(chunks):
+	"""
+	Асинхронный итератор поверх синхронного: синхронный итератор Django под ASGI
+	целиком собирает в список. Куски читаются по одному в потоке запроса
+	(thread_sensitive) - в том же, где открыт курсор БД
+	"""
+	chunks = iter(chunks)
+	next_chunk = sync_to_async(next, thread_sensitive=True)
+	# StopIteration нельзя передать через Future - конец потока обозначает None
+	while (chunk := await next_chunk(chunks, None)) is not None:
+		yield chunk
+
+
+def safe_text(value):
+	"""Текст от пользователей не должен исполняться как формула при открытии CSV"""
+	return f"'{value}" if value.startswith(FORMULA_PREFIXES) else value
+
+
+def csv_lines(orders):
+	"""Строка на позицию заказа; заказ без позиций - одна строка с пустыми полями позиции"""
+	output = io.StringIO()
+	writer = csv.writer(output)
+
+	def line(row):
+		writer.writerow(row)
+		value = output.getvalue()
+		output.seek(0)
+		output.truncate()
+		return value
+
+	yield line(CSV_COLUMNS)
+	for order in iterate(orders):
+		head = (
+			order.pk, _datetime.to_representation(order.created_at), order.status,
+			safe_text(order.user.username), safe_text(order.shipping_address), f'{order.total_amount:f}',
+		)
+		items = order.items.all()
+		if not items:
+			yield line((*head, '', '', '', ''))
+		for item in items:
+			yield line((*head, item.product_id, safe_text(item.product.name), item.quantity, f'{item.price:f}'))
+
+
+def ndjson_lines(orders):
+	"""Объект на заказ с вложенными позициями"""
+	for order in iterate(orders):
+		yield json.dumps({
+			'id': order.pk,
+			'user': order.user.username,
+			'status': order.status,
+			'total_amount': f'{order.total_amount:f}',
+			'shipping_address': order.shipping_address,
+			'created_at': _datetime.to_representation(order.created_at),
+			'updated_at': _datetime.to_representation(order.updated_at),
+			'items': [
+				{
+					'product': item.product_id,
+					'product_name': item.product.name,
+					'quantity': item.quantity,
+					'price': f'{item.price:f}',
+				}
+				for item in order.items.all()
+			],
+		}, ensure_ascii=False) + '\n'
+
+
+# Формат выгрузки -> (content type, расширение файла, генератор строк)
+EXPORT_FORMATS = {
+	'csv': ('text/csv; charset=utf-8', 'csv', csv_lines),
+	'ndjson': ('application/x-ndjson; charset=utf-8', 'ndjson', ndjson_lines),
+}
+
+
+def stream_orders(orders, export_format, asynchronous=False):
+	"""(content type, расширение, итератор кусков ответа) для выгрузки заказов"""
+	content_type, extension, lines = EXPORT_FORMATS[export_format]
+	chunks = buffered(lines(orders))
+	return content_type, extension, async_chunks(chunks) if asynchronous else chunks
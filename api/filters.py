@@ -0,0 +1,39 @@
+from django import forms
+from django.conf import settings
+from django.db.models import Case, IntegerField, When
+from django_filters import rest_framework as filters
+from rest_framework.exceptions import ValidationError
+
+from .models import Product
+
+
+class IdInFilter(filters.BaseInFilter, filters.NumberFilter):
+	"""Список целых id через запятую: ?ids=1,2,3"""
+	field_class = forms.IntegerField
+
+
+class ProductFilter(filters.FilterSet):
+	"""
+	Фильтры товаров. ids - несколько товаров одним запросом (корзина, избранное):
+	товары отдаются в порядке ids, без пагинации (см. ProductViewSet.paginator)
+	"""
+	ids = IdInFilter(method='filter_ids')
+
+	class Meta:
+		model = Product
+		fields = ['category', 'roast_level', 'is_available']
+
+	def is_valid(self):
+		# Пустой ids= не фильтрует, а пагинация с ним отключена - весь каталог одним ответом
+		valid = super().is_valid()
+		if valid and 'ids' in self.data and not any(pk is not None for pk in self.form.cleaned_data.get('ids') or ()):
+			self.form.add_error('ids', 'Enter at least one id.')
+			return False
+		return valid
+
+	def filter_ids(self, queryset, name, value):
+		ids = list(dict.fromkeys(pk for pk in value if pk is not None))
+		if len(ids) > settings.PRODUCT_MULTI_GET_MAX_IDS:
+			raise ValidationError({name: [f'Ensure this value has at most {settings.PRODUCT_MULTI_GET_MAX_IDS} ids.']})
+		position = Case(*[When(pk=pk, then=index) for index, pk in enumerate(ids)], output_field=IntegerField())
+		return queryset.filter(pk__in=ids).order_by(position)
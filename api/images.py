@@ -0,0 +1,106 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection
+from django.db.models.functions import Now
+
+from .cache import bump_catalog_version
+from .imaging import render_variants, variant_path
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+
+class ImageVariantPipeline:
+	"""
+	Генерация уменьшенных копий Product.image вне потока запроса.
+
+	Задания выполняются в пуле из PRODUCT_IMAGE_WORKERS потоков: поток читает
+	исходный файл из хранилища, отдаёт декодирование и масштабирование в пул
+	процессов того же размера (Pillow держит GIL), сохраняет результаты
+	и записывает карту вариантов в товар. Одновременно обрабатывается не больше
+	PRODUCT_IMAGE_WORKERS изображений
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._threads = None
+		self._processes = None
+
+	@property
+	def storage(self):
+		return Product._meta.get_field('image').storage
+
+	def _executors(self):
+		with self._lock:
+			if self._threads is None:
+				workers = settings.PRODUCT_IMAGE_WORKERS
+				self._threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-variants')
+				# spawn: fork процесса с потоками (gunicorn, uvicorn) небезопасен
+				self._processes = ProcessPoolExecutor(
+					max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+				)
+			return self._threads, self._processes
+
+	def submit(self, product_id, stale_variants=None):
+		"""Ставит товар в очередь, возвращает Future с картой вариантов"""
+		threads, _ = self._executors()
+		return threads.submit(self._run, product_id, stale_variants)
+
+	def _run(self, product_id, stale_variants):
+		close_old_connections()
+		try:
+			return self.process(product_id, stale_variants)
+		except Exception:
+			logger.exception('Cannot build image variants for product #%s', product_id)
+			raise
+		finally:
+			# У потока пула своё соединение с БД
+			connection.close()
+
+	def process(self, product_id, stale_variants=None):
+		"""Строит варианты изображения товара и сохраняет их карту; возвращает карту"""
+		source = Product.objects.filter(pk=product_id).values_list('image', flat=True).first() or ''
+		variants = self.render(product_id, source) if source else {}
+
+		# Изображение могли заменить, пока строились варианты: тогда результат не нужен
+		updated = Product.objects.filter(pk=product_id, image=source).update(
+			image_variants=variants, updated_at=Now(),
+		)
+		if updated:
+			bump_catalog_version()  # update() не вызывает сигналы
+		else:
+			self.delete_files(variants)
+			variants = {}
+		self.delete_files(stale_variants or {}, keep=variants)
+		return variants
+
+	def render(self, product_id, source):
+		_, processes = self._executors()
+		with self.storage.open(source, 'rb') as file:
+			data = file.read()
+		rendered = processes.submit(
+			render_variants, data, settings.PRODUCT_IMAGE_VARIANTS,
+			settings.PRODUCT_IMAGE_FORMATS, settings.PRODUCT_IMAGE_QUALITY,
+		).result()
+
+		variants = {}
+		for (variant, image_format), content in rendered.items():
+			name = variant_path(product_id, source, variant, image_format)
+			self.storage.delete(name)  # Повторная генерация перезаписывает файл
+			variants.setdefault(variant, {})[image_format] = self.storage.save(name, ContentFile(content))
+		return variants
+
+	def delete_files(self, variants, keep=None):
+		keep = {name for formats in (keep or {}).values() for name in formats.values()}
+		for formats in variants.values():
+			for name in formats.values():
+				if name not in keep:
+					self.storage.delete(name)
+
+
+image_pipeline = ImageVariantPipeline()
@@ -0,0 +1,49 @@
+"""
+Построение уменьшенных копий изображений. Модуль не импортирует Django:
+render_variants выполняется в отдельных процессах (см. api.images)
+"""
+import posixpath
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# Расширения файлов и параметры сохранения для форматов Pillow
+FORMATS = {
+	'webp': ('webp', {'method': 4}),
+	'jpeg': ('jpg', {'optimize': True, 'progressive': True}),
+}
+
+
+def variant_path(product_id, source_name, variant, image_format):
+	"""
+	products/beans.jpg товара 7 -> products/variants/7/beans.jpg/thumb.webp.
+	Каталог - по товару и полному имени файла: beans.jpg и beans.png, как и один
+	файл у двух товаров, не перезаписывают и не удаляют варианты друг друга
+	"""
+	directory, filename = posixpath.split(source_name)
+	return posixpath.join(directory, 'variants', str(product_id), filename, f'{variant}.{FORMATS[image_format][0]}')
+
+
+def render_variants(data, sizes, formats, quality):
+	"""
+	Декодирует изображение из байтов и возвращает {(вариант, формат): байты}.
+	sizes - {вариант: максимальная сторона}; изображение не увеличивается.
+	Варианты строятся от большего к меньшему, каждый - из предыдущего
+	"""
+	with Image.open(BytesIO(data)) as image:
+		# JPEG декодируется сразу в уменьшенном масштабе, если это возможно
+		image.draft('RGB', (max(sizes.values()),) * 2)
+		current = ImageOps.exif_transpose(image)
+		if current.mode not in ('RGB', 'RGBA'):
+			current = current.convert('RGBA' if 'A' in current.getbands() or 'transparency' in current.info else 'RGB')
+
+		results = {}
+		for variant, size in sorted(sizes.items(), key=lambda item: -item[1]):
+			current = current.copy()
+			current.thumbnail((size, size), Image.Resampling.LANCZOS)
+			for image_format in formats:
+				frame = current.convert('RGB') if image_format == 'jpeg' else current
+				output = BytesIO()
+				frame.save(output, format=image_format.upper(), quality=quality, **FORMATS[image_format][1])
+				results[variant, image_format] = output.getvalue()
+		return results
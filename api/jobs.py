@@ -0,0 +1,234 @@
+import logging
+import os
+import random
+import secrets
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Реестр задач: имя -> Task. Заполняется декоратором task при импорте api.tasks
+tasks = {}
+
+
+class Task:
+	"""Функция, которую можно выполнить в фоне: task.enqueue(**payload)"""
+
+	def __init__(self, func, name, queue, max_attempts):
+		self.func = func
+		self.name = name
+		self.queue = queue
+		self.max_attempts = max_attempts
+
+	def __call__(self, *args, **kwargs):
+		return self.func(*args, **kwargs)
+
+	def __repr__(self):
+		return f'<Task {self.name} ({self.queue})>'
+
+	def enqueue(self, *, key=None, delay=None, **payload):
+		return enqueue(self.name, payload, key=key, delay=delay)
+
+
+def task(name, *, queue='default', max_attempts=None):
+	"""
+	Регистрирует функцию как фоновую задачу. Имя хранится в заданиях,
+	поэтому задаётся явно и не зависит от расположения функции в коде
+	"""
+	def decorator(func):
+		registered = Task(func, name, queue, max_attempts or settings.JOB_MAX_ATTEMPTS)
+		tasks[name] = registered
+		return registered
+	return decorator
+
+
+def enqueue(name, payload=None, *, key=None, delay=None):
+	"""
+	Ставит задачу в очередь одним INSERT в текущей транзакции: задание появится
+	только вместе с данными, ради которых создано. payload - аргументы функции
+	(JSON). С key повторная постановка возвращает уже существующее задание
+	"""
+	registered = tasks[name]
+	fields = {
+		'queue': registered.queue,
+		'name': name,
+		'payload': payload or {},
+		'max_attempts': registered.max_attempts,
+		'run_at': timezone.now() + (delay or timedelta()),
+	}
+	if key is None:
+		return Job.objects.create(**fields)
+	# Сначала INSERT: обычно ключ новый, и лишний SELECT не нужен
+	try:
+		with transaction.atomic():
+			return Job.objects.create(idempotency_key=key, **fields)
+	except IntegrityError:
+		return Job.objects.get(idempotency_key=key)
+
+
+def retry_delay(attempt):
+	"""Экспоненциальная задержка перед повтором со случайным разбросом, чтобы повторы не шли пачкой"""
+	delay = min(settings.JOB_RETRY_BASE_DELAY * 2 ** (attempt - 1), settings.JOB_RETRY_MAX_DELAY)
+	return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def claim_jobs(queue, limit, worker_id):
+	"""
+	Забирает до limit готовых заданий очереди и помечает их выполняемыми.
+	На PostgreSQL строки блокируются через SELECT ... FOR UPDATE SKIP LOCKED:
+	параллельные worker'ы не ждут друг друга и не получают одно задание дважды
+	"""
+	now = timezone.now()
+	with transaction.atomic(using=Job.objects.db):
+		ready = Job.objects.filter(queue=queue, status=Job.PENDING, run_at__lte=now).order_by('run_at', 'id')
+		if connections[Job.objects.db].features.has_select_for_update_skip_locked:
+			ready = ready.select_for_update(skip_locked=True)
+		ids = list(ready.values_list('pk', flat=True)[:limit])
+		if not ids:
+			return []
+		# Без SKIP LOCKED (SQLite) задание достаётся тому, чей UPDATE прошёл первым
+		Job.objects.filter(pk__in=ids, status=Job.PENDING).update(
+			status=Job.RUNNING, locked_at=now, locked_by=worker_id, attempts=F('attempts') + 1,
+		)
+		return list(Job.objects.filter(pk__in=ids, status=Job.RUNNING, locked_by=worker_id, locked_at=now))
+
+
+def run_job(job):
+	"""Выполняет взятое задание и сохраняет результат; возвращает итоговый статус"""
+	registered = tasks.get(job.name)
+	changes = {'locked_at': None, 'locked_by': '', 'last_error': ''}
+	try:
+		if registered is None:
+			raise LookupError(f'Unknown task {job.name!r}')
+		registered.func(**job.payload)
+	except Exception:
+		changes['last_error'] = traceback.format_exc()
+		if registered is None or job.attempts >= job.max_attempts:
+			changes.update(status=Job.FAILED, finished_at=timezone.now())
+			logger.error('Job #%s %s failed after %s attempts', job.pk, job.name, job.attempts, exc_info=True)
+		else:
+			changes.update(status=Job.PENDING, run_at=timezone.now() + retry_delay(job.attempts))
+			logger.warning('Job #%s %s failed, retry at %s', job.pk, job.name, changes['run_at'], exc_info=True)
+	else:
+		changes.update(status=Job.SUCCEEDED, finished_at=timezone.now())
+	# Задание, которое сочли зависшим и отдали другому worker'у, не перезаписываем
+	Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by).update(**changes)
+	return changes['status']
+
+
+def requeue_stale_jobs():
+	"""
+	Задания, которые дольше JOB_LOCK_TIMEOUT числятся выполняемыми без отметки
+	worker'а (процесс упал), возвращаются в очередь или, без оставшихся попыток, проваливаются
+	"""
+	now = timezone.now()
+	stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT))
+	changes = {'locked_at': None, 'locked_by': '', 'last_error': 'Worker lost'}
+	failed = stale.filter(attempts__gte=F('max_attempts')).update(status=Job.FAILED, finished_at=now, **changes)
+	return failed + stale.update(status=Job.PENDING, run_at=now, **changes)
+
+
+def purge_finished_jobs():
+	"""Удаляет выполненные задания старше JOB_RETENTION_DAYS; до этого их idempotency_key занят"""
+	cutoff = timezone.now() - timedelta(days=settings.JOB_RETENTION_DAYS)
+	deleted, _ = Job.objects.filter(status=Job.SUCCEEDED, finished_at__lt=cutoff).delete()
+	return deleted
+
+
+class Worker:
+	"""
+	Процесс выполнения заданий. queues - {очередь: сколько заданий этой очереди
+	выполняется одновременно}; задания выполняются в общем пуле потоков.
+	Ограничение действует на процесс: при N worker'ах очередь обрабатывают N * limit потоков
+	"""
+
+	def __init__(self, queues, poll_interval=None):
+		self.queues = dict(queues)
+		self.poll_interval = settings.JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+		self.id = f'{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}'[-100:]
+		self.processed = 0
+		self._running = {queue: set() for queue in self.queues}  # id выполняемых заданий по очередям
+		self._lock = threading.Lock()
+		self._wakeup = threading.Event()  # Освободился поток или пришла остановка
+		self._stopping = False
+
+	def stop(self):
+		"""Новые задания не берутся, выполняемые завершаются"""
+		self._stopping = True
+		self._wakeup.set()
+
+	def running(self):
+		with self._lock:
+			return [job_id for ids in self._running.values() for job_id in ids]
+
+	def run(self, burst=False):
+		"""Цикл выборки заданий; burst - выйти, когда очереди опустеют"""
+		maintenance_interval = settings.JOB_LOCK_TIMEOUT / 3
+		next_maintenance = 0
+		with ThreadPoolExecutor(max_workers=sum(self.queues.values()), thread_name_prefix='jobs') as executor:
+			while not self._stopping:
+				self._wakeup.clear()
+				try:
+					if time.monotonic() >= next_maintenance:
+						self.maintenance()
+						next_maintenance = time.monotonic() + maintenance_interval
+					claimed = self.dispatch(executor)
+				except DatabaseError:
+					logger.exception('Job worker %s cannot reach the database', self.id)
+					connections[Job.objects.db].close()
+					claimed = 0
+				if burst and not claimed and not self.running():
+					break
+				if not claimed:
+					self._wakeup.wait(self.poll_interval)
+		return self.processed
+
+	def dispatch(self, executor):
+		"""Забирает задания в свободные слоты очередей; возвращает их число"""
+		claimed = 0
+		for queue, limit in self.queues.items():
+			with self._lock:
+				free = limit - len(self._running[queue])
+			if free <= 0:
+				continue
+			for job in claim_jobs(queue, free, self.id):
+				with self._lock:
+					self._running[queue].add(job.pk)
+				executor.submit(self.execute, job)
+				claimed += 1
+		return claimed
+
+	def execute(self, job):
+		# Соединение потока живёт по тем же правилам CONN_MAX_AGE, что и в запросах
+		close_old_connections()
+		try:
+			run_job(job)
+		except Exception:
+			logger.exception('Cannot save result of job #%s', job.pk)
+		finally:
+			close_old_connections()
+			with self._lock:
+				self._running[job.queue].discard(job.pk)
+				self.processed += 1
+			self._wakeup.set()
+
+	def maintenance(self):
+		"""Отметка выполняемых заданий (чтобы их не сочли зависшими), возврат зависших, очистка"""
+		running = self.running()
+		if running:
+			Job.objects.filter(pk__in=running, status=Job.RUNNING, locked_by=self.id).update(locked_at=timezone.now())
+		requeued = requeue_stale_jobs()
+		if requeued:
+			logger.warning('Requeued %s stale jobs', requeued)
+		purge_finished_jobs()
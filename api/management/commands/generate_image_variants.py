@@ -0,0 +1,53 @@
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.images import image_pipeline
+from api.models import Product
+
+
+class Command(BaseCommand):
+	"""
+	Строит уменьшенные копии изображений уже существующих товаров.
+	Задания идут через тот же пул, что и при сохранении товара; в очереди
+	держится не больше нескольких заданий на поток, поэтому память ограничена
+	"""
+	help = 'Generate resized WebP/JPEG variants for existing product images'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--force', action='store_true', help='Rebuild variants that already exist')
+		parser.add_argument('--batch-size', type=int, default=500, help='Products read per query')
+
+	def handle(self, *args, **options):
+		products = Product.objects.exclude(image='').exclude(image__isnull=True)
+		if not options['force']:
+			products = products.filter(image_variants={})
+		product_ids = products.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=options['batch_size'])
+
+		window = settings.PRODUCT_IMAGE_WORKERS * 4
+		pending = deque()
+		done = failed = 0
+		started = time.perf_counter()
+		for product_id in product_ids:
+			# При --force старые файлы совпадают по именам с новыми и перезаписываются
+			pending.append((product_id, image_pipeline.submit(product_id)))
+			if len(pending) >= window:
+				done, failed = self.wait(pending.popleft(), done, failed)
+		while pending:
+			done, failed = self.wait(pending.popleft(), done, failed)
+
+		elapsed = time.perf_counter() - started
+		self.stdout.write(self.style.SUCCESS(
+			f'Processed {done} images in {elapsed:.1f}s ({done / (elapsed or 1e-9):.1f} images/s), {failed} failed'
+		))
+
+	def wait(self, item, done, failed):
+		product_id, future = item
+		try:
+			future.result()
+		except Exception as exc:
+			self.stderr.write(f'Product #{product_id}: {exc}')
+			return done, failed + 1
+		return done + 1, failed
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.openapi import code_version, generate_schema, read_schema, write_schema
+
+
+class Command(BaseCommand):
+	"""
+	Строит схему OpenAPI в OPENAPI_SCHEMA_FILE. Запускается при сборке образа
+	или деплое; если файл уже построен для текущей версии кода, ничего не делает
+	"""
+	help = 'Generate the OpenAPI schema file served by /swagger/?format=openapi'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--force', action='store_true', help='Rebuild even if the file matches the code version')
+		parser.add_argument('--output', help=f'Schema file (default: {settings.OPENAPI_SCHEMA_FILE})')
+
+	def handle(self, *args, **options):
+		path = options['output'] or settings.OPENAPI_SCHEMA_FILE
+		version = code_version()
+		stored = read_schema(path)
+		if not options['force'] and stored is not None and stored[1] == version:
+			self.stdout.write(f'Schema {path} is up to date (code version {version})')
+			return
+
+		started = time.perf_counter()
+		content = generate_schema()
+		write_schema(content, path)
+		self.stdout.write(self.style.SUCCESS(
+			f'Generated {path} ({len(content) / 1024:.0f} KB, code version {version}) '
+			f'in {time.perf_counter() - started:.2f}s'
+		))
@@ -0,0 +1,275 @@
+import itertools
+import math
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.cache import bump_catalog_version
+from api.models import Category, Order, OrderItem, Product, Review
+
+ORIGINS = (
+	'Brazil', 'Colombia', 'Ethiopia', 'Kenya', 'Guatemala', 'Costa Rica', 'Honduras',
+	'Peru', 'Vietnam', 'Indonesia', 'India', 'Rwanda', 'Panama', 'Yemen', 'Blend',
+)
+ADJECTIVES = ('Bright', 'Bold', 'Smooth', 'Dark', 'Velvet', 'Classic', 'Morning', 'Wild', 'Single', 'Reserve')
+NOUNS = ('Espresso', 'Roast', 'Blend', 'Harvest', 'Estate', 'Lot', 'Capsules', 'Drip', 'Cold Brew', 'Mocha')
+NOTES = (
+	'chocolate', 'caramel', 'citrus', 'berry', 'jasmine', 'nutty', 'honey', 'spice',
+	'stone fruit', 'toffee', 'bergamot', 'cocoa', 'floral', 'molasses',
+)
+ROAST_WEIGHTS = {'light': 2, 'medium': 5, 'dark': 3}
+WEIGHT_GRAMS = (100, 200, 250, 250, 250, 500, 500, 1000)
+STATUS_WEIGHTS = {'delivered': 70, 'shipped': 8, 'processing': 5, 'pending': 7, 'cancelled': 10}
+ITEMS_PER_ORDER_WEIGHTS = (45, 25, 15, 8, 4, 2, 1)  # 1..7 позиций
+RATING_SPREAD = 1.1
+
+
+def zipf_cum_weights(count, exponent):
+	"""Накопленные веса распределения Ципфа для рангов 1..count"""
+	return list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+def chunked(iterable, size):
+	iterator = iter(iterable)
+	while chunk := list(itertools.islice(iterator, size)):
+		yield chunk
+
+
+@contextmanager
+def explicit_timestamps(*models):
+	"""Отключает auto_now/auto_now_add, чтобы bulk_create сохранил заданные даты"""
+	fields = [
+		field for model in models for field in model._meta.concrete_fields
+		if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+	]
+	saved = [(field.auto_now, field.auto_now_add) for field in fields]
+	for field in fields:
+		field.auto_now = field.auto_now_add = False
+	try:
+		yield
+	finally:
+		for field, (auto_now, auto_now_add) in zip(fields, saved):
+			field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+	"""
+	Генерирует синтетические данные в объёмах, близких к боевым: пользователей,
+	категории, товары, заказы с позициями и отзывы. Популярность товаров и
+	активность покупателей распределены по Ципфу, даты - по последним --days дням.
+	Всё пишется через bulk_create пачками по --batch-size, в памяти держатся
+	только идентификаторы и цены товаров
+	"""
+	help = 'Generate production-scale synthetic users, catalog, orders and reviews'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--users', type=int, default=1000)
+		parser.add_argument('--categories', type=int, default=20)
+		parser.add_argument('--products', type=int, default=10000)
+		parser.add_argument('--orders', type=int, default=50000)
+		parser.add_argument('--reviews', type=int, default=100000)
+		parser.add_argument('--days', type=int, default=365, help='Spread creation dates over this many days')
+		parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent for product and user popularity')
+		parser.add_argument('--batch-size', type=int, default=5000)
+		parser.add_argument('--seed', type=int, default=42)
+		parser.add_argument('--prefix', default='synthetic', help='Prefix for generated usernames and category names')
+		parser.add_argument(
+			'--password', default='synthetic-password',
+			help='Password of every generated user (hashed once)',
+		)
+
+	def handle(self, *args, **options):
+		self.random = random.Random(options['seed'])
+		self.batch_size = options['batch_size']
+		self.skew = options['skew']
+		self.now = timezone.now()
+		self.days = options['days']
+
+		with explicit_timestamps(User, Category, Product, Order, Review):
+			user_ids = self.create_users(options['users'], options['prefix'], options['password'])
+			category_ids = self.create_categories(options['categories'], options['prefix'])
+			products = self.create_products(options['products'], category_ids)
+			self.create_orders(options['orders'], user_ids, products)
+			self.create_reviews(options['reviews'], user_ids, [pk for pk, _ in products])
+
+		if connection.vendor == 'postgresql':
+			# Статистика планировщика ещё описывает пустые таблицы: с ней пересчёт сводок
+			# ниже может выбрать вложенный цикл по всем позициям заказов
+			tables = (User, Category, Product, Order, OrderItem, Review)
+			with connection.cursor() as cursor:
+				cursor.execute('ANALYZE ' + ', '.join(connection.ops.quote_name(model._meta.db_table) for model in tables))
+
+		# bulk_create не вызывает сигналы: поисковые документы, сводки продаж,
+		# индекс совместных покупок и версия каталога - вручную
+		call_command('rebuild_search_index', stdout=self.stdout)
+		call_command('rebuild_sales_rollups', stdout=self.stdout)
+		call_command('rebuild_co_purchase_index', stdout=self.stdout)
+		bump_catalog_version()
+		self.stdout.write(self.style.SUCCESS('Synthetic data generated'))
+
+	def random_date(self):
+		"""Дата за последние days дней; нагрузка растёт ближе к текущему моменту"""
+		age = self.days * (1 - math.sqrt(self.random.random()))
+		return self.now - timedelta(days=age)
+
+	def bulk_create(self, model, objects, key=None):
+		"""
+		Пишет объекты пачками. Возвращает key(obj) созданных объектов
+		или только их число, если key не задан (объекты не накапливаются)
+		"""
+		keys, created = [], 0
+		for chunk in chunked(objects, self.batch_size):
+			with transaction.atomic():
+				model.objects.bulk_create(chunk, batch_size=self.batch_size)
+			created += len(chunk)
+			if key is not None:
+				keys.extend(key(obj) for obj in chunk)
+		self.stdout.write(f'{model.__name__}: {created} created')
+		return keys if key is not None else created
+
+	def create_users(self, count, prefix, password):
+		start = User.objects.filter(username__startswith=f'{prefix}_user_').count()
+		password_hash = make_password(password)
+		users = (
+			User(
+				username=f'{prefix}_user_{start + i}', email=f'{prefix}_user_{start + i}@example.com',
+				password=password_hash, date_joined=self.random_date(),
+			)
+			for i in range(count)
+		)
+		return self.bulk_create(User, users, key=lambda user: user.pk)
+
+	def create_categories(self, count, prefix):
+		start = Category.objects.filter(name__startswith=f'{prefix} category ').count()
+		categories = []
+		for i in range(count):
+			created = self.random_date()
+			categories.append(Category(
+				name=f'{prefix} category {start + i}', description=f'Synthetic category #{start + i}',
+				created_at=created, updated_at=created,
+			))
+		return self.bulk_create(Category, categories, key=lambda category: category.pk)
+
+	def create_products(self, count, category_ids):
+		"""Возвращает [(pk, price)]; размер категорий тоже неравномерный"""
+		category_weights = zipf_cum_weights(len(category_ids), 0.8)
+		roast_levels, roast_weights = zip(*ROAST_WEIGHTS.items())
+
+		def products():
+			for i in range(count):
+				created = self.random_date()
+				notes = self.random.sample(NOTES, 2)
+				yield Product(
+					name=f'{self.random.choice(ADJECTIVES)} {self.random.choice(NOUNS)} {i}',
+					description=f'{self.random.choice(ORIGINS)} coffee with {notes[0]} and {notes[1]} notes',
+					# Логнормальная цена: большинство товаров 10-30, редкие дорогие
+					price=Decimal(str(round(min(self.random.lognormvariate(3, 0.45), 9999), 2))),
+					category_id=self.random.choices(category_ids, cum_weights=category_weights)[0],
+					roast_level=self.random.choices(roast_levels, roast_weights)[0],
+					origin=self.random.choice(ORIGINS),
+					weight_grams=self.random.choice(WEIGHT_GRAMS),
+					is_available=self.random.random() > 0.05,
+					created_at=created, updated_at=created,
+				)
+
+		return self.bulk_create(Product, products(), key=lambda product: (product.pk, product.price))
+
+	def popularity(self, ids):
+		"""Случайный порядок популярности: (ids, накопленные веса Ципфа)"""
+		ids = list(ids)
+		self.random.shuffle(ids)
+		return ids, zipf_cum_weights(len(ids), self.skew)
+
+	def create_orders(self, count, user_ids, products):
+		if not count or not user_ids or not products:
+			return
+		buyers, buyer_weights = self.popularity(user_ids)
+		products, product_weights = self.popularity(products)
+		statuses, status_weights = zip(*STATUS_WEIGHTS.items())
+		sizes = range(1, len(ITEMS_PER_ORDER_WEIGHTS) + 1)
+		orders_created = items_created = 0
+
+		for chunk_start in range(0, count, self.batch_size):
+			orders, order_items = [], []
+			for _ in range(min(self.batch_size, count - chunk_start)):
+				size = self.random.choices(sizes, ITEMS_PER_ORDER_WEIGHTS)[0]
+				lines = {
+					pk: price
+					for pk, price in self.random.choices(products, cum_weights=product_weights, k=size)
+				}
+				items = [
+					OrderItem(product_id=pk, price=price, quantity=self.random.choices((1, 2, 3), (80, 15, 5))[0])
+					for pk, price in lines.items()
+				]
+				created = self.random_date()
+				orders.append(Order(
+					user_id=self.random.choices(buyers, cum_weights=buyer_weights)[0],
+					status=self.random.choices(statuses, status_weights)[0],
+					total_amount=sum(item.price * item.quantity for item in items),
+					shipping_address=f'{self.random.randint(1, 200)} Synthetic street',
+					created_at=created, updated_at=created,
+				))
+				order_items.append(items)
+
+			with transaction.atomic():
+				Order.objects.bulk_create(orders)
+				for order, items in zip(orders, order_items):
+					for item in items:
+						item.order_id = order.pk
+				flat_items = [item for items in order_items for item in items]
+				OrderItem.objects.bulk_create(flat_items, batch_size=self.batch_size)
+			orders_created += len(orders)
+			items_created += len(flat_items)
+		self.stdout.write(f'Order: {orders_created} created, OrderItem: {items_created} created')
+
+	def create_reviews(self, count, user_ids, product_ids):
+		"""
+		Число отзывов на товар - по Ципфу (не больше числа пользователей),
+		авторы товара выбираются без повторов, поэтому unique_together соблюдается.
+		bulk_create обходит Review.save(), поэтому агрегаты рейтинга копятся здесь
+		и записываются в товары после вставки
+		"""
+		if not count or not user_ids or not product_ids:
+			return
+		product_ids, weights = self.popularity(product_ids)
+		total_weight = weights[-1]
+		aggregates = {}
+
+		def reviews():
+			previous = 0.0
+			for product_id, cumulative in zip(product_ids, weights):
+				expected, previous = count * (cumulative - previous) / total_weight, cumulative
+				# Вероятностное округление: в сумме получается около count отзывов
+				reviewers = min(int(expected) + (self.random.random() < expected % 1), len(user_ids))
+				if not reviewers:
+					continue
+				# У каждого товара своё «качество», оценки скошены к 4-5
+				quality = self.random.uniform(2.5, 5)
+				rating_sum = 0
+				for user_id in self.random.sample(user_ids, reviewers):
+					created = self.random_date()
+					rating = min(5, max(1, round(self.random.gauss(quality, RATING_SPREAD))))
+					rating_sum += rating
+					yield Review(
+						product_id=product_id, user_id=user_id, rating=rating,
+						comment=f'{self.random.choice(ADJECTIVES)} cup, {self.random.choice(NOTES)} notes',
+						created_at=created, updated_at=created,
+					)
+				aggregates[product_id] = (rating_sum, reviewers)
+
+		self.bulk_create(Review, reviews())
+		products = (
+			Product(pk=pk, rating_sum=rating_sum, review_count=reviewers, avg_rating=rating_sum / reviewers)
+			for pk, (rating_sum, reviewers) in aggregates.items()
+		)
+		for chunk in chunked(products, self.batch_size):
+			with transaction.atomic():
+				Product.objects.bulk_update(chunk, Product.RATING_FIELDS)
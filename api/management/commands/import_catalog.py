@@ -0,0 +1,203 @@
+import csv
+import hashlib
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from api.cache import bump_catalog_version
+from api.models import Category, Product
+from api.search import bump_search_version, rebuild_search_documents
+
+# Поля строки импорта; category - название категории
+IMPORT_FIELDS = (
+	'sku', 'name', 'description', 'price', 'category', 'roast_level',
+	'origin', 'weight_grams', 'is_available',
+)
+# Поля товара, которые перезаписываются при повторном импорте
+UPDATE_FIELDS = (
+	'name', 'description', 'price', 'category', 'roast_level', 'origin',
+	'weight_grams', 'is_available', 'import_hash', 'updated_at',
+)
+ROAST_LEVELS = {value for value, _ in Product.ROAST_LEVEL_CHOICES}
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f'}
+PROGRESS_INTERVAL = 5  # Секунды между строками прогресса
+
+
+def read_csv(stream):
+	yield from csv.DictReader(stream)
+
+
+def read_ndjson(stream):
+	for line in stream:
+		if line.strip():
+			yield json.loads(line)
+
+
+def parse_bool(value):
+	if isinstance(value, bool):
+		return value
+	value = str(value).strip().lower()
+	if value in TRUE_VALUES:
+		return True
+	if value in FALSE_VALUES:
+		return False
+	raise ValueError(f'invalid boolean {value!r}')
+
+
+def clean_row(row):
+	"""Проверяет и нормализует строку импорта, ValueError - строка пропускается"""
+	sku = str(row.get('sku') or '').strip()
+	name = str(row.get('name') or '').strip()
+	category = str(row.get('category') or '').strip()
+	if not sku or not name or not category:
+		raise ValueError('sku, name and category are required')
+	try:
+		price = Decimal(str(row.get('price'))).quantize(Decimal('0.01'))
+	except (InvalidOperation, ValueError):
+		raise ValueError(f'invalid price {row.get("price")!r}')
+	if price < 0:
+		raise ValueError('price must not be negative')
+	roast_level = str(row.get('roast_level') or 'medium').strip().lower()
+	if roast_level not in ROAST_LEVELS:
+		raise ValueError(f'invalid roast_level {roast_level!r}')
+	weight = int(row['weight_grams']) if row.get('weight_grams') not in (None, '') else 250
+	if weight < 0:
+		raise ValueError('weight_grams must not be negative')
+	values = {
+		'sku': sku,
+		'name': name,
+		'description': str(row.get('description') or ''),
+		'price': price,
+		'category': category,
+		'roast_level': roast_level,
+		'origin': str(row.get('origin') or '').strip(),
+		'weight_grams': weight,
+		'is_available': parse_bool(row['is_available']) if row.get('is_available') not in (None, '') else True,
+	}
+	for field in ('sku', 'name', 'origin'):
+		if len(values[field]) > Product._meta.get_field(field).max_length:
+			raise ValueError(f'{field} is too long')
+	return values
+
+
+def row_hash(values):
+	"""Хэш нормализованной строки: совпадает - товар не изменился"""
+	canonical = json.dumps([str(values[field]) for field in IMPORT_FIELDS], ensure_ascii=False)
+	return hashlib.md5(canonical.encode()).hexdigest()
+
+
+class Command(BaseCommand):
+	"""
+	Потоковый импорт каталога из CSV или NDJSON (файл любого размера или stdin).
+
+	Строки читаются по одной и собираются в пачки по --batch-size. Для пачки
+	одним запросом читаются сохранённые хэши строк: неизменённые товары
+	пропускаются, остальные записываются одним bulk_create(update_conflicts=True)
+	по уникальному sku. Категории берутся из словаря в памяти, недостающие
+	создаются один раз. В памяти - только текущая пачка и словарь категорий
+	"""
+	help = 'Stream a CSV/NDJSON catalog file and upsert products by sku in batches'
+
+	def add_arguments(self, parser):
+		parser.add_argument('path', help='CSV or NDJSON file, "-" for stdin')
+		parser.add_argument('--format', choices=('csv', 'ndjson'), help='Default: by file extension')
+		parser.add_argument('--batch-size', type=int, default=1000)
+		parser.add_argument('--no-create-categories', action='store_true', help='Skip rows with unknown categories')
+		parser.add_argument('--dry-run', action='store_true', help='Validate and count changes without writing')
+
+	def handle(self, *args, **options):
+		path = options['path']
+		data_format = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+		reader = read_ndjson if data_format == 'ndjson' else read_csv
+		self.batch_size = options['batch_size']
+		self.create_categories = not options['no_create_categories']
+		self.dry_run = options['dry_run']
+		self.categories = dict(Category.objects.values_list('name', 'id'))
+		self.stats = dict.fromkeys(('read', 'created', 'updated', 'unchanged', 'errors'), 0)
+		self.started = self.reported = time.perf_counter()
+
+		stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+		try:
+			batch = {}
+			for line_number, row in enumerate(reader(stream), start=1):
+				self.stats['read'] += 1
+				try:
+					values = clean_row(row)
+				except (ValueError, TypeError, KeyError, AttributeError) as exc:
+					self.error(line_number, exc)
+					continue
+				batch[values['sku']] = values  # Повтор sku в пачке - побеждает последняя строка
+				if len(batch) >= self.batch_size:
+					self.flush(batch)
+					batch = {}
+			if batch:
+				self.flush(batch)
+		except (csv.Error, json.JSONDecodeError, UnicodeDecodeError) as exc:
+			raise CommandError(f'Cannot parse {path} after {self.stats["read"]} rows: {exc}')
+		finally:
+			if stream is not sys.stdin:
+				stream.close()
+
+		if not self.dry_run and (self.stats['created'] or self.stats['updated']):
+			bump_catalog_version()  # bulk_create не вызывает сигналы
+		self.stdout.write(self.style.SUCCESS(self.progress('Imported')))
+
+	def error(self, line_number, exc):
+		self.stats['errors'] += 1
+		self.stderr.write(f'Row {line_number}: {exc}')
+
+	def progress(self, prefix):
+		elapsed = time.perf_counter() - self.started
+		stats = self.stats
+		return (
+			f'{prefix} {stats["read"]} rows in {elapsed:.1f}s ({stats["read"] / (elapsed or 1e-9):.0f} rows/s): '
+			f'{stats["created"]} created, {stats["updated"]} updated, '
+			f'{stats["unchanged"]} unchanged, {stats["errors"]} errors'
+		)
+
+	def category_id(self, name):
+		category_id = self.categories.get(name)
+		if category_id is None and self.create_categories and not self.dry_run:
+			category_id = Category.objects.get_or_create(name=name)[0].pk
+			self.categories[name] = category_id
+		return category_id
+
+	def flush(self, batch):
+		"""Записывает пачку: один SELECT хэшей и один upsert изменённых строк"""
+		hashes = {sku: row_hash(values) for sku, values in batch.items()}
+		stored = dict(Product.objects.filter(sku__in=list(batch)).values_list('sku', 'import_hash'))
+
+		products = []
+		for sku, values in batch.items():
+			if stored.get(sku) == hashes[sku]:
+				self.stats['unchanged'] += 1
+				continue
+			category_id = self.category_id(values['category'])
+			if category_id is None and not self.dry_run:
+				self.stats['errors'] += 1
+				self.stderr.write(f'SKU {sku}: unknown category {values["category"]!r}')
+				continue
+			self.stats['updated' if sku in stored else 'created'] += 1
+			products.append(Product(
+				**{field: values[field] for field in IMPORT_FIELDS if field != 'category'},
+				category_id=category_id, import_hash=hashes[sku],
+			))
+
+		if products and not self.dry_run:
+			using = Product.objects.db
+			with transaction.atomic(using=using):
+				Product.objects.bulk_create(
+					products, update_conflicts=True, unique_fields=['sku'], update_fields=UPDATE_FIELDS,
+				)
+				if connections[using].vendor == 'postgresql':
+					rebuild_search_documents(using=using, product_ids=[product.pk for product in products])
+				else:
+					bump_search_version()
+		if time.perf_counter() - self.reported >= PROGRESS_INTERVAL:
+			self.reported = time.perf_counter()
+			self.stdout.write(self.progress('...'))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.recommendations import REBUILD_BATCH_SIZE, rebuild_index
+
+
+class Command(BaseCommand):
+	"""
+	Пересчитывает индекс «С этим товаром покупают» из позиций заказов. Нужна после
+	первичного заполнения и массовых изменений заказов в обход save(), а также для
+	сброса неточных счётчиков; обычные заказы учитываются заданиями recommendations.sync_order
+	"""
+	help = 'Rebuild the frequently-bought-together index from order items'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE, help='Products per batch')
+
+	def handle(self, *args, **options):
+		started = time.perf_counter()
+		products, pairs = rebuild_index(options['batch_size'])
+		self.stdout.write(self.style.SUCCESS(
+			f'Rebuilt co-purchase index: {products} products, {pairs} pairs in {time.perf_counter() - started:.1f}s'
+		))
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from api.cache import bump_catalog_version
+from api.models import Product, Review
+
+
+class Command(BaseCommand):
+	"""
+	Пересчитывает агрегаты отзывов товаров (rating_sum, review_count, avg_rating)
+	по таблице Review и сообщает о расхождениях с сохранёнными значениями
+	"""
+	help = 'Rebuild stored product rating aggregates and report drift'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--dry-run', action='store_true', help='Only report drift, do not fix it')
+		parser.add_argument('--batch-size', type=int, default=1000, help='Products per batch')
+
+	def handle(self, *args, **options):
+		batch_size = options['batch_size']
+		checked = drifted = 0
+		last_pk = 0
+
+		while True:
+			products = list(
+				Product.objects.filter(pk__gt=last_pk).order_by('pk')
+				.only('pk', *Product.RATING_FIELDS)[:batch_size]
+			)
+			if not products:
+				break
+			last_pk = products[-1].pk
+
+			actual = {
+				row['product_id']: row
+				for row in Review.objects.filter(product_id__in=[p.pk for p in products])
+				.values('product_id').annotate(total=Sum('rating'), count=Count('id'))
+			}
+
+			stale = []
+			for product in products:
+				row = actual.get(product.pk, {'total': 0, 'count': 0})
+				avg = row['total'] / row['count'] if row['count'] else 0.0
+				if (product.rating_sum, product.review_count) != (row['total'], row['count']):
+					drifted += 1
+					self.stdout.write(
+						f"Product #{product.pk}: stored {product.rating_sum}/{product.review_count}, "
+						f"actual {row['total']}/{row['count']}"
+					)
+				elif abs(product.avg_rating - avg) < 1e-9:
+					continue
+				product.rating_sum, product.review_count, product.avg_rating = row['total'], row['count'], avg
+				stale.append(product)
+
+			checked += len(products)
+			if stale and not options['dry_run']:
+				with transaction.atomic():
+					Product.objects.bulk_update(stale, Product.RATING_FIELDS)
+					bump_catalog_version()
+
+		action = 'found' if options['dry_run'] else 'fixed'
+		self.stdout.write(self.style.SUCCESS(
+			f'Checked {checked} products, {action} drift in {drifted}'
+		))
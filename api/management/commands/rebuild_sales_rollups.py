@@ -0,0 +1,33 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+	"""
+	Пересчитывает дневные сводки продаж из заказов. Нужна после первичного
+	заполнения и массовых изменений заказов в обход save(); обычные изменения
+	учитываются заданиями analytics.sync_order
+	"""
+	help = 'Rebuild daily sales rollups from orders'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--from', dest='date_from', type=self.parse_date, help='First day (YYYY-MM-DD)')
+		parser.add_argument('--to', dest='date_to', type=self.parse_date, help='Last day (YYYY-MM-DD)')
+
+	@staticmethod
+	def parse_date(value):
+		try:
+			return date.fromisoformat(value)
+		except ValueError:
+			raise CommandError(f'Invalid date {value!r}')
+
+	def handle(self, *args, **options):
+		started = time.perf_counter()
+		orders = rebuild_rollups(options['date_from'], options['date_to'])
+		self.stdout.write(self.style.SUCCESS(
+			f'Rebuilt sales rollups from {orders} orders in {time.perf_counter() - started:.1f}s'
+		))
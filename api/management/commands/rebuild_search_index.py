@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.search import bump_search_version, rebuild_search_documents
+
+
+class Command(BaseCommand):
+	"""Пересчитывает поисковые документы всех товаров (PostgreSQL) или сбрасывает индекс в памяти"""
+	help = 'Rebuild stored full-text search documents for all products'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--database', default='default')
+
+	def handle(self, *args, **options):
+		using = options['database']
+		if connections[using].vendor != 'postgresql':
+			bump_search_version()
+			self.stdout.write('In-memory search index will be rebuilt on the next search')
+			return
+		count = rebuild_search_documents(using=using)
+		self.stdout.write(self.style.SUCCESS(f'Indexed {count} products'))
@@ -0,0 +1,48 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.jobs import Worker
+
+
+class Command(BaseCommand):
+	"""
+	Worker фоновых заданий. Несколько worker'ов (на одной или разных машинах)
+	работают с одной таблицей заданий параллельно. SIGTERM/SIGINT - остановка
+	после завершения выполняемых заданий
+	"""
+	help = 'Process background jobs from the database queue'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--queue', action='append', dest='queues', metavar='NAME[=CONCURRENCY]',
+			help='Queue to process, optionally with its concurrency (default: all JOB_QUEUES)',
+		)
+		parser.add_argument('--burst', action='store_true', help='Exit when the queues are empty')
+		parser.add_argument('--poll-interval', type=float, help='Seconds between polls of empty queues')
+
+	def handle(self, *args, **options):
+		worker = Worker(self.parse_queues(options['queues']), poll_interval=options['poll_interval'])
+		for signum in (signal.SIGTERM, signal.SIGINT):
+			signal.signal(signum, lambda *_: worker.stop())
+
+		queues = ', '.join(f'{queue}={limit}' for queue, limit in worker.queues.items())
+		self.stdout.write(f'Worker {worker.id} processing {queues}')
+		processed = worker.run(burst=options['burst'])
+		self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs'))
+
+	@staticmethod
+	def parse_queues(values):
+		if not values:
+			return settings.JOB_QUEUES
+		queues = {}
+		for value in values:
+			name, _, limit = value.partition('=')
+			try:
+				queues[name] = int(limit) if limit else settings.JOB_QUEUES.get(name, 1)
+			except ValueError:
+				raise CommandError(f'Invalid concurrency in {value!r}')
+			if queues[name] < 1:
+				raise CommandError(f'Concurrency of {name!r} must be positive')
+		return queues
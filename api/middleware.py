@@ -0,0 +1,158 @@
+import logging
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware
+from django.utils.deprecation import MiddlewareMixin
+
+from .performance import RequestMetrics, endpoint_name, registry
+from .replicas import read_routing
+
+logger = logging.getLogger('api.performance')
+
+
+class AsyncCatalogRoutingMiddleware(MiddlewareMixin):
+	"""
+	Под ASGI направляет безопасные запросы в ASYNC_CATALOG_URLCONF, где
+	endpoints каталога реализованы асинхронно. Под WSGI ничего не меняет
+	"""
+	def process_request(self, request):
+		if (
+			settings.ASYNC_CATALOG_URLCONF
+			and isinstance(request, ASGIRequest)
+			and request.method in ('GET', 'HEAD')
+		):
+			request.urlconf = settings.ASYNC_CATALOG_URLCONF
+
+
+class ReadReplicaMiddleware:
+	"""
+	Включает чтение каталога и отзывов с реплик (api.replicas) на время запроса.
+	Без DATABASE_REPLICAS ничего не делает
+	"""
+	sync_capable = async_capable = True
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		if iscoroutinefunction(get_response):
+			markcoroutinefunction(self)
+
+	def __call__(self, request):
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+		if not settings.DATABASE_REPLICAS:
+			return self.get_response(request)
+		with read_routing(request):
+			return self.get_response(request)
+
+	async def __acall__(self, request):
+		# ContextVar маршрутизации копируется в потоки sync_to_async вместе с контекстом
+		if not settings.DATABASE_REPLICAS:
+			return await self.get_response(request)
+		with read_routing(request):
+			return await self.get_response(request)
+
+
+class CompressionMiddleware(GZipMiddleware):
+	"""
+	gzip для ответов API, если клиент прислал Accept-Encoding: gzip. Ответы
+	меньше RESPONSE_COMPRESSION_MIN_BYTES и несжимаемые типы (картинки, архивы)
+	отдаются как есть: экономия байтов на них не окупает время сжатия
+	"""
+	compressible_types = ('text/', 'application/json', 'application/x-ndjson', 'application/openapi', 'application/yaml')
+
+	def process_response(self, request, response):
+		if not response.streaming and len(response.content) < settings.RESPONSE_COMPRESSION_MIN_BYTES:
+			return response
+		if not response.get('Content-Type', '').startswith(self.compressible_types):
+			return response
+		return super().process_response(request, response)
+
+
+class PerformanceMiddleware:
+	"""
+	Инструментирование запросов: число SQL-запросов и время БД (через
+	connection.execute_wrapper), время рендеринга ответа и остальное время view.
+	Результат отдаётся в заголовке Server-Timing, копится в гистограммах по
+	endpoint'ам (см. PerformanceStatsView), медленные запросы логируются вместе
+	с самыми долгими SQL. Стоимость - пара вызовов perf_counter на SQL-запрос
+	"""
+	sync_capable = async_capable = True
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		if iscoroutinefunction(get_response):
+			markcoroutinefunction(self)
+
+	def __call__(self, request):
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+		if not settings.PERFORMANCE_INSTRUMENTATION:
+			return self.get_response(request)
+
+		metrics = self.start(request)
+		with self.record_queries(metrics):
+			response = self.get_response(request)
+		return self.finish(request, response, metrics)
+
+	async def __acall__(self, request):
+		if not settings.PERFORMANCE_INSTRUMENTATION:
+			return await self.get_response(request)
+
+		metrics = self.start(request)
+		# Соединения с БД у каждого потока свои: обёртки ставятся на соединения потока,
+		# в котором ASGIHandler выполняет синхронный код запроса (thread_sensitive)
+		queries = await sync_to_async(self.record_queries)(metrics)
+		try:
+			response = await self.get_response(request)
+		finally:
+			await sync_to_async(queries.close)()
+		return self.finish(request, response, metrics)
+
+	@staticmethod
+	def start(request):
+		request.performance = metrics = RequestMetrics(
+			slow_queries_kept=settings.PERFORMANCE_SLOW_QUERIES_LOGGED if settings.PERFORMANCE_SLOW_REQUEST_MS else 0,
+		)
+		return metrics
+
+	@staticmethod
+	def record_queries(metrics):
+		stack = ExitStack()
+		for connection in connections.all():
+			stack.enter_context(connection.execute_wrapper(metrics.record_query))
+		return stack
+
+	def finish(self, request, response, metrics):
+		metrics.finish()
+		response['Server-Timing'] = metrics.server_timing()
+		registry.record(endpoint_name(request), metrics, response.status_code)
+		slow_ms = settings.PERFORMANCE_SLOW_REQUEST_MS
+		if slow_ms and metrics.total_time * 1000 >= slow_ms:
+			self.log_slow_request(request, response, metrics)
+		return response
+
+	def process_template_response(self, request, response):
+		# Вызывается непосредственно перед response.render(): отсюда до
+		# post-render callback - время рендерера (JSON, Browsable API)
+		metrics = getattr(request, 'performance', None)
+		if metrics is not None:
+			metrics.start_render()
+			response.add_post_render_callback(metrics.finish_render)
+		return response
+
+	@staticmethod
+	def log_slow_request(request, response, metrics):
+		match = getattr(request, 'resolver_match', None)
+		queries = ''.join(
+			f'\n  {duration * 1000:.1f} ms: {sql}' for duration, sql in metrics.worst_queries()
+		)
+		logger.warning(
+			'Slow request %s %s (%s) -> %s: %.1f ms total, %d queries, %.1f ms db, %.1f ms render%s',
+			request.method, request.get_full_path(), match.view_name if match else '-',
+			response.status_code, metrics.total_time * 1000, metrics.query_count,
+			metrics.db_time * 1000, metrics.render_time * 1000, queries,
+		)
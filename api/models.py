@@ -1,7 +1,15 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import F, FloatField, Q, Sum
+from django.db.models.functions import Cast, Coalesce, Now, NullIf
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from .cache import bump_catalog_version
+
 class Category(models.Model):
 	"""
 	Модель категорий товаров (например: Зерновой, Молотый, Капсулы)
@@ -10,6 +18,7 @@ class Category(models.Model):
 	name = models.CharField(max_length=100, unique=True)
 	description = models.TextField(blank=True)
 	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
 		verbose_name_plural = "Categories"  # Правильное отображение в админке
@@ -18,6 +27,8 @@ class Category(models.Model):
 	def __str__(self):
 		return self.name
 
+AVAILABLE = Q(is_available=True)
+
 class Product(models.Model):
 	"""
 	Основная модель товара - кофе
@@ -38,16 +49,182 @@ class Product(models.Model):
 	origin = models.CharField(max_length=100)  # Страна происхождения
 	weight_grams = models.PositiveIntegerField(default=250)  # Вес упаковки
 	is_available = models.BooleanField(default=True)  # Доступен для заказа
+	# Остаток на складе; NULL - остаток не учитывается. Списывается при заказе (reserve_stock)
+	stock = models.PositiveIntegerField(null=True, blank=True)
 	image = models.ImageField(upload_to='products/', null=True, blank=True)
+	# Артикул во внешней учётной системе - ключ для импорта каталога (import_catalog)
+	sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
+	import_hash = models.CharField(max_length=32, blank=True, editable=False)  # Хэш последней импортированной строки
+	# Уменьшенные копии image: {вариант: {формат: имя файла}}, заполняет api.images
+	image_variants = models.JSONField(default=dict, blank=True, editable=False)
+	# Агрегаты отзывов, поддерживаются инкрементально при изменении Review
+	rating_sum = models.PositiveIntegerField(default=0)  # Сумма оценок
+	review_count = models.PositiveIntegerField(default=0)  # Количество отзывов
+	avg_rating = models.FloatField(default=0)  # Средняя оценка
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
 		ordering = ['-created_at']  # Новые товары первыми
+		# Каталог (ProductViewSet) всегда фильтрует is_available=True, поэтому индексы
+		# частичные: недоступные товары в них не попадают. Каждый индекс отдаёт строки
+		# сразу в порядке выдачи (с id для keyset-пагинации) - без сортировки
+		indexes = [
+			models.Index(fields=['-created_at', '-id'], name='product_created_id_idx', condition=AVAILABLE),
+			# filterset_fields: category, roast_level и их сочетание
+			models.Index(fields=['category', '-created_at', '-id'], name='product_category_created_idx', condition=AVAILABLE),
+			models.Index(fields=['roast_level', '-created_at', '-id'], name='product_roast_created_idx', condition=AVAILABLE),
+			models.Index(
+				fields=['category', 'roast_level', '-created_at', '-id'],
+				name='product_cat_roast_created_idx', condition=AVAILABLE,
+			),
+			# ordering_fields: price и name в обе стороны
+			models.Index(fields=['price', 'id'], name='product_price_id_idx', condition=AVAILABLE),
+			models.Index(fields=['name', 'id'], name='product_name_id_idx', condition=AVAILABLE),
+			# Рекомендуемые товары: только с отзывами, по убыванию рейтинга
+			models.Index(
+				fields=['-avg_rating'], name='product_featured_idx',
+				condition=AVAILABLE & Q(review_count__gte=1),
+			),
+		]
+
+	# Поля, которые меняются только через apply_rating_delta
+	RATING_FIELDS = ('rating_sum', 'review_count', 'avg_rating')
+	# Поля, по которым ищет api.search
+	SEARCH_FIELDS = ('name', 'origin', 'description')
 
 	def __str__(self):
 		return self.name
 
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		# None - поле отложено (only/defer), смену изображения не отслеживаем
+		instance._saved_image = (instance.__dict__['image'] or '') if 'image' in instance.__dict__ else None
+		instance._saved_stock = instance.__dict__.get('stock')
+		instance._saved_search_text = instance.search_text()
+		return instance
+
+	def search_text(self):
+		"""Значения SEARCH_FIELDS или None, если какое-то из них отложено"""
+		if not all(field in self.__dict__ for field in self.SEARCH_FIELDS):
+			return None
+		return tuple(self.__dict__[field] for field in self.SEARCH_FIELDS)
+
+	def save(self, *args, **kwargs):
+		"""
+		При обновлении не перезаписываем агрегаты отзывов значениями из памяти,
+		иначе параллельно добавленный отзыв потеряется. По той же причине
+		остаток записывается, только если его изменили (иначе затрутся списания
+		параллельных заказов), а image_variants - только когда сменилось изображение:
+		тогда старые варианты сбрасываются (их файлы удалит api.images)
+		"""
+		stock_changed = 'stock' in self.__dict__ and self.stock != getattr(self, '_saved_stock', self.stock)
+		saved_image = getattr(self, '_saved_image', '')
+		self._image_changed = saved_image is not None and (self.image.name or '') != saved_image
+		if self._image_changed:
+			self._stale_image_variants, self.image_variants = self.image_variants, {}
+		# Поисковый индекс пересчитывается, только если изменился текст товара
+		search_text = self.search_text()
+		self._search_text_changed = search_text is None or search_text != getattr(self, '_saved_search_text', None)
+		update_fields = kwargs.get('update_fields')
+		if not self._state.adding and update_fields is None:
+			kwargs['update_fields'] = [
+				field.name for field in self._meta.concrete_fields
+				if not field.primary_key and field.name not in self.RATING_FIELDS
+				and (field.name != 'image_variants' or self._image_changed)
+				and (field.name != 'stock' or stock_changed)
+			]
+		elif update_fields is not None and self._image_changed and 'image' in update_fields:
+			kwargs['update_fields'] = [*update_fields, 'image_variants']
+		super().save(*args, **kwargs)
+		if 'image' in self.__dict__:
+			self._saved_image = self.image.name or ''
+		if 'stock' in self.__dict__:
+			self._saved_stock = self.stock
+		self._saved_search_text = search_text
+
+	@classmethod
+	def apply_rating_delta(cls, product_id, rating_delta, count_delta):
+		"""
+		Атомарно изменяет агрегаты отзывов товара одним UPDATE.
+		Правая часть выражений вычисляется по старым значениям строки
+		"""
+		rating_sum = F('rating_sum') + rating_delta
+		review_count = F('review_count') + count_delta
+		cls.objects.filter(pk=product_id).update(
+			rating_sum=rating_sum,
+			review_count=review_count,
+			avg_rating=Coalesce(
+				Cast(rating_sum, FloatField()) / NullIf(review_count, 0),
+				0.0,
+				output_field=FloatField(),
+			),
+			updated_at=Now(),  # Рейтинг - часть представления товара (ETag, Last-Modified)
+		)
+
+	@classmethod
+	def reserve_stock(cls, quantities):
+		"""
+		Списывает остатки {product_id: количество} условными UPDATE ... WHERE stock >= n.
+		Без SELECT FOR UPDATE: строку блокирует сам UPDATE до конца транзакции, поэтому
+		его стоит выполнять последним. Товары обходятся по возрастанию id - встречные
+		заказы не блокируют друг друга взаимно. При нехватке - InsufficientStock,
+		уже списанное откатывает транзакция вызывающего кода.
+		Остаток - часть представления товара: тот же UPDATE меняет updated_at (ETag),
+		а после фиксации увеличивается версия каталога (закэшированные ответы)
+		"""
+		short = [
+			product_id for product_id, quantity in sorted(quantities.items())
+			if not cls.objects.filter(pk=product_id, stock__gte=quantity).update(
+				stock=F('stock') - quantity, updated_at=Now(),
+			)
+		]
+		if short:
+			raise InsufficientStock(short)
+		if quantities:
+			bump_catalog_version()
+
+	@classmethod
+	def release_stock(cls, quantities):
+		"""Возвращает на склад остатки {product_id: количество} (отмена заказа)"""
+		for product_id, quantity in sorted(quantities.items()):
+			cls.objects.filter(pk=product_id, stock__isnull=False).update(stock=F('stock') + quantity, updated_at=Now())
+		if quantities:
+			bump_catalog_version()
+
+class InsufficientStock(Exception):
+	"""Остатка не хватает; product_ids - товары, по которым не хватило"""
+
+	def __init__(self, product_ids):
+		super().__init__(f"Not enough stock for products: {', '.join(map(str, product_ids))}.")
+		self.product_ids = product_ids
+
+class ProductSearchDocument(models.Model):
+	"""
+	Сохранённый tsvector товара для полнотекстового поиска (только PostgreSQL).
+	Вынесен в отдельную таблицу, чтобы схема Product оставалась переносимой
+	"""
+	# DO_NOTHING и без FK-ограничения: на других СУБД таблицы нет,
+	# а на PostgreSQL документ удаляется сигналом вместе с товаром
+	product = models.OneToOneField(
+		Product, primary_key=True, related_name='search_document',
+		on_delete=models.DO_NOTHING, db_constraint=False,
+	)
+	vector = SearchVectorField()
+	# Текст товара в нижнем регистре для поиска с опечатками (pg_trgm)
+	words = models.TextField(default='')
+
+	class Meta:
+		required_db_vendor = 'postgresql'
+		indexes = [
+			GinIndex(fields=['vector'], name='product_search_vector_gin'),
+			GinIndex(fields=['words'], opclasses=['gin_trgm_ops'], name='product_search_words_trgm'),
+		]
+
+	def __str__(self):
+		return f"Search document for product #{self.product_id}"
+
 class Order(models.Model):
 	"""
 	Модель заказа. Связывает пользователя с товарами через OrderItem
@@ -64,15 +241,65 @@ class Order(models.Model):
 	status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
 	total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 	shipping_address = models.TextField()
+	# Статус, под которым заказ сейчас учтён в дневных сводках продаж ('' - не учтён), см. api.analytics
+	rollup_status = models.CharField(max_length=20, blank=True, editable=False)
+	# Учтён ли заказ в индексе совместных покупок ProductCoPurchase, см. api.recommendations
+	co_purchase_counted = models.BooleanField(default=False, editable=False)
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
 		ordering = ['-created_at']  # Новые заказы первыми
+		indexes = [
+			# Keyset-пагинация заказов пользователя по (created_at, id)
+			models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_id_idx'),
+			# filterset_fields и ordering_fields OrderViewSet: status, total_amount
+			models.Index(fields=['user', 'status', '-created_at', '-id'], name='order_user_status_idx'),
+			models.Index(fields=['user', 'total_amount', 'id'], name='order_user_total_idx'),
+		]
 
 	def __str__(self):
 		return f"Order #{self.id} - {self.user.username}"
 
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		instance._saved_status = instance.__dict__.get('status')
+		return instance
+
+	def save(self, *args, **kwargs):
+		"""
+		Отмена заказа возвращает его позиции на склад, возврат из отмены
+		снова списывает (InsufficientStock, если остатка уже нет).
+		QuerySet.update(status=...) остатки не меняет
+		"""
+		if self._state.adding:
+			super().save(*args, **kwargs)
+		else:
+			self._save_status_change(*args, **kwargs)
+		self._saved_status = self.status
+
+	def _save_status_change(self, *args, **kwargs):
+		saved_status = getattr(self, '_saved_status', None)
+		with transaction.atomic():
+			if saved_status is None:
+				# Поле было отложено при загрузке - читаем сохранённое значение
+				saved_status = Order.objects.values_list('status', flat=True).get(pk=self.pk)
+			super().save(*args, **kwargs)
+			if (saved_status == 'cancelled') != (self.status == 'cancelled'):
+				quantities = self.stock_quantities()
+				if self.status == 'cancelled':
+					Product.release_stock(quantities)
+				else:
+					Product.reserve_stock(quantities)
+
+	def stock_quantities(self):
+		"""{product_id: количество} позиций с учётом остатков - то, что заказ держит на складе"""
+		return dict(
+			self.items.filter(product__stock__isnull=False)
+			.values('product_id').annotate(quantity=Sum('quantity')).values_list('product_id', 'quantity')
+		)
+
 class OrderItem(models.Model):
 	"""
 	Промежуточная модель для связи заказа и товаров
@@ -99,10 +326,152 @@ class Review(models.Model):
 	rating = models.PositiveIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])  # 1-5 звезд
 	comment = models.TextField(blank=True)
 	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
 		unique_together = ['product', 'user']  # Один отзыв на товар от пользователя
 		ordering = ['-created_at']  # Новые отзывы первыми
+		indexes = [
+			# Keyset-пагинация отзывов пользователя и отзывов товара по (created_at, id)
+			models.Index(fields=['user', '-created_at', '-id'], name='review_user_created_id_idx'),
+			models.Index(fields=['product', '-created_at', '-id'], name='review_product_created_id_idx'),
+			# filterset_fields и ordering_fields ReviewViewSet: rating
+			models.Index(fields=['user', 'rating', '-created_at', '-id'], name='review_user_rating_idx'),
+		]
+
+	def __str__(self):
+		return f"Review for {self.product.name} by {self.user.username}"
+
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		instance._remember_rating()
+		return instance
+
+	def _remember_rating(self):
+		"""Запоминаем сохранённые товар и оценку, чтобы потом применить разницу"""
+		self._saved_rating = self.__dict__.get('rating')
+		self._saved_product_id = self.__dict__.get('product_id')
+
+	def save(self, *args, **kwargs):
+		"""Сохраняет отзыв и обновляет агрегаты товара в той же транзакции"""
+		adding = self._state.adding
+		saved_rating = getattr(self, '_saved_rating', None)
+		saved_product_id = getattr(self, '_saved_product_id', None)
+		with transaction.atomic():
+			if not adding and (saved_rating is None or saved_product_id is None):
+				# Поля были отложены при загрузке - читаем сохранённые значения
+				saved_rating, saved_product_id = Review.objects.values_list(
+					'rating', 'product_id'
+				).get(pk=self.pk)
+			super().save(*args, **kwargs)
+			if adding:
+				Product.apply_rating_delta(self.product_id, self.rating, 1)
+			elif saved_product_id != self.product_id:
+				Product.apply_rating_delta(saved_product_id, -saved_rating, -1)
+				Product.apply_rating_delta(self.product_id, self.rating, 1)
+			elif saved_rating != self.rating:
+				Product.apply_rating_delta(self.product_id, self.rating - saved_rating, 0)
+		self._remember_rating()
+
+class Job(models.Model):
+	"""
+	Фоновое задание (api.jobs): выполняется worker'ом run_jobs после ответа на запрос.
+	Таблица и есть очередь - задание добавляется в той же транзакции, что и данные
+	"""
+	PENDING = 'pending'
+	RUNNING = 'running'
+	SUCCEEDED = 'succeeded'
+	FAILED = 'failed'
+	STATUS_CHOICES = [
+		(PENDING, 'Pending'),
+		(RUNNING, 'Running'),
+		(SUCCEEDED, 'Succeeded'),
+		(FAILED, 'Failed'),
+	]
+
+	queue = models.CharField(max_length=50, default='default')
+	name = models.CharField(max_length=100)  # Имя задачи в реестре api.jobs
+	payload = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+	# Повторная постановка с тем же ключом возвращает существующее задание
+	idempotency_key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+	status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+	attempts = models.PositiveIntegerField(default=0)
+	max_attempts = models.PositiveIntegerField(default=5)
+	run_at = models.DateTimeField(default=timezone.now)  # Не раньше этого времени (отложенный повтор)
+	locked_at = models.DateTimeField(null=True, blank=True)
+	locked_by = models.CharField(max_length=100, blank=True)  # Worker, взявший задание
+	last_error = models.TextField(blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	finished_at = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		ordering = ['run_at', 'id']
+		indexes = [
+			# Выборка готовых заданий очереди: только ожидающие, обычно их немного
+			models.Index(fields=['queue', 'run_at', 'id'], name='job_pending_idx', condition=Q(status='pending')),
+			# Поиск зависших заданий (worker упал) и очистка выполненных
+			models.Index(fields=['locked_at'], name='job_running_idx', condition=Q(status='running')),
+			models.Index(fields=['finished_at'], name='job_succeeded_idx', condition=Q(status='succeeded')),
+		]
+
+	def __str__(self):
+		return f"Job #{self.id} {self.queue}:{self.name} ({self.status})"
+
+class SalesRollup(models.Model):
+	"""
+	Дневная сводка продаж: заказы, единицы товара и выручка в разрезе статуса.
+	Поддерживается инкрементально (api.analytics), пересобирается командой rebuild_sales_rollups
+	"""
+	date = models.DateField()
+	status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+	orders = models.IntegerField(default=0)
+	units = models.IntegerField(default=0)
+	revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+	class Meta:
+		abstract = True
+
+class DailySales(SalesRollup):
+	"""Сводка по всем заказам за день"""
+
+	class Meta:
+		verbose_name_plural = "Daily sales"
+		constraints = [models.UniqueConstraint(fields=['date', 'status'], name='daily_sales_uniq')]
+
+class DailyCategorySales(SalesRollup):
+	"""Сводка по категории за день; заказ учитывается в каждой категории своих товаров один раз"""
+	# История продаж переживает удаление категории или товара
+	category = models.ForeignKey(Category, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+
+	class Meta:
+		verbose_name_plural = "Daily category sales"
+		constraints = [
+			models.UniqueConstraint(fields=['date', 'category', 'status'], name='daily_category_sales_uniq'),
+		]
+		indexes = [models.Index(fields=['category', 'date'], name='daily_category_sales_idx')]
+
+class DailyProductSales(SalesRollup):
+	"""Сводка по товару за день"""
+	product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+
+	class Meta:
+		verbose_name_plural = "Daily product sales"
+		constraints = [
+			models.UniqueConstraint(fields=['date', 'product', 'status'], name='daily_product_sales_uniq'),
+		]
+		indexes = [models.Index(fields=['product', 'date'], name='daily_product_sales_idx')]
+
+class ProductCoPurchase(models.Model):
+	"""
+	Товары, которые чаще всего покупают вместе с product: neighbours - [[id товара,
+	число заказов], ...] по убыванию числа заказов, не больше CO_PURCHASE_SLOTS пар.
+	Поддерживается инкрементально (api.recommendations), пересобирается командой
+	rebuild_co_purchase_index
+	"""
+	product = models.OneToOneField(Product, primary_key=True, related_name='co_purchase', on_delete=models.CASCADE)
+	neighbours = models.JSONField(default=list)
+	updated_at = models.DateTimeField(auto_now=True)
 
 	def __str__(self):
-		return f"Review for {self.product.name} by {self.user.username}"
\ No newline at end of file
+		return f"Co-purchases of product #{self.product_id}"
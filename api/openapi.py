@@ -0,0 +1,162 @@
+"""
+Схема OpenAPI, построенная заранее. drf_yasg обходит все ViewSet и сериализаторы
+при каждом запросе схемы; здесь схема строится командой generate_openapi_schema
+при деплое (или первым запросом, если файла нет), сохраняется в OPENAPI_SCHEMA_FILE
+и отдаётся из памяти с ETag. Файл перестраивается, только когда меняется версия кода
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from functools import cache
+from importlib.metadata import version as package_version
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, yaml_sane_dump
+from drf_yasg.views import SPEC_RENDERERS, get_schema_view
+from rest_framework import permissions
+from rest_framework.request import Request
+
+SCHEMA_INFO = openapi.Info(
+	title="Coffee Shop API",
+	default_version='v1',
+	description="API for Coffee Shop E-commerce",
+	terms_of_service="https://www.google.com/policies/terms/",
+	contact=openapi.Contact(email="contact@coffeeshop.local"),
+	license=openapi.License(name="BSD License"),
+)
+# Пакеты, от версий которых зависит содержимое схемы
+SCHEMA_PACKAGES = ('Django', 'djangorestframework', 'drf-yasg', 'djangorestframework_simplejwt', 'django-filter')
+SPEC_FORMATS = {renderer.format for renderer in SPEC_RENDERERS}
+
+
+@cache
+def code_version():
+	"""
+	settings.CODE_VERSION (например, коммит, из которого собран образ) или хеш
+	исходников приложений проекта и версий пакетов, из которых строится схема.
+	Код в процессе не меняется, поэтому версия считается один раз
+	"""
+	if settings.CODE_VERSION:
+		return settings.CODE_VERSION
+	digest = hashlib.sha256()
+	for name in SCHEMA_PACKAGES:
+		digest.update(f'{name}=={package_version(name)}\n'.encode())
+	roots = {Path(settings.BASE_DIR) / settings.ROOT_URLCONF.split('.')[0]}
+	roots.update(Path(app.path) for app in apps.get_app_configs() if Path(app.path).is_relative_to(settings.BASE_DIR))
+	for path in sorted(path for root in roots for path in root.rglob('*.py')):
+		digest.update(str(path.relative_to(settings.BASE_DIR)).encode())
+		digest.update(path.read_bytes())
+	return digest.hexdigest()[:16]
+
+
+def generate_schema():
+	"""
+	JSON схемы со всеми endpoints от имени анонимного пользователя. Схема не зависит
+	от адреса сервера: без host и schemes Swagger UI и клиенты используют адрес,
+	с которого её получили
+	"""
+	# Адрес нужен генератору только для host и schemes, которые затем удаляются
+	generator = SchemaView.generator_class(SCHEMA_INFO, url='http://localhost')
+	schema = generator.get_schema(request=Request(RequestFactory().get('/swagger/')), public=True)
+	del schema['host'], schema['schemes']
+	schema['x-code-version'] = code_version()
+	return OpenAPICodecJson(validators=[]).encode(schema)
+
+
+def write_schema(content, path=None):
+	"""Записывает схему через временный файл: читатели не увидят файл недописанным"""
+	path = Path(path or settings.OPENAPI_SCHEMA_FILE)
+	path.parent.mkdir(parents=True, exist_ok=True)
+	with tempfile.NamedTemporaryFile(dir=path.parent, prefix='.openapi-', delete=False) as output:
+		output.write(content)
+	os.replace(output.name, path)
+
+
+def read_schema(path=None):
+	"""(JSON схемы, версия кода) из файла или None, если файла нет"""
+	try:
+		content = Path(path or settings.OPENAPI_SCHEMA_FILE).read_bytes()
+	except FileNotFoundError:
+		return None
+	return content, json.loads(content).get('x-code-version')
+
+
+class PrecomputedSchema:
+	"""Схема в памяти процесса: формат -> (содержимое, ETag); YAML строится по первому запросу"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._documents = {}
+
+	def load(self):
+		"""JSON из файла текущей версии кода; устаревший или отсутствующий файл перестраивается"""
+		stored = read_schema()
+		if stored is not None and stored[1] == code_version():
+			return stored[0]
+		content = generate_schema()
+		try:
+			write_schema(content)
+		except OSError:
+			# Каталог только для чтения - схема всё равно отдаётся из памяти
+			pass
+		return content
+
+	def get(self, spec_format):
+		"""(содержимое, ETag) схемы в формате spec_format"""
+		kind = 'yaml' if spec_format == 'yaml' else 'json'
+		document = self._documents.get(kind)
+		if document is None:
+			with self._lock:
+				if 'json' not in self._documents:
+					self._documents['json'] = self.build(self.load())
+				if kind == 'yaml' and 'yaml' not in self._documents:
+					self._documents['yaml'] = self.build(yaml_sane_dump(json.loads(self._documents['json'][0]), binary=True))
+				document = self._documents[kind]
+		return document
+
+	@staticmethod
+	def build(content):
+		return content, quote_etag(hashlib.sha256(content).hexdigest()[:32])
+
+	def reset(self):
+		with self._lock:
+			self._documents.clear()
+
+
+precomputed_schema = PrecomputedSchema()
+
+SchemaView = get_schema_view(
+	SCHEMA_INFO,
+	public=True,
+	permission_classes=(permissions.AllowAny,),
+)
+
+
+class PrecomputedSchemaView(SchemaView):
+	"""
+	Документ схемы (?format=openapi, json, yaml) - из precomputed_schema.
+	Страницы Swagger UI и ReDoc по-прежнему строит drf_yasg: для них он
+	генерирует только заголовок схемы без endpoints
+	"""
+
+	def get(self, request, version='', format=None):
+		renderer = request.accepted_renderer
+		if renderer.format not in SPEC_FORMATS:
+			return super().get(request, version, format)
+		content, etag = precomputed_schema.get(renderer.format)
+		response = get_conditional_response(request, etag=etag)
+		if response is None:
+			response = HttpResponse(content, content_type=f'{renderer.media_type}; charset={renderer.charset}')
+		response['ETag'] = etag
+		# Кэш клиента проверяет схему по ETag при каждом использовании
+		patch_cache_control(response, no_cache=True)
+		return response
@@ -0,0 +1,189 @@
+import json
+from types import SimpleNamespace
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+	"""
+	Keyset-пагинация: страница выбирается условием WHERE по значениям
+	полей сортировки последней строки, без OFFSET и без SELECT COUNT(*).
+
+	Сортировка берётся из queryset (OrderingFilter или Meta.ordering модели)
+	и дополняется первичным ключом, поэтому порядок строго однозначный и
+	страницы не «плывут» при параллельных вставках. Курсор хранит значения
+	полей, а не смещение
+	"""
+	invalid_cursor_message = 'Invalid cursor'
+
+	def get_keyset_ordering(self, queryset):
+		"""
+		Возвращает [(field, descending)] для сортировки queryset
+		или None, если её нельзя выразить через значения полей модели
+		"""
+		query = queryset.query
+		ordering = query.order_by or (query.default_ordering and queryset.model._meta.ordering) or ()
+		opts = queryset.model._meta
+		keyset = []
+		for item in ordering:
+			if not isinstance(item, str) or item == '?' or '__' in item:
+				return None
+			descending = item.startswith('-')
+			name = item.lstrip('-')
+			try:
+				field = opts.pk if name == 'pk' else opts.get_field(name)
+			except FieldDoesNotExist:
+				return None
+			if not field.concrete or field.is_relation or field.null:
+				return None
+			keyset.append((field, descending))
+		if not any(field.primary_key for field, _ in keyset):
+			# Первичный ключ - однозначный tie-breaker для равных значений
+			descending = keyset[0][1] if keyset else True
+			keyset.append((opts.pk, descending))
+		return keyset
+
+	def paginate_queryset(self, queryset, request, view=None):
+		self.page_size = self.get_page_size(request)
+		if not self.page_size:
+			return None
+
+		self.base_url = request.build_absolute_uri()
+		self.keyset = self.get_keyset_ordering(queryset)
+		if self.keyset is None:
+			return None
+		values, self.reverse = self.decode_keyset_cursor(request)
+
+		keyset = [(field, descending != self.reverse) for field, descending in self.keyset]
+		queryset = queryset.order_by(*[
+			f"{'-' if descending else ''}{field.attname}" for field, descending in keyset
+		])
+		if values is not None:
+			queryset = queryset.filter(self.build_keyset_filter(keyset, values))
+
+		results = list(queryset[:self.page_size + 1])
+		has_more = len(results) > self.page_size
+		self.page = results[:self.page_size]
+		if self.reverse:
+			self.page.reverse()
+			self.has_next, self.has_previous = values is not None, has_more
+		else:
+			self.has_next, self.has_previous = has_more, values is not None
+		return self.page
+
+	def build_keyset_filter(self, keyset, values):
+		"""
+		(a, b, id) > (x, y, z) раскрывается в
+		a > x OR (a = x AND b > y) OR (a = x AND b = y AND id > z)
+		"""
+		conditions = []
+		for index, (field, descending) in enumerate(keyset):
+			lookup = 'lt' if descending else 'gt'
+			condition = Q(**{f'{field.attname}__{lookup}': values[index]})
+			for previous_index, (previous, _) in enumerate(keyset[:index]):
+				condition &= Q(**{previous.attname: values[previous_index]})
+			conditions.append(condition)
+		return reduce(or_, conditions)
+
+	def decode_keyset_cursor(self, request):
+		"""Возвращает (значения полей, reverse) или (None, False) для первой страницы"""
+		encoded = request.query_params.get(self.cursor_query_param)
+		if not encoded:
+			return None, False
+		try:
+			data = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+			if data['o'] != self.ordering_signature():
+				raise ValueError('Cursor belongs to another ordering')
+			values = [
+				field.to_python(value)
+				for (field, _), value in zip(self.keyset, data['v'], strict=True)
+			]
+			return values, bool(data['r'])
+		except (TypeError, ValueError, KeyError, ValidationError, UnicodeError):
+			raise NotFound(self.invalid_cursor_message)
+
+	def encode_keyset_cursor(self, instance, reverse):
+		if isinstance(instance, dict):
+			# Строки из .values() (см. api/projections.py)
+			instance = SimpleNamespace(**instance)
+		data = {
+			'o': self.ordering_signature(),
+			'v': [field.value_to_string(instance) for field, _ in self.keyset],
+			'r': int(reverse),
+		}
+		encoded = urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+		return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+	def ordering_signature(self):
+		return ','.join(f"{'-' if descending else ''}{field.name}" for field, descending in self.keyset)
+
+	def get_next_link(self):
+		if not self.has_next:
+			return None
+		return self.encode_keyset_cursor(self.page[-1], reverse=False)
+
+	def get_previous_link(self):
+		if not self.has_previous:
+			return None
+		if not self.page:
+			return remove_query_param(self.base_url, self.cursor_query_param)
+		return self.encode_keyset_cursor(self.page[0], reverse=True)
+
+	def get_paginated_response(self, data):
+		return Response({
+			'next': self.get_next_link(),
+			'previous': self.get_previous_link(),
+			'results': data,
+		})
+
+
+class PageNumberOrKeysetPagination(PageNumberPagination):
+	"""
+	Пагинация по номеру страницы (как раньше) с keyset-режимом по запросу:
+	?pagination=cursor для первой страницы, дальше - ссылки next/previous с ?cursor=.
+	Если сортировку нельзя выразить через поля модели (например, по релевантности
+	поиска), используется пагинация по номеру страницы
+	"""
+	keyset_class = KeysetPagination
+	mode_query_param = 'pagination'
+
+	def wants_keyset(self, request):
+		return (
+			request.query_params.get(self.mode_query_param) == 'cursor'
+			or self.keyset_class.cursor_query_param in request.query_params
+		)
+
+	def paginate_queryset(self, queryset, request, view=None):
+		self.keyset = None
+		if self.wants_keyset(request):
+			keyset = self.keyset_class()
+			page = keyset.paginate_queryset(queryset, request, view)
+			if page is not None:
+				self.keyset = keyset
+				return page
+		return super().paginate_queryset(queryset, request, view)
+
+	def get_paginated_response(self, data):
+		if self.keyset is not None:
+			return self.keyset.get_paginated_response(data)
+		return super().get_paginated_response(data)
+
+	def get_schema_operation_parameters(self, view):
+		return super().get_schema_operation_parameters(view) + [
+			{
+				'name': self.mode_query_param,
+				'required': False,
+				'in': 'query',
+				'description': 'Set to "cursor" to use keyset pagination.',
+				'schema': {'type': 'string', 'enum': ['cursor']},
+			},
+			*self.keyset_class().get_schema_operation_parameters(view),
+		]
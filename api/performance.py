@@ -0,0 +1,164 @@
+import bisect
+import heapq
+import re
+import threading
+import time
+from collections import Counter
+
+# Верхние границы корзин гистограммы задержек, мс
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+# Маршруты DefaultRouter - регулярные выражения: (?P<pk>[^/.]+) -> <pk>
+_NAMED_GROUP_RE = re.compile(r'\(\?P<(\w+)>[^)]*\)')
+
+
+class RequestMetrics:
+	"""Метрики одного запроса: SQL-запросы, время БД, время рендеринга"""
+
+	def __init__(self, slow_queries_kept=0):
+		self.started = time.perf_counter()
+		self.finished = None
+		self.query_count = 0
+		self.queries_by_alias = Counter()  # Алиас БД -> число запросов (основная БД и реплики)
+		self.db_time = 0.0
+		self.render_started = None
+		self.render_time = 0.0
+		self.slow_queries_kept = slow_queries_kept
+		self.slow_queries = []  # min-heap (duration, порядковый номер, sql) самых долгих запросов
+
+	def record_query(self, execute, sql, params, many, context):
+		"""Обёртка для connection.execute_wrapper()"""
+		started = time.perf_counter()
+		try:
+			return execute(sql, params, many, context)
+		finally:
+			duration = time.perf_counter() - started
+			self.query_count += 1
+			self.queries_by_alias[context['connection'].alias] += 1
+			self.db_time += duration
+			if self.slow_queries_kept:
+				item = (duration, self.query_count, sql)
+				if len(self.slow_queries) < self.slow_queries_kept:
+					heapq.heappush(self.slow_queries, item)
+				elif duration > self.slow_queries[0][0]:
+					heapq.heapreplace(self.slow_queries, item)
+
+	def start_render(self):
+		self.render_started = time.perf_counter()
+
+	def finish_render(self, response=None):
+		if self.render_started is not None:
+			self.render_time = time.perf_counter() - self.render_started
+
+	def finish(self):
+		self.finished = time.perf_counter()
+
+	@property
+	def total_time(self):
+		return (self.finished or time.perf_counter()) - self.started
+
+	@property
+	def app_time(self):
+		"""Время view без БД и рендеринга: сериализация, фильтры, права доступа"""
+		return max(self.total_time - self.db_time - self.render_time, 0.0)
+
+	def worst_queries(self):
+		return [(duration, sql) for duration, _, sql in sorted(self.slow_queries, reverse=True)]
+
+	def server_timing(self):
+		"""Значение заголовка Server-Timing"""
+		# По алиасам - только если запросы шли не только в основную БД
+		aliases = [] if set(self.queries_by_alias) <= {'default'} else sorted(self.queries_by_alias.items())
+		return ', '.join([
+			f'db;dur={self.db_time * 1000:.1f};desc="{self.query_count} queries"',
+			*(f'db-{alias};desc="{count} queries"' for alias, count in aliases),
+			f'app;dur={self.app_time * 1000:.1f}',
+			f'render;dur={self.render_time * 1000:.1f}',
+			f'total;dur={self.total_time * 1000:.1f}',
+		])
+
+
+class EndpointStats:
+	"""Гистограмма задержек и суммарные метрики одного endpoint"""
+
+	def __init__(self):
+		self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+		self.count = 0
+		self.total_ms = 0.0
+		self.db_ms = 0.0
+		self.queries = 0
+		self.queries_by_alias = Counter()
+		self.errors = 0
+
+	def add(self, metrics, status_code):
+		total_ms = metrics.total_time * 1000
+		self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, total_ms)] += 1
+		self.count += 1
+		self.total_ms += total_ms
+		self.db_ms += metrics.db_time * 1000
+		self.queries += metrics.query_count
+		self.queries_by_alias.update(metrics.queries_by_alias)
+		self.errors += status_code >= 500
+
+	def percentile(self, fraction):
+		"""Оценка перцентиля по верхней границе корзины"""
+		threshold = fraction * self.count
+		seen = 0
+		for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+			seen += count
+			if seen >= threshold:
+				return bound
+		return LATENCY_BUCKETS_MS[-1]
+
+	def snapshot(self):
+		count = self.count or 1
+		return {
+			'count': self.count,
+			'errors': self.errors,
+			'mean_ms': round(self.total_ms / count, 2),
+			'p50_ms': self.percentile(0.5),
+			'p95_ms': self.percentile(0.95),
+			'p99_ms': self.percentile(0.99),
+			'mean_db_ms': round(self.db_ms / count, 2),
+			'mean_queries': round(self.queries / count, 2),
+			'queries_by_alias': dict(sorted(self.queries_by_alias.items())),
+			'buckets': {
+				('inf' if bound == float('inf') else str(bound)): value
+				for bound, value in zip(LATENCY_BUCKETS_MS, self.buckets)
+			},
+		}
+
+
+class PerformanceRegistry:
+	"""Статистика по endpoint'ам в памяти процесса (у каждого воркера своя)"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._endpoints = {}
+
+	def record(self, endpoint, metrics, status_code):
+		with self._lock:
+			stats = self._endpoints.get(endpoint)
+			if stats is None:
+				stats = self._endpoints[endpoint] = EndpointStats()
+			stats.add(metrics, status_code)
+
+	def snapshot(self):
+		with self._lock:
+			return {endpoint: stats.snapshot() for endpoint, stats in sorted(self._endpoints.items())}
+
+	def reset(self):
+		with self._lock:
+			self._endpoints.clear()
+
+
+registry = PerformanceRegistry()
+
+
+def endpoint_name(request):
+	"""Имя endpoint для статистики: метод + шаблон маршрута, а не конкретный URL"""
+	match = getattr(request, 'resolver_match', None)
+	if match is None:
+		return f'{request.method} <unresolved>'
+	route = _NAMED_GROUP_RE.sub(r'<\1>', match.route).replace('^', '').replace('$', '').replace('\\', '')
+	return f'{request.method} /{route}'
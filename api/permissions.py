@@ -12,4 +12,5 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
 
 		# Разрешаем запись только владельцу объекта
 		# Предполагаем, что у модели есть поле 'user'
-		return obj.user == request.user
\ No newline at end of file
+		# Сравнение по id: не загружает пользователя из БД (см. ClaimsUser)
+		return obj.user_id == request.user.pk
\ No newline at end of file
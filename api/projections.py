@@ -0,0 +1,146 @@
+import decimal
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import fields, relations
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+class Projection:
+	"""
+	Быстрый путь сериализации списков: строки читаются через .values() в словари
+	и преобразуются заранее подготовленными конвертерами, без создания экземпляров
+	моделей и без обхода полей DRF для каждой строки.
+
+	Набор, порядок и формат полей берутся из обычного ModelSerializer, поэтому
+	результат совпадает с его выводом байт в байт. Поддерживаются только простые
+	поля модели и поля вида source='relation.field'
+	"""
+
+	def __init__(self, serializer_class):
+		self.serializer_class = serializer_class
+		self._columns = None
+
+	@property
+	def columns(self):
+		"""[(имя поля в ответе, lookup для .values(), фабрика конвертера)] - строится один раз"""
+		if self._columns is None:
+			serializer = self.serializer_class()
+			self._columns = [
+				(name, '__'.join(field.source_attrs), self.build_converter(field))
+				for name, field in serializer.fields.items()
+				if not field.write_only
+			]
+		return self._columns
+
+	@property
+	def lookups(self):
+		return [lookup for _, lookup, _ in self.columns]
+
+	def build_converter(self, field):
+		"""
+		Возвращает фабрику context -> конвертер значения, повторяющий
+		field.to_representation() для поддерживаемых типов полей
+		"""
+		if hasattr(field, 'get_projection_converter'):
+			# Собственные поля сериализаторов сами строят конвертер по контексту
+			return field.get_projection_converter
+		if isinstance(field, relations.PrimaryKeyRelatedField):
+			return lambda context: None
+		if isinstance(field, fields.DecimalField):
+			return lambda context: self.decimal_converter(field)
+		if isinstance(field, fields.DateTimeField):
+			return lambda context: self.datetime_converter(field)
+		if isinstance(field, fields.FileField):
+			return lambda context: self.file_converter(field, context)
+		if isinstance(field, fields.FloatField):
+			return lambda context: float
+		if isinstance(field, (fields.CharField, fields.ChoiceField, fields.IntegerField, fields.BooleanField)):
+			# Значения из БД уже имеют нужный тип (str, int, bool)
+			return lambda context: None
+		raise ImproperlyConfigured(
+			f'{type(self).__name__} does not support {type(field).__name__} '
+			f'({self.serializer_class.__name__}.{field.field_name})'
+		)
+
+	@staticmethod
+	def decimal_converter(field):
+		if field.normalize_output or field.localize:
+			return field.to_representation
+		coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+		if field.decimal_places is None:
+			quantize = lambda value: value
+		else:
+			exponent = decimal.Decimal('.1') ** field.decimal_places
+			context = decimal.getcontext().copy()
+			if field.max_digits is not None:
+				context.prec = field.max_digits
+			quantize = lambda value: value.quantize(exponent, rounding=field.rounding, context=context)
+		if coerce_to_string:
+			return lambda value: f'{quantize(value):f}'
+		return quantize
+
+	@staticmethod
+	def datetime_converter(field):
+		output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+		field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+		if output_format is None or output_format.lower() != fields.ISO_8601 or field_timezone is None:
+			return field.to_representation
+
+		def convert(value):
+			if timezone.is_naive(value):
+				return field.to_representation(value)
+			value = value.astimezone(field_timezone).isoformat()
+			if value.endswith('+00:00'):
+				value = value[:-6] + 'Z'
+			return value
+		return convert
+
+	@staticmethod
+	def file_converter(field, context):
+		use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+		if not use_url:
+			return lambda name: name or None
+		storage = field.parent.Meta.model._meta.get_field(field.source).storage
+		request = context.get('request')
+
+		def convert(name):
+			if not name:
+				return None
+			url = storage.url(name)
+			return request.build_absolute_uri(url) if request is not None else url
+		return convert
+
+	def serialize(self, rows, context=None):
+		"""Преобразует строки .values(*self.lookups) в словари ответа"""
+		context = context or {}
+		columns = [(name, lookup, factory(context)) for name, lookup, factory in self.columns]
+		result = []
+		for row in rows:
+			item = {}
+			for name, lookup, convert in columns:
+				value = row[lookup]
+				# Как и DRF, None выводится без преобразования
+				item[name] = value if convert is None or value is None else convert(value)
+			result.append(item)
+		return result
+
+
+class ProjectionListMixin:
+	"""
+	Mixin для ViewSet: list отдаётся через Projection вместо сериализатора.
+	Фильтрация, поиск, сортировка и пагинация работают как обычно
+	"""
+	projection = None
+
+	def list(self, request, *args, **kwargs):
+		if self.projection is None:
+			return super().list(request, *args, **kwargs)
+
+		queryset = self.filter_queryset(self.get_queryset()).values(*self.projection.lookups)
+		context = self.get_serializer_context()
+		page = self.paginate_queryset(queryset)
+		if page is not None:
+			return self.get_paginated_response(self.projection.serialize(page, context))
+		return Response(self.projection.serialize(queryset, context))
@@ -0,0 +1,137 @@
+"""
+Индекс «С этим товаром покупают» (ProductCoPurchase): для каждого товара - товары,
+с которыми его чаще всего заказывают вместе, и число таких заказов.
+
+Заказ попадает в индекс заданием recommendations.sync_order (api.tasks) после
+оформления, а при отмене и возврате из отмены задание вычитает или снова прибавляет
+его пары (Order.co_purchase_counted - учтён ли заказ сейчас). Товар хранит не больше
+CO_PURCHASE_SLOTS соседей: новый сосед при заполненном списке вытесняет самого
+редкого и наследует его счётчик (алгоритм Space-Saving) - частые пары не теряются,
+но счётчики редких могут быть завышены. Точные значения восстанавливает
+команда rebuild_co_purchase_index. Чтение - одна строка по первичному ключу
+"""
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Order, OrderItem, Product, ProductCoPurchase
+
+REBUILD_BATCH_SIZE = 500  # Товаров в одной порции пересчёта
+
+
+def is_counted(status):
+	"""Отменённые заказы в индекс не входят"""
+	return status != 'cancelled'
+
+
+def merge_neighbours(neighbours, others, sign, slots=None):
+	"""Список соседей после заказа с товарами others (sign=1) или его отмены (sign=-1)"""
+	slots = slots or settings.CO_PURCHASE_SLOTS
+	counts = {product_id: count for product_id, count in neighbours}
+	for other in others:
+		if other in counts:
+			counts[other] += sign
+			if counts[other] <= 0:
+				del counts[other]
+		elif sign > 0:
+			if len(counts) < slots:
+				counts[other] = 1
+			else:
+				weakest = min(counts, key=lambda product_id: (counts[product_id], -product_id))
+				counts[other] = counts.pop(weakest) + 1
+		# Пары, вытесненной раньше, в списке нет - вычитать нечего
+	return sorted(([product_id, count] for product_id, count in counts.items()), key=lambda pair: (-pair[1], pair[0]))
+
+
+def apply_order(product_ids, sign):
+	"""
+	Прибавляет (sign=1) или вычитает (sign=-1) заказ с товарами product_ids.
+	Строки блокируются в порядке id товара: параллельные задания не блокируют друг друга взаимно
+	"""
+	product_ids = sorted(set(product_ids))
+	if len(product_ids) < 2:
+		return
+	for product_id in product_ids:
+		others = [other for other in product_ids if other != product_id]
+		row = ProductCoPurchase.objects.select_for_update().filter(product_id=product_id).first()
+		if row is None:
+			if sign < 0:
+				continue
+			try:
+				with transaction.atomic():
+					ProductCoPurchase.objects.create(product_id=product_id, neighbours=merge_neighbours([], others, sign))
+				continue
+			except IntegrityError:
+				# Строку только что создало параллельное задание
+				row = ProductCoPurchase.objects.select_for_update().get(product_id=product_id)
+		row.neighbours = merge_neighbours(row.neighbours, others, sign)
+		row.save(update_fields=['neighbours', 'updated_at'])
+
+
+def order_products(order_id):
+	return list(OrderItem.objects.filter(order_id=order_id).values_list('product_id', flat=True))
+
+
+def sync_order(order_id):
+	"""Приводит вклад заказа в индексе к его текущему статусу"""
+	with transaction.atomic():
+		order = Order.objects.select_for_update().filter(pk=order_id).values('status', 'co_purchase_counted').first()
+		if order is None:
+			return
+		counted = is_counted(order['status'])
+		if counted == order['co_purchase_counted']:
+			return
+		apply_order(order_products(order_id), 1 if counted else -1)
+		Order.objects.filter(pk=order_id).update(co_purchase_counted=counted)
+
+
+def remove_order(order):
+	"""Вычитает удаляемый заказ из индекса (до удаления его позиций)"""
+	if order.co_purchase_counted:
+		with transaction.atomic():
+			apply_order(order_products(order.pk), -1)
+
+
+def co_purchased_ids(product_id):
+	"""id соседей товара по убыванию числа совместных заказов"""
+	neighbours = ProductCoPurchase.objects.filter(product_id=product_id).values_list('neighbours', flat=True).first()
+	return [other for other, _ in neighbours or ()]
+
+
+def rebuild_index(batch_size=REBUILD_BATCH_SIZE):
+	"""
+	Пересчитывает индекс по всем неотменённым заказам порциями по batch_size товаров.
+	Пары считает БД: позиции товаров порции соединяются с позициями тех же заказов
+	и группируются по (товар, сосед), в память попадают только счётчики порции.
+	Возвращает (товаров с соседями, сохранённых пар)
+	"""
+	slots = settings.CO_PURCHASE_SLOTS
+	indexed = pairs = 0
+	last_pk = 0
+	with transaction.atomic():
+		while product_ids := list(
+			Product.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+		):
+			last_pk = product_ids[-1]
+			counts = (
+				OrderItem.objects.filter(product_id__in=product_ids).exclude(order__status='cancelled')
+				.values('product_id', neighbour=F('order__items__product_id'))
+				.annotate(orders=Count('order_id'))
+				.order_by('product_id', '-orders', 'neighbour')
+			)
+			rows = []
+			for product_id, group in groupby(counts.iterator(chunk_size=5000), key=itemgetter('product_id')):
+				neighbours = [[row['neighbour'], row['orders']] for row in group if row['neighbour'] != product_id][:slots]
+				if neighbours:
+					rows.append(ProductCoPurchase(product_id=product_id, neighbours=neighbours))
+					pairs += len(neighbours)
+			ProductCoPurchase.objects.filter(product_id__in=product_ids).delete()
+			ProductCoPurchase.objects.bulk_create(rows)
+			indexed += len(rows)
+
+		Order.objects.exclude(status='cancelled').filter(co_purchase_counted=False).update(co_purchase_counted=True)
+		Order.objects.filter(status='cancelled', co_purchase_counted=True).update(co_purchase_counted=False)
+	return indexed, pairs
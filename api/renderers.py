@@ -0,0 +1,58 @@
+"""
+JSON через orjson: рендеринг списков товаров и заказов в несколько раз быстрее
+json.dumps из стандартной библиотеки. Формат ответа тот же, что у JSONRenderer DRF:
+компактный JSON в UTF-8, datetime с 'Z' для UTC, Decimal (если он не
+преобразован сериализатором в строку) - числом, \\u2028 и \\u2029 экранированы
+"""
+import orjson
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# orjson сам кодирует datetime, date, time и UUID; остальные типы (Decimal,
+# timedelta, ленивые строки, QuerySet...) кодируются так же, как в DRF
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+ORJSON_DEFAULT = JSONEncoder().default
+
+
+class ORJSONRenderer(JSONRenderer):
+	"""
+	JSONRenderer на orjson. Ответы с отступами (?indent, Browsable API) и данные,
+	которые orjson не умеет кодировать (целые больше 64 бит), рендерит стандартный
+	JSONRenderer. Единственное отличие: float NaN и бесконечность orjson пишет как
+	null, а JSONRenderer в строгом режиме падает с ошибкой
+	"""
+
+	def render(self, data, accepted_media_type=None, renderer_context=None):
+		if data is None:
+			return b''
+		indent = self.get_indent(accepted_media_type, renderer_context or {})
+		if indent is not None or self.ensure_ascii or not self.compact:
+			return super().render(data, accepted_media_type, renderer_context)
+		try:
+			content = orjson.dumps(data, default=ORJSON_DEFAULT, option=ORJSON_OPTIONS)
+		except orjson.JSONEncodeError:
+			return super().render(data, accepted_media_type, renderer_context)
+		# JSON должен оставаться подмножеством JavaScript (как в JSONRenderer)
+		if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+			content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+		return content
+
+
+class ORJSONParser(JSONParser):
+	"""JSONParser на orjson; тела не в UTF-8 разбирает стандартный парсер"""
+	renderer_class = ORJSONRenderer
+
+	def parse(self, stream, media_type=None, parser_context=None):
+		parser_context = parser_context or {}
+		encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+		if encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+			return super().parse(stream, media_type, parser_context)
+		try:
+			# orjson, как и строгий JSONParser, не принимает NaN и Infinity
+			return orjson.loads(stream.read())
+		except orjson.JSONDecodeError as exc:
+			raise ParseError(f'JSON parse error - {exc}')
+
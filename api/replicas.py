@@ -0,0 +1,104 @@
+"""
+Чтение каталога и отзывов с реплик (settings.DATABASE_REPLICAS, алиас -> вес).
+
+ReplicaRouter отправляет на реплику только чтения моделей REPLICA_MODELS внутри
+безопасного HTTP-запроса (состояние задаёт ReadReplicaMiddleware). Всё остальное -
+записи, транзакции, фоновые задания, команды - идёт в основную БД. Пользователь,
+который что-то записал, READ_YOUR_WRITES_SECONDS читает только из основной БД и
+видит свой новый заказ или отзыв, даже если реплика отстаёт
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Состояние маршрутизации текущего запроса; None - все чтения в основную БД
+_routing = ContextVar('database_routing', default=None)
+
+
+def primary_key(user_id):
+	return f'db:primary:{user_id}'
+
+
+class ReadRouting:
+	"""Маршрутизация чтений одного запроса"""
+
+	def __init__(self, request):
+		self.request = request
+		self.alias = None  # Выбирается при первом чтении и не меняется до конца запроса
+		self.wrote = False
+
+	def read_alias(self):
+		if self.wrote or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+			# Транзакция и записи запроса видны только в основной БД
+			return DEFAULT_DB_ALIAS
+		if self.alias is None:
+			self.alias = self.choose_alias()
+		return self.alias
+
+	def choose_alias(self):
+		if self.request.method not in SAFE_METHODS:
+			return DEFAULT_DB_ALIAS
+		# DRF записывает пользователя из токена и в request Django
+		user = getattr(self.request, 'user', None)
+		if user is not None and user.is_authenticated and cache.get(primary_key(user.pk)):
+			return DEFAULT_DB_ALIAS
+		aliases = list(settings.DATABASE_REPLICAS)
+		return random.choices(aliases, weights=[settings.DATABASE_REPLICAS[alias] for alias in aliases])[0]
+
+	def finish(self):
+		"""После записи пользователь какое-то время читает из основной БД"""
+		user = getattr(self.request, 'user', None)
+		if self.wrote and user is not None and user.is_authenticated:
+			cache.set(primary_key(user.pk), True, settings.READ_YOUR_WRITES_SECONDS)
+
+
+@contextmanager
+def read_routing(request):
+	"""Разрешает чтения с реплик на время обработки request"""
+	state = ReadRouting(request)
+	token = _routing.set(state)
+	try:
+		yield state
+	finally:
+		_routing.reset(token)
+		state.finish()
+
+
+@contextmanager
+def primary_reads():
+	"""Чтения внутри блока идут в основную БД"""
+	token = _routing.set(None)
+	try:
+		yield
+	finally:
+		_routing.reset(token)
+
+
+class ReplicaRouter:
+	"""Маршрутизатор БД (settings.DATABASE_ROUTERS)"""
+
+	def db_for_read(self, model, **hints):
+		state = _routing.get()
+		if state is None or model._meta.label not in settings.REPLICA_MODELS:
+			return DEFAULT_DB_ALIAS
+		return state.read_alias()
+
+	def db_for_write(self, model, **hints):
+		state = _routing.get()
+		if state is not None:
+			state.wrote = True
+		return DEFAULT_DB_ALIAS
+
+	def allow_relation(self, obj1, obj2, **hints):
+		# Реплики - копии основной БД: объекты из разных алиасов можно связывать
+		return True
+
+	def allow_migrate(self, db, app_label, model_name=None, **hints):
+		# Реплики получают схему репликацией из основной БД
+		return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,266 @@
+import bisect
+import operator
+import re
+import threading
+from collections import defaultdict
+from functools import reduce
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connections
+from django.db.models import Case, F, IntegerField, Q, When
+from django.template import loader
+from rest_framework.filters import SearchFilter
+
+from .cache import bump_version, get_version
+from .models import Product
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Веса полей товара: название важнее страны, страна важнее описания
+FIELD_WEIGHTS = {'name': 'A', 'origin': 'B', 'description': 'C'}
+WEIGHT_SCORES = {'A': 1.0, 'B': 0.4, 'C': 0.2}
+
+
+def tokenize(text):
+	"""Разбивает текст на слова в нижнем регистре"""
+	return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def max_typos(term):
+	"""Допустимое число опечаток зависит от длины слова"""
+	if len(term) < 4:
+		return 0
+	return 1 if len(term) < 8 else 2
+
+
+def edit_distance(a, b, limit):
+	"""Расстояние Левенштейна с ранним выходом, если оно превышает limit"""
+	if abs(len(a) - len(b)) > limit:
+		return limit + 1
+	previous = list(range(len(b) + 1))
+	for i, char_a in enumerate(a, 1):
+		current = [i]
+		for j, char_b in enumerate(b, 1):
+			current.append(min(
+				previous[j] + 1,
+				current[j - 1] + 1,
+				previous[j - 1] + (char_a != char_b),
+			))
+		if min(current) > limit:
+			return limit + 1
+		previous = current
+	return previous[-1]
+
+
+class Vocabulary:
+	"""Отсортированный словарь слов каталога: поиск по префиксу и исправление опечаток"""
+
+	def __init__(self, terms):
+		self.terms = sorted(set(terms))
+		self.known = set(self.terms)
+		self.by_length = defaultdict(list)
+		for term in self.terms:
+			self.by_length[len(term)].append(term)
+
+	def expand_prefix(self, prefix):
+		"""Все слова словаря, начинающиеся с prefix"""
+		start = bisect.bisect_left(self.terms, prefix)
+		end = bisect.bisect_left(self.terms, prefix + '\uffff')
+		return self.terms[start:end]
+
+	def correct(self, term):
+		"""Ближайшие по расстоянию Левенштейна слова словаря"""
+		limit = max_typos(term)
+		if not limit or term in self.known:
+			return [term] if term in self.known else []
+		best, matches = limit + 1, []
+		for length in range(len(term) - limit, len(term) + limit + 1):
+			for candidate in self.by_length.get(length, ()):
+				distance = edit_distance(term, candidate, limit)
+				if distance < best:
+					best, matches = distance, [candidate]
+				elif distance == best:
+					matches.append(candidate)
+		return matches if best <= limit else []
+
+
+class InvertedIndex:
+	"""
+	Инвертированный индекс товаров в памяти процесса.
+	Используется на базах без полнотекстового поиска (например, SQLite)
+	"""
+
+	def __init__(self, rows):
+		self.postings = defaultdict(dict)
+		for pk, *texts in rows:
+			for field, text in zip(FIELD_WEIGHTS, texts):
+				score = WEIGHT_SCORES[FIELD_WEIGHTS[field]]
+				for term in tokenize(text):
+					postings = self.postings[term]
+					postings[pk] = postings.get(pk, 0) + score
+		self.vocabulary = Vocabulary(self.postings)
+
+	def search(self, terms):
+		"""
+		Возвращает [(pk, score)] товаров, содержащих все слова запроса.
+		Каждое слово раскрывается по префиксу, а при отсутствии совпадений - с учётом опечаток
+		"""
+		scores = None
+		for term in terms:
+			expansions = self.vocabulary.expand_prefix(term) or self.vocabulary.correct(term)
+			matched = defaultdict(float)
+			for expansion in expansions:
+				# Точное совпадение весит больше, чем префиксное или исправленное
+				boost = 1.0 if expansion == term else 0.5
+				for pk, score in self.postings[expansion].items():
+					matched[pk] = max(matched[pk], score * boost)
+			if scores is None:
+				scores = dict(matched)
+			else:
+				scores = {pk: scores[pk] + score for pk, score in matched.items() if pk in scores}
+			if not scores:
+				return []
+		return sorted((scores or {}).items(), key=lambda item: (-item[1], -item[0]))
+
+
+# Версия текста товаров: индекс в памяти перестраивается только после её смены,
+# а не после каждого изменения каталога (остатки, рейтинг, цены)
+SEARCH_VERSION_KEY = 'search:version'
+
+_lock = threading.Lock()
+_index = None  # (версия, InvertedIndex)
+
+
+def bump_search_version():
+	"""Текст товаров изменился (после фиксации транзакции)"""
+	bump_version(SEARCH_VERSION_KEY)
+
+
+def _product_texts():
+	return Product.objects.values_list('pk', *FIELD_WEIGHTS).iterator(chunk_size=2000)
+
+
+def get_inverted_index():
+	"""Индекс строится один раз на версию текста товаров"""
+	global _index
+	version = get_version(SEARCH_VERSION_KEY)
+	cached = _index
+	if cached is not None and cached[0] == version:
+		return cached[1]
+	with _lock:
+		if _index is None or _index[0] != version:
+			_index = (version, InvertedIndex(_product_texts()))
+		return _index[1]
+
+
+def create_trigram_extension(using):
+	"""pg_trgm нужен индексу gin_trgm_ops до миграций api (см. ApiConfig)"""
+	with connections[using].cursor() as cursor:
+		cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+def update_search_document(product_id, using='default'):
+	"""Пересчитывает сохранённый tsvector товара (только PostgreSQL)"""
+	rebuild_search_documents(using=using, product_id=product_id)
+
+
+def rebuild_search_documents(using='default', product_id=None, product_ids=None):
+	"""Одним INSERT ... SELECT пересчитывает tsvector и текст всех товаров, одного или списка товаров"""
+	config = settings.PRODUCT_SEARCH_CONFIG
+	vector = ' || '.join(
+		f"setweight(to_tsvector(%s::regconfig, coalesce({field}, '')), '{weight}')"
+		for field, weight in FIELD_WEIGHTS.items()
+	)
+	words = f"lower(concat_ws(' ', {', '.join(FIELD_WEIGHTS)}))"
+	params = [config] * len(FIELD_WEIGHTS)
+	where = ''
+	if product_id is not None:
+		where = 'WHERE id = %s'
+		params.append(product_id)
+	elif product_ids is not None:
+		where = 'WHERE id = ANY(%s)'
+		params.append(list(product_ids))
+	with connections[using].cursor() as cursor:
+		cursor.execute(
+			f'INSERT INTO api_productsearchdocument (product_id, vector, words) '
+			f'SELECT id, {vector}, {words} FROM api_product {where} '
+			f'ON CONFLICT (product_id) DO UPDATE SET vector = EXCLUDED.vector, words = EXCLUDED.words',
+			params,
+		)
+		return cursor.rowcount
+
+
+class PostgresSearchBackend:
+	"""
+	Поиск одним запросом: слово совпадает префиксом по GIN-индексу tsvector или,
+	при опечатке, похоже на слово текста товара (pg_trgm, оператор %> по индексу
+	gin_trgm_ops). Ранжирование по релевантности tsvector, затем по сходству слов -
+	исправленные совпадения ниже точных и префиксных
+	"""
+
+	def search(self, queryset, terms):
+		config = settings.PRODUCT_SEARCH_CONFIG
+		condition = reduce(operator.and_, (
+			Q(search_document__vector=SearchQuery(f'{term}:*', search_type='raw', config=config))
+			| Q(search_document__words__trigram_word_similar=term)
+			for term in terms
+		))
+		query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config=config)
+		similarity = reduce(operator.add, (TrigramWordSimilarity(term, 'search_document__words') for term in terms))
+		return queryset.filter(condition).annotate(
+			search_rank=SearchRank(F('search_document__vector'), query),
+			search_similarity=similarity,
+		).order_by('-search_rank', '-search_similarity', '-pk')
+
+
+class InMemorySearchBackend:
+	"""
+	Поиск по инвертированному индексу в памяти процесса. Совпадения проходят
+	фильтры queryset (в продаже, ?roast_level= и т. д.) до ограничения
+	PRODUCT_SEARCH_MAX_RESULTS: пачками по рангу, пока не наберётся нужное число
+	"""
+
+	def search(self, queryset, terms):
+		limit = settings.PRODUCT_SEARCH_MAX_RESULTS
+		hits = [pk for pk, _ in get_inverted_index().search(terms)]
+		pks = []
+		for start in range(0, len(hits), limit):
+			chunk = hits[start:start + limit]
+			matching = set(queryset.filter(pk__in=chunk).values_list('pk', flat=True))
+			pks.extend(pk for pk in chunk if pk in matching)
+			if len(pks) >= limit:
+				break
+		if not pks:
+			return queryset.none()
+		pks = pks[:limit]
+		position = Case(
+			*[When(pk=pk, then=index) for index, pk in enumerate(pks)],
+			output_field=IntegerField(),
+		)
+		return queryset.filter(pk__in=pks).order_by(position)
+
+
+def get_search_backend(using):
+	if connections[using].vendor == 'postgresql':
+		return PostgresSearchBackend()
+	return InMemorySearchBackend()
+
+
+class ProductSearchFilter(SearchFilter):
+	"""
+	Полнотекстовый поиск товаров по параметру ?search= вместо ILIKE '%term%'.
+	Результаты упорядочены по релевантности, если не задан ?ordering=.
+	Поля поиска - FIELD_WEIGHTS, search_fields view не используется
+	"""
+
+	def to_html(self, request, queryset, view):
+		"""Форма поиска в browsable API не зависит от search_fields"""
+		context = {'param': self.search_param, 'term': request.query_params.get(self.search_param, '')}
+		return loader.get_template(self.template).render(context)
+
+	def filter_queryset(self, request, queryset, view):
+		terms = [term for text in self.get_search_terms(request) for term in tokenize(text)]
+		if not terms:
+			return queryset
+		return get_search_backend(queryset.db).search(queryset, terms)
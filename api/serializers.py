@@ -1,7 +1,14 @@
+from datetime import timedelta
+
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
 from django.contrib.auth.password_validation import validate_password
-from .models import Category, Product, Order, OrderItem, Review
+from .analytics import REPORT_STATUSES
+from .exports import EXPORT_FORMATS
+from .models import Category, Product, Order, OrderItem, Review, InsufficientStock
 
 class UserSerializer(serializers.ModelSerializer):
 	"""Сериализатор для модели User - только для чтения"""
@@ -37,13 +44,39 @@ class CategorySerializer(serializers.ModelSerializer):
 		model = Category
 		fields = '__all__'  # Все поля модели
 
+class ImageVariantsField(serializers.Field):
+	"""Карта URL уменьшенных копий изображения: {вариант: {формат: url}}"""
+
+	def __init__(self, **kwargs):
+		kwargs['read_only'] = True
+		super().__init__(**kwargs)
+
+	def to_representation(self, value):
+		return self.get_projection_converter(self.context)(value)
+
+	def get_projection_converter(self, context):
+		"""Конвертер для Projection: имена файлов -> абсолютные URL"""
+		storage = Product._meta.get_field('image').storage
+		request = context.get('request')
+
+		def url(name):
+			url = storage.url(name)
+			return request.build_absolute_uri(url) if request is not None else url
+
+		return lambda value: {
+			variant: {image_format: url(name) for image_format, name in formats.items()}
+			for variant, formats in value.items()
+		}
+
 class ProductSerializer(serializers.ModelSerializer):
 	"""Сериализатор для товаров с дополнительным полем названия категории"""
 	category_name = serializers.CharField(source='category.name', read_only=True)
+	image_variants = ImageVariantsField()
 
 	class Meta:
 		model = Product
-		fields = '__all__'
+		exclude = ('import_hash',)  # Служебное поле импорта
+		read_only_fields = Product.RATING_FIELDS  # Агрегаты отзывов считаются автоматически
 
 class OrderItemSerializer(serializers.ModelSerializer):
 	"""Сериализатор для элементов заказа с дополнительной информацией о товаре"""
@@ -66,6 +99,83 @@ class OrderSerializer(serializers.ModelSerializer):
 		fields = '__all__'
 		read_only_fields = ('user', 'total_amount')  # Эти поля устанавливаются автоматически
 
+	def update(self, instance, validated_data):
+		"""Возврат заказа из отмены списывает остатки заново - их может уже не хватать"""
+		try:
+			return super().update(instance, validated_data)
+		except InsufficientStock as exc:
+			raise serializers.ValidationError({'status': str(exc)})
+
+class OrderItemCreateSerializer(serializers.Serializer):
+	"""Позиция нового заказа: товар и количество. Цена берётся на сервере"""
+	product = serializers.IntegerField()
+	quantity = serializers.IntegerField(min_value=1, max_value=settings.ORDER_ITEM_MAX_QUANTITY, default=1)
+
+class OrderCreateSerializer(serializers.ModelSerializer):
+	"""
+	Сериализатор для оформления заказа со всеми позициями одним запросом.
+	Товары читаются одним запросом, цены фиксируются на момент заказа,
+	позиции создаются через bulk_create - число запросов не зависит от числа позиций
+	(кроме списания остатков: один UPDATE на товар с учётом остатка)
+	"""
+	items = OrderItemCreateSerializer(many=True, write_only=True)
+
+	class Meta:
+		model = Order
+		fields = ('id', 'shipping_address', 'items')
+
+	def validate_items(self, items):
+		"""Заказ не пустой, каждый товар встречается один раз"""
+		if not items:
+			raise serializers.ValidationError("Order must contain at least one item.")
+		product_ids = [item['product'] for item in items]
+		if len(product_ids) != len(set(product_ids)):
+			raise serializers.ValidationError("Each product may appear only once.")
+		return items
+
+	def validate(self, attrs):
+		"""
+		Товары доступны, сумма заказа помещается в Order.total_amount.
+		В позициях id товара заменяется на сам товар, сумма - в total_amount
+		"""
+		items = attrs['items']
+		products = Product.objects.filter(is_available=True).in_bulk([item['product'] for item in items])
+		missing = [item['product'] for item in items if item['product'] not in products]
+		if missing:
+			raise serializers.ValidationError(
+				{"items": f"Products are not available: {', '.join(map(str, missing))}."}
+			)
+		for item in items:
+			item['product'] = products[item['product']]
+
+		total_amount = sum(item['product'].price * item['quantity'] for item in items)
+		field = Order._meta.get_field('total_amount')
+		limit = 10 ** (field.max_digits - field.decimal_places)
+		if total_amount >= limit:
+			raise serializers.ValidationError({"items": f"Order total must be less than {limit}."})
+		attrs['total_amount'] = total_amount
+		return attrs
+
+	def create(self, validated_data):
+		"""Создание заказа с позициями и суммой в одной транзакции"""
+		items = validated_data.pop('items')
+		with transaction.atomic():
+			order = Order.objects.create(**validated_data)
+			order_items = [
+				OrderItem(order=order, product=item['product'], quantity=item['quantity'], price=item['product'].price)
+				for item in items
+			]
+			OrderItem.objects.bulk_create(order_items)
+			# Последним запросом транзакции: строки товаров заблокированы только до коммита
+			try:
+				Product.reserve_stock({
+					item.product_id: item.quantity for item in order_items
+					if item.product.stock is not None
+				})
+			except InsufficientStock as exc:
+				raise serializers.ValidationError({"items": str(exc)})
+		return order
+
 class ReviewSerializer(serializers.ModelSerializer):
 	"""Сериализатор для отзывов с именем пользователя"""
 	user_name = serializers.CharField(source='user.username', read_only=True)
@@ -73,4 +183,77 @@ class ReviewSerializer(serializers.ModelSerializer):
 	class Meta:
 		model = Review
 		fields = '__all__'
-		read_only_fields = ('user',)  # Пользователь устанавливается автоматически
\ No newline at end of file
+		read_only_fields = ('user',)  # Пользователь устанавливается автоматически
+
+class BatchItemSerializer(serializers.Serializer):
+	"""Подзапрос пакета: только чтение endpoints API"""
+	method = serializers.ChoiceField(choices=['GET'], default='GET')
+	path = serializers.CharField(max_length=2000)  # Путь с параметрами: /api/products/?ids=1,2
+
+	def validate_path(self, value):
+		if not value.startswith('/api/'):
+			raise serializers.ValidationError("Path must start with /api/.")
+		return value
+
+class BatchRequestSerializer(serializers.Serializer):
+	"""Пакет запросов (POST /api/batch/)"""
+	requests = BatchItemSerializer(many=True, allow_empty=False)
+
+	def validate_requests(self, value):
+		if len(value) > settings.BATCH_MAX_REQUESTS:
+			raise serializers.ValidationError(f"Ensure this field has no more than {settings.BATCH_MAX_REQUESTS} elements.")
+		return value
+
+class OrderExportQuerySerializer(serializers.Serializer):
+	"""Параметры выгрузки заказов (GET /api/orders/export/); даты - включительно"""
+	export_format = serializers.ChoiceField(choices=list(EXPORT_FORMATS), default='csv')
+	status = serializers.MultipleChoiceField(choices=Order.STATUS_CHOICES, required=False)
+	created_from = serializers.DateField(required=False)
+	created_to = serializers.DateField(required=False)
+	user = serializers.IntegerField(required=False)  # Только для персонала
+
+	def validate(self, attrs):
+		if attrs.get('created_from') and attrs.get('created_to') and attrs['created_from'] > attrs['created_to']:
+			raise serializers.ValidationError({"created_from": "created_from must not be after created_to."})
+		return attrs
+
+class SalesReportQuerySerializer(serializers.Serializer):
+	"""Параметры отчёта о продажах (GET /api/analytics/)"""
+	MAX_DAYS = 366 * 5
+
+	date_from = serializers.DateField(required=False)
+	date_to = serializers.DateField(required=False)
+	status = serializers.MultipleChoiceField(choices=Order.STATUS_CHOICES, required=False)
+	group_by = serializers.ChoiceField(choices=['category', 'product'], required=False)
+	interval = serializers.ChoiceField(choices=['day', 'month', 'total'], default='day')
+	id = serializers.ListField(child=serializers.IntegerField(), required=False)  # Категории или товары для group_by
+	limit = serializers.IntegerField(min_value=1, max_value=10000, default=1000)
+
+	def validate(self, attrs):
+		"""По умолчанию - последние 30 дней по неотменённым заказам"""
+		attrs.setdefault('date_to', timezone.localdate())
+		attrs.setdefault('date_from', attrs['date_to'] - timedelta(days=29))
+		if attrs['date_from'] > attrs['date_to']:
+			raise serializers.ValidationError({"date_from": "date_from must not be after date_to."})
+		if (attrs['date_to'] - attrs['date_from']).days >= self.MAX_DAYS:
+			raise serializers.ValidationError({"date_from": f"Date range is limited to {self.MAX_DAYS} days."})
+		if attrs.get('id') and not attrs.get('group_by'):
+			raise serializers.ValidationError({"id": "id requires group_by."})
+		attrs['status'] = sorted(attrs.get('status') or REPORT_STATUSES)
+		return attrs
+
+class SalesTotalsSerializer(serializers.Serializer):
+	"""Итоги отчёта о продажах: заказы, единицы товара и выручка"""
+	orders = serializers.IntegerField(source='total_orders')
+	units = serializers.IntegerField(source='total_units')
+	revenue = serializers.DecimalField(source='total_revenue', max_digits=14, decimal_places=2)
+
+class SalesReportRowSerializer(SalesTotalsSerializer):
+	"""
+	Строка отчёта: период (кроме interval=total), категория или товар (при group_by).
+	Необязательные поля, которых нет в строке, не выводятся
+	"""
+	period = serializers.DateField(required=False)
+	category = serializers.IntegerField(required=False)
+	product = serializers.IntegerField(required=False)
+	name = serializers.CharField(required=False)
@@ -0,0 +1,106 @@
+from django.db import connections
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from . import tasks
+from . import recommendations
+from .analytics import remove_order
+from .authentication import invalidate_cached_user
+from .cache import bump_catalog_version
+from .models import Category, Order, Product, ProductSearchDocument, Review
+from .search import bump_search_version, update_search_document
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_catalog_cache(sender, **kwargs):
+	"""Любое изменение каталога или отзывов делает закэшированные ответы устаревшими"""
+	bump_catalog_version()
+
+
+@receiver(post_delete, sender=Review)
+def decrement_product_rating(sender, instance, **kwargs):
+	"""Удаление отзыва (в том числе каскадное) вычитает его оценку из агрегатов товара"""
+	Product.apply_rating_delta(instance.product_id, -instance.rating, -1)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, using, **kwargs):
+	"""Новый текст товара - поисковый документ на PostgreSQL, индекс в памяти на других СУБД"""
+	if not getattr(instance, '_search_text_changed', True):
+		return
+	if connections[using].vendor == 'postgresql':
+		update_search_document(instance.pk, using=using)
+	else:
+		bump_search_version()
+
+
+@receiver(post_save, sender=Product)
+def schedule_image_variants(sender, instance, **kwargs):
+	"""Новое изображение товара - задание на уменьшенные копии в той же транзакции"""
+	if getattr(instance, '_image_changed', False):
+		tasks.build_image_variants.enqueue(product_id=instance.pk, stale_variants=instance._stale_image_variants)
+
+
+@receiver(post_delete, sender=Product)
+def schedule_image_variants_deletion(sender, instance, **kwargs):
+	if instance.image_variants:
+		tasks.delete_image_variants.enqueue(variants=instance.image_variants)
+
+
+@receiver(post_save, sender=Order)
+def schedule_order_confirmation(sender, instance, created, **kwargs):
+	"""Письмо о новом заказе отправит worker; задание фиксируется вместе с заказом"""
+	if created:
+		# Ключ: повторный post_save того же заказа не отправит второе письмо
+		tasks.send_order_confirmation.enqueue(key=f'order-confirmation:{instance.pk}', order_id=instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def schedule_sales_rollup(sender, instance, created, **kwargs):
+	"""Новый заказ или смена статуса - сводки продаж обновит worker"""
+	if created or instance.status != getattr(instance, '_saved_status', None):
+		tasks.sync_order_rollups.enqueue(order_id=instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def schedule_co_purchase_sync(sender, instance, created, **kwargs):
+	"""Новый заказ, отмена или возврат из отмены - индекс совместных покупок обновит worker"""
+	saved_status = getattr(instance, '_saved_status', None)
+	counted_changed = recommendations.is_counted(instance.status) != recommendations.is_counted(saved_status)
+	if created or saved_status is None or counted_changed:
+		tasks.sync_order_co_purchases.enqueue(order_id=instance.pk)
+
+
+@receiver(pre_delete, sender=Order)
+def remove_order_from_rollups(sender, instance, **kwargs):
+	"""Вклад заказа вычитается, пока его позиции ещё не удалены каскадом"""
+	remove_order(instance)
+
+
+@receiver(pre_delete, sender=Order)
+def remove_order_from_co_purchases(sender, instance, **kwargs):
+	recommendations.remove_order(instance)
+
+
+@receiver(pre_delete, sender=Order)
+def release_order_stock(sender, instance, **kwargs):
+	"""Удаляемый неотменённый заказ возвращает свои позиции на склад (отменённый уже вернул)"""
+	if instance.status != 'cancelled':
+		Product.release_stock(instance.stock_quantities())
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, using, **kwargs):
+	if connections[using].vendor == 'postgresql':
+		ProductSearchDocument.objects.using(using).filter(product_id=instance.pk).delete()
+	else:
+		bump_search_version()
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def invalidate_user_cache(sender, instance, **kwargs):
+	"""Изменение пользователя (в том числе пароля) сбрасывает его копию в кэше аутентификации"""
+	invalidate_cached_user(instance.pk)
@@ -0,0 +1,45 @@
+"""
+Фоновые задачи приложения (см. api.jobs). Модуль импортируется в ApiConfig.ready,
+чтобы реестр задач был заполнен и в веб-процессах, и в worker'е run_jobs
+"""
+from django.core.mail import send_mail
+
+from . import analytics, recommendations
+from .images import image_pipeline
+from .jobs import task
+from .models import Order
+
+
+@task('images.build_variants', queue='images')
+def build_image_variants(product_id, stale_variants=None):
+	image_pipeline.process(product_id, stale_variants)
+
+
+@task('images.delete_variants', queue='images')
+def delete_image_variants(variants):
+	image_pipeline.delete_files(variants)
+
+
+@task('orders.send_confirmation')
+def send_order_confirmation(order_id):
+	"""Письмо о принятом заказе; заказ без адреса почты пропускается"""
+	order = Order.objects.select_related('user').prefetch_related('items__product').filter(pk=order_id).first()
+	if order is None or not order.user.email:
+		return
+	lines = [f'{item.quantity} x {item.product.name} - {item.price}' for item in order.items.all()]
+	send_mail(
+		subject=f'Order #{order.pk} received',
+		message='\n'.join([f'Hello, {order.user.username}!', '', *lines, '', f'Total: {order.total_amount}']),
+		from_email=None,
+		recipient_list=[order.user.email],
+	)
+
+
+@task('analytics.sync_order')
+def sync_order_rollups(order_id):
+	analytics.sync_order(order_id)
+
+
+@task('recommendations.sync_order')
+def sync_order_co_purchases(order_id):
+	recommendations.sync_order(order_id)
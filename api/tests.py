@@ -1,3 +1,2092 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import Future
+from contextlib import redirect_stdout
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnDict
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import ClaimsJWTAuthentication, ClaimsTokenObtainPairSerializer, user_cache_key
+from .cache import CATALOG_CHANGED_KEY, bump_catalog_version, catalog_cache_stats, catalog_changed_recently
+from .images import image_pipeline
+from .imaging import variant_path
+from .jobs import claim_jobs, enqueue, purge_finished_jobs, requeue_stale_jobs, run_job, task
+from .middleware import PerformanceMiddleware, ReadReplicaMiddleware
+from .openapi import code_version, precomputed_schema
+from .performance import registry as performance_registry
+from .recommendations import merge_neighbours
+from .renderers import ORJSONRenderer
+from .replicas import ReplicaRouter, primary_key, primary_reads, read_routing
+from .search import get_inverted_index
+from .serializers import CategorySerializer, ProductSerializer
+from .views import CategoryViewSet, OrderViewSet, ProductViewSet
+from . import tasks
+from .models import (
+	Category, Product, Order, OrderItem, Review, Job, DailySales, DailyCategorySales, DailyProductSales,
+	ProductCoPurchase,
+)
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class QueryBudgetMixin:
+	"""
+	Проверка бюджета SQL-запросов: число запросов к endpoint не должно
+	зависеть от количества строк на странице и позиций в заказе (защита от N+1)
+	"""
+
+	def assertQueryBudget(self, url, budget, seed, sizes=(1, 10)):
+		"""Заполняет данные seed(n) для каждого n из sizes и проверяет бюджет запросов"""
+		for size in sizes:
+			seed(size)
+			with self.assertNumQueries(budget):
+				response = self.client.get(url)
+			self.assertEqual(response.status_code, 200, response.content)
+
+
+@override_settings(CACHES=NO_CACHE)
+class EagerLoadingQueryTests(QueryBudgetMixin, TestCase):
+	"""Списки и детальные страницы ViewSet'ов укладываются в фиксированное число запросов"""
+
+	def setUp(self):
+		self.client = APIClient()
+		self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345', first_name='Ivan')
+		self.client.force_authenticate(self.user)
+		self.counter = 0
+
+	def make_product(self, **kwargs):
+		self.counter += 1
+		category = Category.objects.create(name=f'Category {self.counter}')
+		defaults = {
+			'name': f'Product {self.counter}', 'description': 'Test', 'price': Decimal('10.00'),
+			'category': category, 'origin': 'Brazil',
+		}
+		defaults.update(kwargs)
+		return Product.objects.create(**defaults)
+
+	def make_review(self, product=None):
+		self.counter += 1
+		user = User.objects.create_user(f'reviewer{self.counter}')
+		return Review.objects.create(product=product or self.make_product(), user=user, rating=5)
+
+	def seed_products(self, size):
+		for _ in range(size):
+			self.make_product()
+
+	def seed_orders(self, size):
+		for _ in range(size):
+			order = Order.objects.create(user=self.user, shipping_address='Moscow')
+			for _ in range(size):
+				product = self.make_product()
+				OrderItem.objects.create(order=order, product=product, price=product.price)
+
+	def seed_own_reviews(self, size):
+		for _ in range(size):
+			Review.objects.create(product=self.make_product(), user=self.user, rating=4)
+
+	def test_product_list(self):
+		# валидаторы ETag + COUNT + выборка товаров с категориями
+		self.assertQueryBudget('/api/products/', 3, self.seed_products)
+
+	def test_product_detail(self):
+		product = self.make_product()
+		# валидаторы ETag + товар с категорией
+		with self.assertNumQueries(2):
+			response = self.client.get(f'/api/products/{product.pk}/')
+		self.assertEqual(response.data['category_name'], product.category.name)
+
+	def test_product_reviews(self):
+		product = self.make_product()
+		# товар + COUNT + выборка отзывов с пользователями
+		self.assertQueryBudget(
+			f'/api/products/{product.pk}/reviews/', 3,
+			lambda size: [self.make_review(product) for _ in range(size)],
+		)
+
+	def test_order_list(self):
+		# валидаторы ETag + COUNT + заказы с пользователями + позиции с товарами
+		self.assertQueryBudget('/api/orders/', 4, self.seed_orders)
+
+	def test_order_detail(self):
+		self.seed_orders(5)
+		order = Order.objects.first()
+		# валидаторы ETag + заказ + позиции
+		with self.assertNumQueries(3):
+			response = self.client.get(f'/api/orders/{order.pk}/')
+		self.assertEqual(len(response.data['items']), 5)
+		self.assertEqual(response.data['user_name'], 'Ivan')
+
+	def test_review_list(self):
+		# валидаторы ETag + COUNT + выборка отзывов с пользователями
+		self.assertQueryBudget('/api/reviews/', 3, self.seed_own_reviews)
+
+
+class CatalogCacheTests(TestCase):
+	"""Ответы каталога кэшируются и инвалидируются при записи"""
+
+	def setUp(self):
+		cache.clear()
+		self.client = APIClient()
+		self.category = Category.objects.create(name='Coffee Beans')
+		self.product = Product.objects.create(
+			name='Colombia Supremo', description='Test', price=Decimal('22.50'),
+			category=self.category, origin='Colombia',
+		)
+
+	def test_repeated_list_is_served_from_cache(self):
+		first = self.client.get('/api/products/')
+		self.assertEqual(first['X-Cache'], 'MISS')
+		with self.assertNumQueries(0):
+			second = self.client.get('/api/products/')
+		self.assertEqual(second['X-Cache'], 'HIT')
+		self.assertEqual(first.json(), second.json())
+		self.assertEqual(catalog_cache_stats()['hits'], 1)
+		self.assertEqual(catalog_cache_stats()['misses'], 1)
+
+	def test_query_params_are_part_of_key(self):
+		self.client.get('/api/products/')
+		response = self.client.get('/api/products/', {'roast_level': 'dark'})
+		self.assertEqual(response['X-Cache'], 'MISS')
+		self.assertEqual(response.json()['count'], 0)
+
+	def test_write_bumps_version(self):
+		self.client.get(f'/api/products/{self.product.pk}/')
+		with self.captureOnCommitCallbacks(execute=True):
+			self.product.price = Decimal('19.99')
+			self.product.save()
+		response = self.client.get(f'/api/products/{self.product.pk}/')
+		self.assertEqual(response['X-Cache'], 'MISS')
+		self.assertEqual(response.json()['price'], '19.99')
+
+	def test_review_invalidates_featured(self):
+		self.assertEqual(self.client.get('/api/products/featured/').json(), [])
+		user = User.objects.create_user('reviewer')
+		with self.captureOnCommitCallbacks(execute=True):
+			Review.objects.create(product=self.product, user=user, rating=5)
+		response = self.client.get('/api/products/featured/')
+		self.assertEqual(response['X-Cache'], 'MISS')
+		self.assertEqual(len(response.json()), 1)
+
+
+class RatingAggregateTests(TestCase):
+	"""Агрегаты отзывов на Product поддерживаются при каждом изменении Review"""
+
+	def setUp(self):
+		category = Category.objects.create(name='Coffee Beans')
+		self.product = Product.objects.create(
+			name='Italian Espresso', description='Test', price=Decimal('27.99'),
+			category=category, origin='Brazil',
+		)
+		self.users = [User.objects.create_user(f'user{i}') for i in range(3)]
+
+	def assertAggregates(self, rating_sum, review_count, avg_rating):
+		self.product.refresh_from_db()
+		self.assertEqual(self.product.rating_sum, rating_sum)
+		self.assertEqual(self.product.review_count, review_count)
+		self.assertAlmostEqual(self.product.avg_rating, avg_rating)
+
+	def test_create_update_delete(self):
+		first = Review.objects.create(product=self.product, user=self.users[0], rating=5)
+		Review.objects.create(product=self.product, user=self.users[1], rating=2)
+		self.assertAggregates(7, 2, 3.5)
+
+		review = Review.objects.get(pk=first.pk)
+		review.rating = 3
+		review.save()
+		self.assertAggregates(5, 2, 2.5)
+
+		review.delete()
+		self.assertAggregates(2, 1, 2.0)
+
+		Review.objects.all().delete()
+		self.assertAggregates(0, 0, 0.0)
+
+	def test_product_save_keeps_aggregates(self):
+		stale = Product.objects.get(pk=self.product.pk)
+		Review.objects.create(product=self.product, user=self.users[0], rating=4)
+		stale.price = Decimal('25.00')
+		stale.save()
+		self.assertAggregates(4, 1, 4.0)
+
+	def test_rebuild_command_fixes_drift(self):
+		Review.objects.create(product=self.product, user=self.users[0], rating=4)
+		Product.objects.filter(pk=self.product.pk).update(rating_sum=0, review_count=0, avg_rating=0)
+		out = StringIO()
+		call_command('rebuild_rating_aggregates', stdout=out)
+		self.assertIn('fixed drift in 1', out.getvalue())
+		self.assertAggregates(4, 1, 4.0)
+
+
+class ProductSearchTests(TestCase):
+	"""Поиск товаров по ?search= с ранжированием, префиксами и опечатками"""
+
+	def setUp(self):
+		cache.clear()
+		self.client = APIClient()
+		category = Category.objects.create(name='Coffee Beans')
+		with self.captureOnCommitCallbacks(execute=True):
+			self.espresso = Product.objects.create(
+				name='Italian Espresso', description='Rich and bold with chocolate notes',
+				price=Decimal('27.99'), category=category, origin='Brazil',
+			)
+			self.yirgacheffe = Product.objects.create(
+				name='Ethiopia Yirgacheffe', description='Floral, perfect for espresso lovers',
+				price=Decimal('25.99'), category=category, origin='Ethiopia',
+			)
+			self.colombia = Product.objects.create(
+				name='Colombia Supremo', description='Balanced with caramel and nutty flavors',
+				price=Decimal('22.50'), category=category, origin='Colombia',
+			)
+
+	def search(self, term, **params):
+		response = self.client.get('/api/products/', {'search': term, **params})
+		self.assertEqual(response.status_code, 200)
+		return [row['id'] for row in response.json()['results']]
+
+	def test_name_match_ranks_above_description(self):
+		self.assertEqual(self.search('espresso'), [self.espresso.pk, self.yirgacheffe.pk])
+
+	def test_all_terms_required(self):
+		self.assertEqual(self.search('espresso floral'), [self.yirgacheffe.pk])
+
+	def test_prefix(self):
+		self.assertEqual(self.search('colom'), [self.colombia.pk])
+
+	def test_typo(self):
+		self.assertEqual(self.search('carmel'), [self.colombia.pk])
+		self.assertEqual(self.search('ethiopa'), [self.yirgacheffe.pk])
+
+	def test_no_match(self):
+		self.assertEqual(self.search('decaf'), [])
+
+	def test_explicit_ordering_wins(self):
+		self.assertEqual(
+			self.search('espresso', ordering='price'),
+			[self.yirgacheffe.pk, self.espresso.pk],
+		)
+
+	def test_index_follows_catalog_changes(self):
+		self.search('espresso')
+		with self.captureOnCommitCallbacks(execute=True):
+			self.colombia.description = 'Great as espresso'
+			self.colombia.save()
+		self.assertIn(self.colombia.pk, self.search('espresso'))
+
+	def test_filters_apply_before_result_limit(self):
+		self.yirgacheffe.roast_level = 'dark'
+		self.yirgacheffe.save()
+		# Товар в продаже ниже по рангу, чем снятый с продажи, - всё равно в выдаче
+		with override_settings(PRODUCT_SEARCH_MAX_RESULTS=1):
+			self.assertEqual(self.search('espresso', roast_level='dark'), [self.yirgacheffe.pk])
+			Product.objects.filter(pk=self.espresso.pk).update(is_available=False)
+			self.assertEqual(self.search('espresso'), [self.yirgacheffe.pk])
+
+	def test_search_form_in_browsable_api(self):
+		response = self.client.get('/api/products/', {'search': 'espresso'}, HTTP_ACCEPT='text/html')
+		self.assertContains(response, 'name="search"')
+
+	@skipUnless(connection.vendor != 'postgresql', 'In-memory index is used without PostgreSQL')
+	def test_index_rebuilt_only_on_text_change(self):
+		index = get_inverted_index()
+		with self.captureOnCommitCallbacks(execute=True):
+			self.colombia.price = Decimal('23.00')
+			self.colombia.save()
+		self.assertIs(get_inverted_index(), index)
+		with self.captureOnCommitCallbacks(execute=True):
+			self.colombia.name = 'Colombia Excelso'
+			self.colombia.save()
+		self.assertIsNot(get_inverted_index(), index)
+		self.assertEqual(self.search('excelso'), [self.colombia.pk])
+
+	@skipUnless(connection.vendor == 'postgresql', 'pg_trgm needs PostgreSQL')
+	def test_typo_in_single_query(self):
+		# Исправление опечаток - в том же запросе, без отдельной проверки exists()
+		with CaptureQueriesContext(connection) as exact:
+			self.assertEqual(self.search('caramel'), [self.colombia.pk])
+		cache.clear()
+		with CaptureQueriesContext(connection) as fuzzy:
+			self.assertEqual(self.search('carmel'), [self.colombia.pk])
+		self.assertEqual(len(fuzzy), len(exact))
+
+
+@override_settings(CACHES=NO_CACHE)
+class KeysetPaginationTests(TestCase):
+	"""Keyset-пагинация по запросу клиента: ?pagination=cursor"""
+
+	def setUp(self):
+		self.client = APIClient()
+		self.user = User.objects.create_user('buyer')
+		self.client.force_authenticate(self.user)
+		self.orders = [
+			Order.objects.create(user=self.user, shipping_address='Moscow', total_amount=Decimal(i % 4))
+			for i in range(25)
+		]
+
+	def walk(self, url, params):
+		ids, response = [], self.client.get(url, params)
+		while True:
+			self.assertEqual(response.status_code, 200)
+			body = response.json()
+			self.assertNotIn('count', body)
+			ids += [row['id'] for row in body['results']]
+			if not body['next']:
+				return ids, body
+			response = self.client.get(body['next'])
+
+	def test_walks_all_orders_newest_first(self):
+		ids, _ = self.walk('/api/orders/', {'pagination': 'cursor'})
+		expected = list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+		self.assertEqual(ids, expected)
+
+	def test_page_without_offset_or_page_count(self):
+		# валидаторы ETag + заказы + позиции заказов; пагинация не делает ни COUNT, ни OFFSET
+		with CaptureQueriesContext(connection) as queries:
+			self.client.get('/api/orders/', {'pagination': 'cursor'})
+		sql = [query['sql'] for query in queries]
+		self.assertEqual(len(sql), 3)
+		self.assertFalse(any('OFFSET' in statement for statement in sql))
+		self.assertEqual(sum('COUNT(' in statement for statement in sql), 1)
+
+	def test_stable_under_inserts(self):
+		first = self.client.get('/api/orders/', {'pagination': 'cursor'}).json()
+		Order.objects.create(user=self.user, shipping_address='Moscow')
+		second = self.client.get(first['next']).json()
+		ids = [row['id'] for row in first['results'] + second['results']]
+		self.assertEqual(len(ids), len(set(ids)))
+		self.assertEqual(ids, [order.id for order in reversed(self.orders)][:20])
+
+	def test_previous_link(self):
+		first = self.client.get('/api/orders/', {'pagination': 'cursor'}).json()
+		second = self.client.get(first['next']).json()
+		back = self.client.get(second['previous']).json()
+		self.assertEqual(back['results'], first['results'])
+
+	def test_ordering_filter_field(self):
+		ids, _ = self.walk('/api/orders/', {'pagination': 'cursor', 'ordering': 'total_amount'})
+		expected = list(Order.objects.order_by('total_amount', 'id').values_list('id', flat=True))
+		self.assertEqual(ids, expected)
+
+	def test_invalid_cursor(self):
+		response = self.client.get('/api/orders/', {'cursor': 'garbage'})
+		self.assertEqual(response.status_code, 404)
+
+	def test_page_number_mode_is_default(self):
+		body = self.client.get('/api/orders/', {'page': 3}).json()
+		self.assertEqual(body['count'], 25)
+		self.assertEqual(len(body['results']), 5)
+
+
+class OrderPlacementTests(TestCase):
+	"""Оформление заказа со всеми позициями одним POST /api/orders/"""
+
+	def setUp(self):
+		self.client = APIClient()
+		self.user = User.objects.create_user('buyer')
+		self.client.force_authenticate(self.user)
+		category = Category.objects.create(name='Coffee Beans')
+		self.products = [
+			Product.objects.create(
+				name=f'Product {i}', description='Test', price=Decimal('10.50') + i,
+				category=category, origin='Brazil',
+			)
+			for i in range(20)
+		]
+
+	def place(self, items):
+		return self.client.post('/api/orders/', {
+			'shipping_address': 'Moscow',
+			'items': [{'product': product.pk, 'quantity': quantity} for product, quantity in items],
+		}, format='json')
+
+	def test_snapshots_prices_and_total(self):
+		response = self.place([(self.products[0], 2), (self.products[3], 1)])
+		self.assertEqual(response.status_code, 201, response.content)
+		self.assertEqual(response.data['total_amount'], '34.50')
+		self.assertEqual(
+			sorted((item['product'], item['price']) for item in response.data['items']),
+			[(self.products[0].pk, '10.50'), (self.products[3].pk, '13.50')],
+		)
+		self.products[0].price = Decimal('99.00')
+		self.products[0].save()
+		self.assertEqual(OrderItem.objects.get(product=self.products[0]).price, Decimal('10.50'))
+
+	def test_query_count_does_not_depend_on_item_count(self):
+		# 7 запросов на заказ и ответ + INSERT заданий на письмо о заказе (с ключом - в
+		# точке сохранения), сводки продаж и индекс совместных покупок
+		with self.assertNumQueries(12):
+			self.place([(self.products[0], 1)])
+		with self.assertNumQueries(12):
+			self.place([(product, 3) for product in self.products])
+
+	def test_unavailable_product_rolls_back(self):
+		self.products[1].is_available = False
+		self.products[1].save()
+		response = self.place([(self.products[0], 1), (self.products[1], 1)])
+		self.assertEqual(response.status_code, 400)
+		self.assertFalse(Order.objects.exists())
+
+	def test_duplicate_and_empty_items(self):
+		self.assertEqual(self.place([(self.products[0], 1), (self.products[0], 2)]).status_code, 400)
+		self.assertEqual(self.place([]).status_code, 400)
+
+	def test_quantity_and_total_limits(self):
+		response = self.place([(self.products[0], 10 ** 8)])
+		self.assertEqual(response.status_code, 400)
+		self.assertIn('quantity', str(response.data['items']))
+		# Каждое количество в пределах, но сумма не помещается в total_amount (max_digits=10)
+		Product.objects.filter(pk=self.products[0].pk).update(price=Decimal('99999999.99'))
+		response = self.place([(self.products[0], 2)])
+		self.assertEqual(response.status_code, 400)
+		self.assertIn('Order total must be less than 100000000.', str(response.data['items']))
+		self.assertFalse(Order.objects.exists())
+
+
+class SerializerBenchmarkTests(SimpleTestCase):
+	"""scripts/benchmark_serializers.py строит строки по текущей схеме и сверяет оба пути"""
+
+	def test_script_runs(self):
+		path = os.path.join(settings.BASE_DIR, 'scripts', 'benchmark_serializers.py')
+		spec = importlib.util.spec_from_file_location('benchmark_serializers', path)
+		module = importlib.util.module_from_spec(spec)
+		spec.loader.exec_module(module)
+		out = StringIO()
+		with redirect_stdout(out):
+			module.main(rows=20, repeat=1)
+		self.assertIn('speedup', out.getvalue())
+
+
+@override_settings(CACHES=NO_CACHE)
+class ProjectionTests(TestCase):
+	"""Быстрый путь list через .values() совпадает с ModelSerializer байт в байт"""
+
+	def setUp(self):
+		self.client = APIClient()
+		category = Category.objects.create(name='Coffee Beans', description='Fresh')
+		for i in range(15):
+			Product.objects.create(
+				name=f'Product {i}', description='Test', price=Decimal('10.5') + i,
+				category=category, origin='Brazil', roast_level='dark' if i % 2 else 'light',
+				image=f'products/{i}.jpg' if i % 3 else None,
+			)
+
+	def assertSameBytes(self, viewset, serializer_class, queryset):
+		request = APIRequestFactory().get('/api/')
+		context = {'request': request}
+		expected = JSONRenderer().render(serializer_class(queryset, many=True, context=context).data)
+		rows = queryset.values(*viewset.projection.lookups)
+		actual = JSONRenderer().render(viewset.projection.serialize(rows, context))
+		self.assertEqual(actual, expected)
+
+	def test_products_identical(self):
+		self.assertSameBytes(ProductViewSet, ProductSerializer, Product.objects.all())
+
+	def test_categories_identical(self):
+		self.assertSameBytes(CategoryViewSet, CategorySerializer, Category.objects.all())
+
+	def test_list_endpoint_uses_projection(self):
+		response = self.client.get('/api/products/', {'roast_level': 'dark', 'ordering': 'price'})
+		expected = ProductSerializer(
+			Product.objects.filter(roast_level='dark').order_by('price')[:10], many=True,
+			context={'request': response.wsgi_request},
+		).data
+		self.assertEqual(response.json()['results'], json.loads(JSONRenderer().render(expected)))
+
+	def test_keyset_pages_over_projection(self):
+		first = self.client.get('/api/products/', {'pagination': 'cursor'}).json()
+		second = self.client.get(first['next']).json()
+		ids = [row['id'] for row in first['results'] + second['results']]
+		self.assertEqual(ids, list(Product.objects.values_list('id', flat=True)))
+
+
+class ConditionalGetTests(TestCase):
+	"""ETag и Last-Modified: повторный запрос с валидаторами получает 304 без сериализации"""
+
+	def setUp(self):
+		cache.clear()
+		self.client = APIClient()
+		self.user = User.objects.create_user('buyer')
+		self.client.force_authenticate(self.user)
+		self.category = Category.objects.create(name='Coffee Beans')
+		self.product = Product.objects.create(
+			name='Colombia Supremo', description='Test', price=Decimal('22.50'),
+			category=self.category, origin='Colombia',
+		)
+		self.order = Order.objects.create(user=self.user, shipping_address='Moscow')
+
+	def test_order_list_not_modified(self):
+		response = self.client.get('/api/orders/')
+		self.assertIn('ETag', response)
+		self.assertNotIn('Last-Modified', response)
+		# только агрегирующий запрос валидаторов
+		with self.assertNumQueries(1):
+			cached = self.client.get('/api/orders/', HTTP_IF_NONE_MATCH=response['ETag'])
+		self.assertEqual(cached.status_code, 304)
+		self.assertEqual(cached['ETag'], response['ETag'])
+
+	def test_order_change_invalidates(self):
+		etag = self.client.get(f'/api/orders/{self.order.pk}/')['ETag']
+		self.order.status = 'processing'
+		self.order.save()
+		response = self.client.get(f'/api/orders/{self.order.pk}/', HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertNotEqual(response['ETag'], etag)
+
+	def test_list_etag_changes_on_delete(self):
+		# MAX(updated_at) не сдвигается при удалении старой строки - меняется ETag по числу и id
+		Order.objects.create(user=self.user, shipping_address='Kazan')
+		etag = self.client.get('/api/orders/')['ETag']
+		self.order.delete()
+		response = self.client.get('/api/orders/', HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json()['count'], 1)
+
+	def test_order_items_change_etag(self):
+		etag = self.client.get(f'/api/orders/{self.order.pk}/')['ETag']
+		item = OrderItem.objects.create(order=self.order, product=self.product, quantity=1, price=self.product.price)
+		response = self.client.get(f'/api/orders/{self.order.pk}/', HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		etag = response['ETag']
+		OrderItem.objects.filter(pk=item.pk).update(quantity=2)
+		self.assertEqual(self.client.get(f'/api/orders/{self.order.pk}/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+	def test_etag_depends_on_query(self):
+		first = self.client.get('/api/orders/')['ETag']
+		self.assertNotEqual(self.client.get('/api/orders/', {'status': 'pending'})['ETag'], first)
+
+	def test_if_modified_since(self):
+		review = Review.objects.create(product=self.product, user=self.user, rating=5)
+		self.assertNotIn('Last-Modified', self.client.get('/api/reviews/'))
+		last_modified = self.client.get(f'/api/reviews/{review.pk}/')['Last-Modified']
+		self.assertEqual(
+			self.client.get(f'/api/reviews/{review.pk}/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304
+		)
+
+	def test_cached_catalog_not_modified_without_queries(self):
+		response = self.client.get('/api/products/')
+		with self.assertNumQueries(0):
+			cached = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=response['ETag'])
+		self.assertEqual(cached.status_code, 304)
+		self.assertEqual(cached['X-Cache'], 'HIT')
+
+	def test_category_rename_changes_product_etag(self):
+		etag = self.client.get(f'/api/products/{self.product.pk}/')['ETag']
+		with self.captureOnCommitCallbacks(execute=True):
+			self.category.name = 'Beans'
+			self.category.save()
+		response = self.client.get(f'/api/products/{self.product.pk}/', HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json()['category_name'], 'Beans')
+
+
+class AsyncCatalogTests(TestCase):
+	"""Асинхронные endpoints каталога под ASGI отдают тот же JSON, что и синхронные"""
+
+	def setUp(self):
+		cache.clear()
+		self.client = APIClient()
+		self.async_client = AsyncClient()
+		beans = Category.objects.create(name='Coffee Beans')
+		ground = Category.objects.create(name='Ground Coffee')
+		self.category = beans
+		users = [User.objects.create_user(f'user{i}') for i in range(3)]
+		for i in range(14):
+			product = Product.objects.create(
+				name=f'Product {i}', description='Test', price=Decimal('10.50') + i,
+				category=beans if i % 2 else ground, origin='Brazil',
+				roast_level='dark' if i % 3 else 'light',
+			)
+			for user in users[:i % 4]:
+				Review.objects.create(product=product, user=user, rating=5 - i % 3)
+		self.product = product
+		cache.clear()
+
+	async def assertSameAsSync(self, url, params=None):
+		response = await self.async_client.get(url, params or {})
+		await sync_to_async(cache.clear)()
+		expected = await sync_to_async(self.client.get)(url, params or {})
+		await sync_to_async(cache.clear)()
+		self.assertEqual(response.status_code, expected.status_code)
+		self.assertEqual(response.content, expected.content)
+		return response
+
+	async def test_product_list(self):
+		await self.assertSameAsSync('/api/products/')
+		await self.assertSameAsSync('/api/products/', {'page': 2, 'ordering': '-price'})
+		await self.assertSameAsSync('/api/products/', {'category': 1, 'roast_level': 'dark'})
+		await self.assertSameAsSync('/api/products/', {'search': 'product'})
+		await self.assertSameAsSync('/api/products/', {'page': 9})
+		await self.assertSameAsSync('/api/products/', {'category': 'abc'})
+		await self.assertSameAsSync('/api/products/', {'ids': f'{self.product.pk},1,2'})
+		response = await self.assertSameAsSync('/api/products/', {'ids': ''})
+		self.assertEqual(response.status_code, 400)
+
+	async def test_product_detail_and_actions(self):
+		await self.assertSameAsSync(f'/api/products/{self.product.pk}/')
+		await self.assertSameAsSync('/api/products/999999/')
+		await self.assertSameAsSync('/api/products/featured/')
+		await self.assertSameAsSync(f'/api/products/{self.product.pk}/reviews/')
+
+	async def test_categories(self):
+		await self.assertSameAsSync('/api/categories/')
+		await self.assertSameAsSync('/api/categories/', {'search': 'ground'})
+		response = await self.assertSameAsSync(f'/api/categories/{self.category.pk}/')
+		self.assertEqual(response.status_code, 200)
+
+	async def test_served_by_async_view(self):
+		response = await self.async_client.get('/api/products/')
+		self.assertEqual(response.resolver_match.func.cls.__name__, 'AsyncProductView')
+
+	async def test_conditional_get(self):
+		response = await self.async_client.get('/api/products/')
+		etag = response['ETag']
+		self.assertEqual((await self.async_client.get('/api/products/', headers={'If-None-Match': etag})).status_code, 304)
+		await sync_to_async(cache.clear)()
+		self.assertEqual((await self.async_client.get('/api/products/', headers={'If-None-Match': etag})).status_code, 304)
+
+	async def test_keyset_falls_back_to_sync(self):
+		response = await self.async_client.get('/api/products/', {'pagination': 'cursor'})
+		self.assertEqual(response.status_code, 200)
+		self.assertNotIn('count', response.json())
+
+
+@override_settings(CACHES=NO_CACHE, PERFORMANCE_SLOW_REQUEST_MS=0)
+class PerformanceMiddlewareTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		category = Category.objects.create(name='Beans')
+		for i in range(3):
+			Product.objects.create(
+				name=f'Product {i}', description='Coffee', price=Decimal('10.00'),
+				category=category, roast_level='medium', origin='Brazil',
+			)
+		cls.admin = User.objects.create_user('admin', password='secret', is_staff=True)
+
+	def setUp(self):
+		performance_registry.reset()
+
+	def parse_server_timing(self, header):
+		metrics = {}
+		for entry in header.split(', '):
+			name, *params = entry.split(';')
+			metrics[name] = dict(param.split('=', 1) for param in params)
+		return metrics
+
+	def test_server_timing_header(self):
+		# JSON пустого списка рендерится за микросекунды и округляется до 0.0 мс - HTML заметно дольше
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get('/api/products/', {'format': 'api'})
+		timing = self.parse_server_timing(response['Server-Timing'])
+		self.assertEqual(set(timing), {'db', 'app', 'render', 'total'})
+		self.assertEqual(timing['db']['desc'], f'"{len(queries)} queries"')
+		self.assertGreater(float(timing['render']['dur']), 0)
+		self.assertGreaterEqual(float(timing['total']['dur']), float(timing['db']['dur']))
+
+	def test_stats_grouped_by_route(self):
+		product = Product.objects.first()
+		self.client.get('/api/products/')
+		self.client.get(f'/api/products/{product.pk}/')
+		self.client.get('/api/products/999999/')
+		stats = performance_registry.snapshot()
+		self.assertEqual(stats['GET /api/products/']['count'], 1)
+		self.assertEqual(stats['GET /api/products/<pk>/']['count'], 2)
+		self.assertEqual(sum(stats['GET /api/products/<pk>/']['buckets'].values()), 2)
+
+	def test_stats_endpoint_is_protected(self):
+		self.client.get('/api/products/')
+		self.assertEqual(self.client.get('/api/stats/performance/').status_code, 401)
+
+		api_client = APIClient()
+		api_client.force_authenticate(self.admin)
+		stats = api_client.get('/api/stats/performance/').json()
+		self.assertIn('GET /api/products/', stats)
+		self.assertIn('p95_ms', stats['GET /api/products/'])
+
+	@override_settings(PERFORMANCE_SLOW_REQUEST_MS=1e-6)
+	def test_slow_request_logged_with_queries(self):
+		with self.assertLogs('api.performance', 'WARNING') as logs:
+			self.client.get('/api/products/')
+		self.assertIn('/api/products/', logs.output[0])
+		self.assertIn('SELECT', logs.output[0])
+
+	@override_settings(PERFORMANCE_INSTRUMENTATION=False)
+	def test_disabled(self):
+		response = self.client.get('/api/products/')
+		self.assertNotIn('Server-Timing', response)
+		self.assertEqual(performance_registry.snapshot(), {})
+
+	async def test_asgi_request(self):
+		# Под ASGI цепочка middleware асинхронная, SQL выполняется в потоках sync_to_async
+		self.assertFalse(iscoroutinefunction(PerformanceMiddleware(lambda request: None)))
+		self.assertTrue(iscoroutinefunction(PerformanceMiddleware(self.async_view)))
+
+		response = await AsyncClient().get('/api/products/')
+		self.assertEqual(response.status_code, 200)
+		timing = self.parse_server_timing(response['Server-Timing'])
+		self.assertGreater(int(timing['db']['desc'].strip('"').split()[0]), 0)
+		stats = await sync_to_async(performance_registry.snapshot)()
+		self.assertEqual(stats['GET /api/products/']['count'], 1)
+
+	@staticmethod
+	async def async_view(request):
+		pass
+
+
+class SyntheticDataTests(TestCase):
+	def test_generate_synthetic_data(self):
+		call_command(
+			'generate_synthetic_data', users=30, categories=3, products=40, orders=60, reviews=200,
+			batch_size=25, stdout=StringIO(),
+		)
+		self.assertEqual(User.objects.count(), 30)
+		self.assertEqual(Product.objects.count(), 40)
+		self.assertEqual(Order.objects.count(), 60)
+		self.assertTrue(Review.objects.exists())
+		for order in Order.objects.prefetch_related('items'):
+			self.assertEqual(order.total_amount, sum(item.price * item.quantity for item in order.items.all()))
+
+		# Агрегаты рейтинга совпадают с отзывами
+		out = StringIO()
+		call_command('rebuild_rating_aggregates', dry_run=True, stdout=out)
+		self.assertIn('found drift in 0', out.getvalue())
+
+
+class CatalogImportTests(TestCase):
+	CSV = (
+		'sku,name,description,price,category,roast_level,origin,weight_grams,is_available\n'
+		'ETH-1,Ethiopia Yirgacheffe,Floral,25.99,Coffee Beans,light,Ethiopia,250,true\n'
+		'COL-1,Colombia Supremo,Caramel,22.5,Coffee Beans,medium,Colombia,250,1\n'
+		'CAP-1,Morning Capsules,Smooth,12.99,Coffee Capsules,medium,Blend,200,no\n'
+		'BAD-1,Broken,,not-a-price,Coffee Beans,medium,Brazil,250,true\n'
+	)
+
+	def import_catalog(self, content, name='catalog.csv', **options):
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, name)
+			with open(path, 'w', encoding='utf-8') as file:
+				file.write(content)
+			out = StringIO()
+			call_command('import_catalog', path, stdout=out, stderr=StringIO(), **options)
+		return out.getvalue()
+
+	def test_import_creates_products_and_categories(self):
+		output = self.import_catalog(self.CSV, batch_size=2)
+		self.assertIn('3 created, 0 updated, 0 unchanged, 1 errors', output)
+		self.assertIn('rows/s', output)
+		self.assertEqual(Category.objects.count(), 2)
+		product = Product.objects.get(sku='COL-1')
+		self.assertEqual(product.price, Decimal('22.50'))
+		self.assertEqual(product.category.name, 'Coffee Beans')
+		self.assertFalse(Product.objects.get(sku='CAP-1').is_available)
+
+	def test_reimport_unchanged_file_skips_writes(self):
+		self.import_catalog(self.CSV)
+		with CaptureQueriesContext(connection) as queries:
+			output = self.import_catalog(self.CSV)
+		self.assertIn('0 created, 0 updated, 3 unchanged', output)
+		self.assertFalse([query for query in queries if not query['sql'].startswith('SELECT')])
+
+	def test_reimport_updates_changed_rows_only(self):
+		self.import_catalog(self.CSV)
+		product = Product.objects.get(sku='ETH-1')
+		Review.objects.create(product=product, user=User.objects.create_user('reader'), rating=4)
+		output = self.import_catalog(self.CSV.replace('25.99', '27.00'))
+		self.assertIn('0 created, 1 updated, 2 unchanged', output)
+		product.refresh_from_db()
+		self.assertEqual(product.price, Decimal('27.00'))
+		self.assertEqual(product.review_count, 1)  # Агрегаты отзывов не затираются импортом
+		self.assertEqual(Product.objects.filter(sku='ETH-1').count(), 1)
+
+	def test_ndjson(self):
+		rows = [
+			{'sku': 'KEN-1', 'name': 'Kenya AA', 'price': 24, 'category': 'Coffee Beans', 'is_available': False},
+			{'sku': 'KEN-1', 'name': 'Kenya AA Top', 'price': 26, 'category': 'Coffee Beans'},
+		]
+		output = self.import_catalog('\n'.join(json.dumps(row) for row in rows), name='catalog.ndjson')
+		self.assertIn('1 created', output)
+		product = Product.objects.get(sku='KEN-1')
+		self.assertEqual((product.name, product.is_available), ('Kenya AA Top', True))
+
+
+class ClaimsAuthenticationTests(TestCase):
+	"""JWT с claims: request.user строится без запроса к auth_user"""
+
+	def setUp(self):
+		cache.clear()
+		self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+		self.order = Order.objects.create(user=self.user, shipping_address='Moscow')
+		self.client = APIClient()
+		self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token(self.user)}')
+
+	@staticmethod
+	def access_token(user):
+		return str(ClaimsTokenObtainPairSerializer.get_token(user).access_token)
+
+	def user_queries(self, path, method='get', **kwargs):
+		with CaptureQueriesContext(connection) as queries:
+			response = getattr(self.client, method)(path, **kwargs)
+		return response, [query['sql'] for query in queries if 'FROM "auth_user"' in query['sql']]
+
+	def test_token_endpoint_adds_claims(self):
+		response = self.client.post('/api/auth/token/', {'username': 'buyer', 'password': 'pass12345'})
+		token = AccessToken(response.json()['access'])
+		self.assertEqual((token['username'], token['is_active']), ('buyer', True))
+
+	def test_order_list_saves_user_query(self):
+		response, user_queries = self.user_queries('/api/orders/')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json()['count'], 1)
+		self.assertEqual(user_queries, [])
+
+		# Та же страница со стандартной JWTAuthentication - на запрос больше
+		with CaptureQueriesContext(connection) as claims_queries:
+			self.client.get('/api/orders/')
+		with patch.object(OrderViewSet, 'authentication_classes', [JWTAuthentication]):
+			with CaptureQueriesContext(connection) as db_queries:
+				self.client.get('/api/orders/')
+		self.assertEqual(len(db_queries), len(claims_queries) + 1)
+
+	def test_profile_loads_user_once_then_from_cache(self):
+		response, user_queries = self.user_queries('/api/auth/profile/')
+		self.assertEqual(response.json()['email'], 'buyer@example.com')
+		self.assertEqual(len(user_queries), 1)
+		_, user_queries = self.user_queries('/api/auth/profile/')
+		self.assertEqual(user_queries, [])
+
+	def test_cache_has_no_password_hash(self):
+		self.client.get('/api/auth/profile/')
+		cached = cache.get(user_cache_key(self.user.pk))
+		self.assertEqual(cached['email'], 'buyer@example.com')
+		self.assertNotIn('password', cached)
+		# Пользователь из кэша сохраняет только загруженные поля - пароль не затирается
+		self.assertEqual(self.client.put('/api/auth/profile/', {}).status_code, 200)
+		self.user.refresh_from_db()
+		self.assertTrue(self.user.check_password('pass12345'))
+
+	def test_user_change_invalidates_cache(self):
+		self.client.get('/api/auth/profile/')
+		self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+		self.user.email = 'new@example.com'
+		self.user.save()
+		self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+		self.assertEqual(self.client.get('/api/auth/profile/').json()['email'], 'new@example.com')
+
+		self.user.set_password('another-pass-1')
+		self.user.save()
+		self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+
+	def test_refresh_reads_claims_from_database(self):
+		refresh = str(ClaimsTokenObtainPairSerializer.get_token(self.user))
+		self.user.username = 'renamed'
+		self.user.save()
+		response = self.client.post('/api/auth/token/refresh/', {'refresh': refresh})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(AccessToken(response.json()['access'])['username'], 'renamed')
+		self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+		self.assertEqual(self.client.get('/api/auth/profile/').json()['username'], 'renamed')
+
+		self.user.is_active = False
+		self.user.save()
+		self.client.credentials()
+		response = self.client.post('/api/auth/token/refresh/', {'refresh': refresh})
+		self.assertEqual(response.status_code, 401)
+
+	def test_inactive_claim_rejected(self):
+		token = ClaimsTokenObtainPairSerializer.get_token(self.user).access_token
+		token['is_active'] = False
+		self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+		self.assertEqual(self.client.get('/api/orders/').status_code, 401)
+
+	def test_owner_check_by_id(self):
+		other = User.objects.create_user('other')
+		foreign = Order.objects.create(user=other, shipping_address='Kazan')
+		self.assertEqual(self.client.patch(f'/api/orders/{foreign.pk}/', {'status': 'cancelled'}).status_code, 404)
+		response = self.client.patch(f'/api/orders/{self.order.pk}/', {'shipping_address': 'Tula'})
+		self.assertEqual(response.status_code, 200)
+
+	def test_token_without_claims_still_accepted(self):
+		self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+		self.assertEqual(self.client.get('/api/orders/').json()['count'], 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN checks need PostgreSQL')
+@override_settings(CACHES=NO_CACHE)
+class QueryPlanTests(TestCase):
+	"""
+	Основной запрос каждого endpoint на большом наборе данных идёт по индексу:
+	в плане нет Seq Scan по большим таблицам и узлов Sort
+	"""
+	LARGE_TABLES = {'api_product', 'api_order', 'api_review', 'api_orderitem'}
+
+	@classmethod
+	def setUpTestData(cls):
+		call_command(
+			'generate_synthetic_data', users=400, categories=12, products=20000,
+			orders=30000, reviews=60000, stdout=StringIO(),
+		)
+		with connection.cursor() as cursor:
+			cursor.execute('ANALYZE')
+		cls.buyer = User.objects.annotate(n=Count('orders')).order_by('-n').first()
+		cls.reviewer = User.objects.annotate(n=Count('review')).order_by('-n').first()
+		cls.product = Product.objects.filter(is_available=True).order_by('-review_count').first()
+
+	def main_query(self, path, table, user=None):
+		"""SQL самого «тяжёлого» запроса endpoint: выборка строк из table с ORDER BY"""
+		client = APIClient()
+		if user is not None:
+			client.force_authenticate(user)
+		with CaptureQueriesContext(connection) as queries:
+			response = client.get(path)
+		self.assertEqual(response.status_code, 200, path)
+		candidates = [
+			query['sql'] for query in queries
+			if f'FROM "{table}"' in query['sql'] and 'ORDER BY' in query['sql']
+		]
+		self.assertTrue(candidates, f'No ordered query on {table} for {path}')
+		return candidates[-1]
+
+	def plan_nodes(self, sql):
+		with connection.cursor() as cursor:
+			cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+			plan = cursor.fetchone()[0]
+		plan = json.loads(plan) if isinstance(plan, str) else plan
+		stack, nodes = [plan[0]['Plan']], []
+		while stack:
+			node = stack.pop()
+			nodes.append(node)
+			stack.extend(node.get('Plans', ()))
+		return nodes
+
+	def assertIndexedPlan(self, path, table, user=None):
+		sql = self.main_query(path, table, user)
+		for node in self.plan_nodes(sql):
+			self.assertNotEqual(node['Node Type'], 'Sort', f'{path}: sort in plan of {sql}')
+			if node['Node Type'] == 'Seq Scan':
+				self.assertNotIn(node['Relation Name'], self.LARGE_TABLES, f'{path}: seq scan in plan of {sql}')
+
+	def test_product_list(self):
+		category = self.product.category_id
+		for query in (
+			'', '?category=%s' % category, '?roast_level=dark',
+			'?category=%s&roast_level=medium' % category,
+			'?ordering=price', '?ordering=-price', '?ordering=name', '?ordering=-created_at',
+			'?pagination=cursor', '?pagination=cursor&ordering=-price&roast_level=light',
+		):
+			with self.subTest(query=query):
+				self.assertIndexedPlan(f'/api/products/{query}', 'api_product')
+
+	def test_featured(self):
+		self.assertIndexedPlan('/api/products/featured/', 'api_product')
+
+	def test_product_reviews(self):
+		self.assertIndexedPlan(f'/api/products/{self.product.pk}/reviews/', 'api_review')
+
+	def test_order_list(self):
+		for query in ('', '?status=delivered', '?ordering=total_amount', '?ordering=-total_amount', '?pagination=cursor'):
+			with self.subTest(query=query):
+				self.assertIndexedPlan(f'/api/orders/{query}', 'api_order', self.buyer)
+
+	def test_review_list(self):
+		for query in ('', '?rating=5', '?pagination=cursor'):
+			with self.subTest(query=query):
+				self.assertIndexedPlan(f'/api/reviews/{query}', 'api_review', self.reviewer)
+
+
+class ImageVariantTests(TestCase):
+	def setUp(self):
+		media = tempfile.TemporaryDirectory()
+		self.addCleanup(media.cleanup)
+		override = override_settings(MEDIA_ROOT=media.name, CACHES=NO_CACHE)
+		override.enable()
+		self.addCleanup(override.disable)
+		self.category = Category.objects.create(name='Beans')
+
+	@staticmethod
+	def upload(name='beans.png', size=(2000, 1000), mode='RGBA'):
+		output = BytesIO()
+		Image.new(mode, size, (120, 80, 40, 255) if mode == 'RGBA' else (120, 80, 40)).save(output, format='PNG')
+		return SimpleUploadedFile(name, output.getvalue(), content_type='image/png')
+
+	def make_product(self):
+		product = Product.objects.create(
+			name='Kenya', description='Test', price=Decimal('10.00'),
+			category=self.category, origin='Kenya', image=self.upload(),
+		)
+		self.assertEqual(self.run_image_job(), {'product_id': product.pk, 'stale_variants': {}})
+		return Product.objects.get(pk=product.pk)
+
+	def run_image_job(self):
+		"""Выполняет задание на варианты, поставленное сигналом; возвращает его payload"""
+		[job] = claim_jobs('images', 10, 'test-worker')
+		self.assertEqual(job.name, 'images.build_variants')
+		self.assertEqual(run_job(job), Job.SUCCEEDED)
+		return job.payload
+
+	def test_variants_generated_and_served(self):
+		product = self.make_product()
+		variants = product.image_variants
+		self.assertEqual(set(variants), set(settings.PRODUCT_IMAGE_VARIANTS))
+		storage = Product._meta.get_field('image').storage
+		for variant, formats in variants.items():
+			self.assertEqual(set(formats), {'webp', 'jpeg'})
+			with storage.open(formats['webp']) as file, Image.open(file) as image:
+				self.assertEqual(image.format, 'WEBP')
+				self.assertEqual(max(image.size), min(settings.PRODUCT_IMAGE_VARIANTS[variant], 2000))
+
+		detail = self.client.get(f'/api/products/{product.pk}/').json()
+		self.assertTrue(detail['image_variants']['thumb']['webp'].startswith('http://testserver/media/products/variants/'))
+		listed = self.client.get('/api/products/').json()['results'][0]
+		self.assertEqual(listed['image_variants'], detail['image_variants'])
+
+	def test_new_image_replaces_variants(self):
+		product = self.make_product()
+		old = product.image_variants
+		product.image = self.upload('roast.png', size=(300, 300), mode='RGB')
+		product.save()
+		self.assertEqual(Product.objects.get(pk=product.pk).image_variants, {})
+
+		self.assertEqual(self.run_image_job(), {'product_id': product.pk, 'stale_variants': old})
+		new = Product.objects.get(pk=product.pk).image_variants
+		storage = Product._meta.get_field('image').storage
+		self.assertFalse(storage.exists(old['thumb']['webp']))
+		self.assertTrue(storage.exists(new['thumb']['jpeg']))
+
+		# Обычное сохранение без смены изображения не трогает карту вариантов
+		Product.objects.get(pk=product.pk).save()
+		self.assertFalse(Job.objects.filter(status=Job.PENDING).exists())
+		self.assertEqual(Product.objects.get(pk=product.pk).image_variants, new)
+
+		# Удаление товара ставит задание на удаление файлов вариантов
+		Product.objects.get(pk=product.pk).delete()
+		[job] = claim_jobs('images', 10, 'test-worker')
+		self.assertEqual(run_job(job), Job.SUCCEEDED)
+		self.assertFalse(storage.exists(new['thumb']['jpeg']))
+
+	def test_variant_paths_do_not_collide(self):
+		names = [(1, 'products/beans.jpg'), (1, 'products/beans.png'), (2, 'products/beans.jpg')]
+		paths = {variant_path(product_id, name, 'thumb', 'webp') for product_id, name in names}
+		self.assertEqual(len(paths), len(names))
+
+		first = self.make_product()
+		second = Product.objects.create(
+			name='Kenya', description='Test', price=Decimal('10.00'),
+			category=self.category, origin='Kenya', image=first.image.name,
+		)
+		self.run_image_job()
+		second.refresh_from_db()
+		storage = Product._meta.get_field('image').storage
+		self.assertNotEqual(second.image_variants['thumb']['webp'], first.image_variants['thumb']['webp'])
+		# Смена изображения второго товара удаляет только его варианты
+		stale = second.image_variants['thumb']['webp']
+		second.image = self.upload('beans.jpg', size=(300, 300), mode='RGB')
+		second.save()
+		self.run_image_job()
+		self.assertTrue(storage.exists(first.image_variants['thumb']['webp']))
+		self.assertFalse(storage.exists(stale))
+
+	def test_backfill_command(self):
+		product = self.make_product()
+		Product.objects.filter(pk=product.pk).update(image_variants={})
+		out = StringIO()
+
+		def submit(product_id, stale_variants=None):
+			# Потоки пула работают в своём соединении и не видят транзакцию теста
+			future = Future()
+			future.set_result(image_pipeline.process(product_id, stale_variants))
+			return future
+
+		with patch.object(image_pipeline, 'submit', side_effect=submit):
+			call_command('generate_image_variants', stdout=out)
+		self.assertIn('Processed 1 images', out.getvalue())
+		self.assertIn('thumb', Product.objects.get(pk=product.pk).image_variants)
+
+
+failures = {'left': 0}
+concurrency = {'active': 0, 'peak': 0, 'lock': threading.Lock()}
+
+
+@task('tests.flaky', max_attempts=3)
+def flaky_task(value):
+	"""Падает, пока не исчерпан счётчик failures"""
+	if failures['left'] > 0:
+		failures['left'] -= 1
+		raise RuntimeError(f'failure for {value}')
+
+
+@task('tests.slow', queue='tests')
+def slow_task():
+	with concurrency['lock']:
+		concurrency['active'] += 1
+		concurrency['peak'] = max(concurrency['peak'], concurrency['active'])
+	time.sleep(0.05)
+	with concurrency['lock']:
+		concurrency['active'] -= 1
+
+
+class JobQueueTests(TestCase):
+	def setUp(self):
+		failures['left'] = 0
+
+	def claim_one(self, queue='default'):
+		[job] = claim_jobs(queue, 10, 'test-worker')
+		return job
+
+	def test_idempotency_key(self):
+		first = enqueue('tests.flaky', {'value': 1}, key='flaky:1')
+		self.assertEqual(enqueue('tests.flaky', {'value': 2}, key='flaky:1').pk, first.pk)
+		self.assertNotEqual(enqueue('tests.flaky', {'value': 1}).pk, first.pk)
+		self.assertEqual(Job.objects.count(), 2)
+
+	def test_claim_respects_queue_limit_and_run_at(self):
+		for value in range(3):
+			flaky_task.enqueue(value=value)
+		flaky_task.enqueue(value=3, delay=timedelta(minutes=5))
+		slow_task.enqueue()
+
+		claimed = claim_jobs('default', 2, 'test-worker')
+		self.assertEqual([job.payload['value'] for job in claimed], [0, 1])
+		self.assertTrue(all(job.status == Job.RUNNING and job.attempts == 1 for job in claimed))
+		self.assertEqual([job.payload['value'] for job in claim_jobs('default', 10, 'other')], [2])
+		self.assertEqual(claim_jobs('default', 10, 'other'), [])
+
+	def test_retry_with_backoff_then_fail(self):
+		failures['left'] = 10
+		job = flaky_task.enqueue(value=1)
+		before = timezone.now()
+		with self.assertLogs('api.jobs', 'WARNING'):
+			self.assertEqual(run_job(self.claim_one()), Job.PENDING)
+		job.refresh_from_db()
+		self.assertIn('failure for 1', job.last_error)
+		# Первый повтор - через JOB_RETRY_BASE_DELAY * [0.5, 1) секунд
+		delay = (job.run_at - before).total_seconds()
+		self.assertTrue(settings.JOB_RETRY_BASE_DELAY * 0.5 <= delay <= settings.JOB_RETRY_BASE_DELAY + 1, delay)
+		self.assertEqual(claim_jobs('default', 10, 'test-worker'), [])
+
+		for _ in range(2):
+			Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+			with self.assertLogs('api.jobs', 'WARNING') as logs:
+				status = run_job(self.claim_one())
+		self.assertEqual(status, Job.FAILED)
+		self.assertIn('failed after 3 attempts', logs.output[0])
+		job.refresh_from_db()
+		self.assertEqual((job.attempts, job.locked_by), (3, ''))
+		self.assertIsNotNone(job.finished_at)
+
+	def test_success_after_retry(self):
+		failures['left'] = 1
+		job = flaky_task.enqueue(value=1)
+		with self.assertLogs('api.jobs', 'WARNING'):
+			self.assertEqual(run_job(self.claim_one()), Job.PENDING)
+		Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+		self.assertEqual(run_job(self.claim_one()), Job.SUCCEEDED)
+		job.refresh_from_db()
+		self.assertEqual((job.status, job.attempts, job.last_error), (Job.SUCCEEDED, 2, ''))
+
+	def test_unknown_task_fails_without_retry(self):
+		Job.objects.create(name='tests.missing')
+		with self.assertLogs('api.jobs', 'ERROR'):
+			self.assertEqual(run_job(self.claim_one()), Job.FAILED)
+
+	def test_stale_jobs_requeued_and_finished_purged(self):
+		old = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT + 1)
+		lost = Job.objects.create(name='tests.flaky', status=Job.RUNNING, attempts=1, locked_at=old, locked_by='dead')
+		exhausted = Job.objects.create(
+			name='tests.flaky', status=Job.RUNNING, attempts=5, max_attempts=5, locked_at=old, locked_by='dead',
+		)
+		alive = Job.objects.create(name='tests.flaky', status=Job.RUNNING, attempts=1, locked_at=timezone.now())
+		self.assertEqual(requeue_stale_jobs(), 2)
+		self.assertEqual(
+			dict(Job.objects.values_list('pk', 'status')),
+			{lost.pk: Job.PENDING, exhausted.pk: Job.FAILED, alive.pk: Job.RUNNING},
+		)
+
+		finished = timezone.now() - timedelta(days=settings.JOB_RETENTION_DAYS + 1)
+		Job.objects.filter(pk=lost.pk).update(status=Job.SUCCEEDED, finished_at=finished)
+		self.assertEqual(purge_finished_jobs(), 1)
+		self.assertFalse(Job.objects.filter(pk=lost.pk).exists())
+
+	def test_order_confirmation_sent_by_worker(self):
+		user = User.objects.create_user(username='buyer', password='pass12345', email='buyer@example.com')
+		category = Category.objects.create(name='Beans')
+		product = Product.objects.create(name='Kenya', description='Test', price=Decimal('10.50'), category=category, origin='Kenya')
+		client = APIClient()
+		client.force_authenticate(user)
+		response = client.post('/api/orders/', {
+			'shipping_address': 'Moscow', 'items': [{'product': product.pk, 'quantity': 2}],
+		}, format='json')
+		self.assertEqual(response.status_code, 201, response.content)
+		self.assertEqual(len(mail.outbox), 0)
+
+		job = Job.objects.get(name='orders.send_confirmation')
+		self.assertEqual(job.payload, {'order_id': response.data['id']})
+		self.assertEqual(job.idempotency_key, f'order-confirmation:{response.data["id"]}')
+		# Повторная постановка по тому же заказу возвращает то же задание
+		self.assertEqual(tasks.send_order_confirmation.enqueue(key=job.idempotency_key, order_id=response.data['id']).pk, job.pk)
+		for job in claim_jobs('default', 10, 'test-worker'):
+			self.assertEqual(run_job(job), Job.SUCCEEDED)
+		self.assertEqual(mail.outbox[0].to, ['buyer@example.com'])
+		self.assertIn('2 x Kenya - 10.50', mail.outbox[0].body)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'In-memory SQLite fails concurrent writers instead of waiting')
+class JobWorkerTests(TransactionTestCase):
+	"""Worker выполняет задания в потоках, у каждого своё соединение - нужны закоммиченные данные"""
+
+	def test_burst_worker_respects_concurrency(self):
+		concurrency['peak'] = 0
+		for _ in range(6):
+			slow_task.enqueue()
+		out = StringIO()
+		call_command('run_jobs', '--queue', 'tests=2', '--burst', '--poll-interval', '0.01', stdout=out)
+		self.assertIn('Processed 6 jobs', out.getvalue())
+		self.assertEqual(concurrency['peak'], 2)
+		self.assertEqual(Job.objects.filter(status=Job.SUCCEEDED).count(), 6)
+
+	def test_locked_jobs_skipped(self):
+		first, second = flaky_task.enqueue(value=1), flaky_task.enqueue(value=2)
+		locked, release = threading.Event(), threading.Event()
+
+		def hold_lock():
+			with transaction.atomic():
+				Job.objects.select_for_update().get(pk=first.pk)
+				locked.set()
+				release.wait(5)
+			connection.close()
+
+		holder = threading.Thread(target=hold_lock)
+		holder.start()
+		try:
+			locked.wait(5)
+			# Без SKIP LOCKED выборка ждала бы освобождения строки first
+			self.assertEqual([job.pk for job in claim_jobs('default', 10, 'test-worker')], [second.pk])
+		finally:
+			release.set()
+			holder.join()
+		self.assertEqual([job.pk for job in claim_jobs('default', 10, 'test-worker')], [first.pk])
+
+
+class StockReservationTests(TestCase):
+	def setUp(self):
+		self.client = APIClient()
+		self.user = User.objects.create_user('buyer')
+		self.client.force_authenticate(self.user)
+		category = Category.objects.create(name='Beans')
+		self.hot, self.other, self.untracked = [
+			Product.objects.create(
+				name=name, description='Test', price=Decimal('10.00'),
+				category=category, origin='Kenya', stock=stock,
+			)
+			for name, stock in (('Hot', 5), ('Other', 10), ('Untracked', None))
+		]
+
+	def place(self, *items):
+		return self.client.post('/api/orders/', {
+			'shipping_address': 'Moscow',
+			'items': [{'product': product.pk, 'quantity': quantity} for product, quantity in items],
+		}, format='json')
+
+	def stock(self):
+		return list(Product.objects.order_by('pk').values_list('stock', flat=True))
+
+	def test_order_reserves_stock(self):
+		response = self.place((self.hot, 2), (self.other, 3), (self.untracked, 100))
+		self.assertEqual(response.status_code, 201, response.content)
+		self.assertEqual(self.stock(), [3, 7, None])
+
+	def test_insufficient_stock_rolls_back_order(self):
+		response = self.place((self.other, 3), (self.hot, 6))
+		self.assertEqual(response.status_code, 400)
+		self.assertIn(f'Not enough stock for products: {self.hot.pk}', str(response.data['items']))
+		self.assertEqual(self.stock(), [5, 10, None])
+		self.assertFalse(Order.objects.exists())
+
+	def test_cancel_releases_and_reactivation_reserves(self):
+		order_id = self.place((self.hot, 5), (self.untracked, 1)).data['id']
+		self.assertEqual(self.client.patch(f'/api/orders/{order_id}/', {'status': 'cancelled'}).status_code, 200)
+		self.assertEqual(self.stock(), [5, 10, None])
+		# Повторное сохранение отменённого заказа ничего не возвращает второй раз
+		self.client.patch(f'/api/orders/{order_id}/', {'shipping_address': 'Kazan'})
+		self.assertEqual(self.stock(), [5, 10, None])
+
+		self.place((self.hot, 4))
+		response = self.client.patch(f'/api/orders/{order_id}/', {'status': 'pending'})
+		self.assertEqual(response.status_code, 400)
+		self.assertIn('status', response.data)
+		self.assertEqual(Order.objects.get(pk=order_id).status, 'cancelled')
+		self.assertEqual(self.stock(), [1, 10, None])
+
+	def test_delete_releases_stock(self):
+		order_id = self.place((self.hot, 3), (self.other, 2), (self.untracked, 1)).data['id']
+		self.assertEqual(self.stock(), [2, 8, None])
+		self.assertEqual(self.client.delete(f'/api/orders/{order_id}/').status_code, 204)
+		self.assertEqual(self.stock(), [5, 10, None])
+
+		# Отменённый заказ остатки уже вернул - удаление их не удваивает
+		order_id = self.place((self.hot, 3)).data['id']
+		self.client.patch(f'/api/orders/{order_id}/', {'status': 'cancelled'})
+		self.client.delete(f'/api/orders/{order_id}/')
+		self.assertEqual(self.stock(), [5, 10, None])
+
+	def test_reservation_invalidates_cached_product(self):
+		cache.clear()
+		url = f'/api/products/{self.hot.pk}/'
+		etag = self.client.get(url)['ETag']
+		with self.captureOnCommitCallbacks(execute=True):
+			self.place((self.hot, 2))
+		response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json()['stock'], 3)
+
+	def test_product_save_keeps_concurrent_reservations(self):
+		product = Product.objects.get(pk=self.hot.pk)
+		Product.reserve_stock({self.hot.pk: 2})
+		product.price = Decimal('12.00')
+		product.save()
+		self.assertEqual(Product.objects.get(pk=self.hot.pk).stock, 3)
+		# Явно заданный остаток записывается
+		product.stock = 50
+		product.save()
+		self.assertEqual(Product.objects.get(pk=self.hot.pk).stock, 50)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Concurrent writers need PostgreSQL')
+class StockContentionTests(TransactionTestCase):
+	"""Много покупателей одновременно заказывают один товар"""
+	BUYERS = 16
+	ATTEMPTS = 10
+	STOCK = 60
+
+	def test_no_oversell_under_contention(self):
+		category = Category.objects.create(name='Beans')
+		product = Product.objects.create(
+			name='Flash sale', description='Test', price=Decimal('10.00'),
+			category=category, origin='Kenya', stock=self.STOCK,
+		)
+		users = [User.objects.create_user(f'buyer{i}') for i in range(self.BUYERS)]
+		results = []
+		start = threading.Barrier(self.BUYERS)
+
+		def buy(user):
+			client = APIClient()
+			client.force_authenticate(user)
+			start.wait()
+			try:
+				for _ in range(self.ATTEMPTS):
+					response = client.post('/api/orders/', {
+						'shipping_address': 'Moscow', 'items': [{'product': product.pk, 'quantity': 1}],
+					}, format='json')
+					results.append(response.status_code)
+			finally:
+				connection.close()
+
+		threads = [threading.Thread(target=buy, args=(user,)) for user in users]
+		started = time.perf_counter()
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		elapsed = time.perf_counter() - started
+
+		self.assertEqual(sorted(set(results)), [201, 400])
+		self.assertEqual(results.count(201), self.STOCK)
+		self.assertEqual(Product.objects.get(pk=product.pk).stock, 0)
+		self.assertEqual(sum(OrderItem.objects.values_list('quantity', flat=True)), self.STOCK)
+		# Покупатели не выстраиваются в очередь на блокировке: 160 заказов с запасом укладываются в секунды
+		self.assertLess(elapsed, 20, f'{len(results)} orders took {elapsed:.1f}s')
+
+
+class SalesAnalyticsTests(TestCase):
+	def setUp(self):
+		self.staff = User.objects.create_user('manager', is_staff=True)
+		self.buyer = User.objects.create_user('buyer')
+		self.client = APIClient()
+		self.client.force_authenticate(self.buyer)
+		beans, capsules = Category.objects.create(name='Beans'), Category.objects.create(name='Capsules')
+		self.kenya, self.brazil, self.pods = [
+			Product.objects.create(name=name, description='Test', price=price, category=category, origin='Kenya')
+			for name, price, category in (
+				('Kenya', Decimal('10.00'), beans), ('Brazil', Decimal('8.00'), beans), ('Pods', Decimal('5.00'), capsules),
+			)
+		]
+		self.beans, self.capsules = beans, capsules
+		self.today = timezone.localdate()
+
+	def place(self, *items, days_ago=0):
+		order_id = self.client.post('/api/orders/', {
+			'shipping_address': 'Moscow',
+			'items': [{'product': product.pk, 'quantity': quantity} for product, quantity in items],
+		}, format='json').data['id']
+		if days_ago:
+			Order.objects.filter(pk=order_id).update(created_at=timezone.now() - timedelta(days=days_ago))
+		return order_id
+
+	def run_jobs(self):
+		while jobs := claim_jobs('default', 100, 'test-worker'):
+			for job in jobs:
+				self.assertEqual(run_job(job), Job.SUCCEEDED)
+
+	def report(self, **params):
+		client = APIClient()
+		client.force_authenticate(self.staff)
+		response = client.get('/api/analytics/', params)
+		self.assertEqual(response.status_code, 200, response.content)
+		return response.json()
+
+	def rollups(self):
+		"""Непустые строки сводок; после смены статуса в прежнем остаются нулевые строки"""
+		return {
+			model.__name__: sorted(model.objects.exclude(orders=0).values_list(*fields, 'orders', 'units', 'revenue'))
+			for model, fields in (
+				(DailySales, ('date', 'status')),
+				(DailyCategorySales, ('date', 'category_id', 'status')),
+				(DailyProductSales, ('date', 'product_id', 'status')),
+			)
+		}
+
+	def test_incremental_rollups_and_report(self):
+		self.place((self.kenya, 2), (self.brazil, 1), (self.pods, 4))
+		self.place((self.kenya, 1), days_ago=2)
+		cancelled = self.place((self.pods, 10))
+		self.client.patch(f'/api/orders/{cancelled}/', {'status': 'cancelled'})
+		self.run_jobs()
+
+		daily = self.report()
+		self.assertEqual(daily['totals'], {'orders': 2, 'units': 8, 'revenue': '58.00'})
+		self.assertEqual(daily['results'], [
+			{'period': str(self.today - timedelta(days=2)), 'orders': 1, 'units': 1, 'revenue': '10.00'},
+			{'period': str(self.today), 'orders': 1, 'units': 7, 'revenue': '48.00'},
+		])
+		# Заказ с двумя товарами категории учитывается в ней один раз
+		by_category = self.report(group_by='category', interval='total')
+		self.assertEqual(by_category['results'], [
+			{'category': self.beans.pk, 'name': 'Beans', 'orders': 2, 'units': 4, 'revenue': '38.00'},
+			{'category': self.capsules.pk, 'name': 'Capsules', 'orders': 1, 'units': 4, 'revenue': '20.00'},
+		])
+		cancelled_only = self.report(status='cancelled', group_by='product', id=[self.pods.pk], interval='total')
+		self.assertEqual(cancelled_only['results'], [
+			{'product': self.pods.pk, 'name': 'Pods', 'orders': 1, 'units': 10, 'revenue': '50.00'},
+		])
+		monthly = self.report(status=['pending', 'cancelled'], interval='month')
+		self.assertEqual(monthly['totals'], {'orders': 3, 'units': 18, 'revenue': '108.00'})
+
+	def test_sync_is_idempotent_and_matches_rebuild(self):
+		first = self.place((self.kenya, 2), (self.pods, 1))
+		self.place((self.brazil, 3), days_ago=40)
+		Order.objects.create(user=self.buyer, shipping_address='Tula')  # Без позиций - только в DailySales
+		self.run_jobs()
+		self.client.patch(f'/api/orders/{first}/', {'status': 'shipped'})
+		self.run_jobs()
+		incremental = self.rollups()
+
+		# Повторное задание по уже учтённому заказу ничего не меняет
+		tasks.sync_order_rollups.enqueue(order_id=first)
+		self.run_jobs()
+		self.assertEqual(self.rollups(), incremental)
+
+		out = StringIO()
+		call_command('rebuild_sales_rollups', stdout=out)
+		self.assertIn('from 3 orders', out.getvalue())
+		self.assertEqual(self.rollups(), incremental)
+
+	def test_deleted_order_subtracted(self):
+		order_id = self.place((self.kenya, 1))
+		self.run_jobs()
+		Order.objects.get(pk=order_id).delete()
+		self.assertEqual(self.report()['totals'], {'orders': 0, 'units': 0, 'revenue': '0.00'})
+
+	def test_query_count_independent_of_orders(self):
+		for _ in range(5):
+			self.place((self.kenya, 1), (self.pods, 2))
+		self.run_jobs()
+		client = APIClient()
+		client.force_authenticate(self.staff)
+		# Итоги и строки из сводки; при group_by ещё названия
+		with self.assertNumQueries(2):
+			client.get('/api/analytics/', {'date_from': str(self.today - timedelta(days=365))})
+		with self.assertNumQueries(3):
+			client.get('/api/analytics/', {'group_by': 'product'})
+
+	def test_staff_only_and_validation(self):
+		self.assertEqual(self.client.get('/api/analytics/').status_code, 403)
+		client = APIClient()
+		client.force_authenticate(self.staff)
+		self.assertEqual(client.get('/api/analytics/', {'date_from': '2026-02-01', 'date_to': '2026-01-01'}).status_code, 400)
+		self.assertEqual(client.get('/api/analytics/', {'id': '1'}).status_code, 400)
+		self.assertEqual(client.get('/api/analytics/', {'status': 'lost'}).status_code, 400)
+
+
+class OrderExportTests(TestCase):
+	def setUp(self):
+		self.buyer = User.objects.create_user('buyer')
+		self.other = User.objects.create_user('other')
+		self.staff = User.objects.create_user('manager', is_staff=True)
+		category = Category.objects.create(name='Beans')
+		self.kenya = Product.objects.create(name='=Kenya', description='Test', price=Decimal('10.00'), category=category, origin='Kenya')
+		self.brazil = Product.objects.create(name='Brazil', description='Test', price=Decimal('8.50'), category=category, origin='Brazil')
+		self.orders = []
+		for user, status, items in (
+			(self.buyer, 'pending', [(self.kenya, 2), (self.brazil, 1)]),
+			(self.buyer, 'delivered', [(self.brazil, 3)]),
+			(self.buyer, 'cancelled', []),
+			(self.other, 'pending', [(self.kenya, 1)]),
+		):
+			order = Order.objects.create(
+				user=user, status=status, shipping_address='Moscow',
+				total_amount=sum(product.price * quantity for product, quantity in items),
+			)
+			OrderItem.objects.bulk_create(
+				OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+				for product, quantity in items
+			)
+			self.orders.append(order)
+
+	def export(self, client_user, **params):
+		client = APIClient()
+		client.force_authenticate(client_user)
+		response = client.get('/api/orders/export/', params)
+		self.assertEqual(response.status_code, 200)
+		return response, b''.join(response.streaming_content).decode()
+
+	def test_csv_streams_own_orders(self):
+		response, content = self.export(self.buyer)
+		self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+		self.assertIn('attachment; filename="orders-', response['Content-Disposition'])
+		rows = list(csv.DictReader(StringIO(content)))
+		self.assertEqual(
+			[(int(row['order_id']), row['status'], row['product_name'], row['quantity'], row['price']) for row in rows],
+			[
+				(self.orders[0].pk, 'pending', "'=Kenya", '2', '10.00'),
+				(self.orders[0].pk, 'pending', 'Brazil', '1', '8.50'),
+				(self.orders[1].pk, 'delivered', 'Brazil', '3', '8.50'),
+				(self.orders[2].pk, 'cancelled', '', '', ''),
+			],
+		)
+		self.assertEqual(rows[0]['total_amount'], '28.50')
+
+	def test_ndjson_matches_api_representation(self):
+		_, content = self.export(self.buyer, export_format='ndjson', status=['pending', 'delivered'])
+		exported = [json.loads(line) for line in content.splitlines()]
+		self.assertEqual([order['id'] for order in exported], [self.orders[0].pk, self.orders[1].pk])
+
+		client = APIClient()
+		client.force_authenticate(self.buyer)
+		detail = client.get(f'/api/orders/{self.orders[0].pk}/').json()
+		for field in ('status', 'total_amount', 'shipping_address', 'created_at', 'updated_at'):
+			self.assertEqual(exported[0][field], detail[field])
+		self.assertEqual(
+			[(item['product'], item['quantity'], item['price']) for item in exported[0]['items']],
+			[(item['product'], item['quantity'], item['price']) for item in sorted(detail['items'], key=lambda item: item['id'])],
+		)
+
+	def test_staff_exports_all_and_date_filters(self):
+		_, content = self.export(self.staff, export_format='ndjson')
+		self.assertEqual(len(content.splitlines()), 4)
+		_, content = self.export(self.staff, export_format='ndjson', user=self.other.pk)
+		self.assertEqual([json.loads(line)['user'] for line in content.splitlines()], ['other'])
+
+		Order.objects.filter(pk=self.orders[0].pk).update(created_at=timezone.now() - timedelta(days=10))
+		today = timezone.localdate()
+		_, content = self.export(self.buyer, export_format='ndjson', created_to=str(today - timedelta(days=1)))
+		self.assertEqual([json.loads(line)['id'] for line in content.splitlines()], [self.orders[0].pk])
+		_, content = self.export(self.buyer, export_format='ndjson', created_from=str(today))
+		self.assertEqual(len(content.splitlines()), 2)
+
+	@override_settings(ORDER_EXPORT_CHUNK_SIZE=2)
+	def test_reads_in_chunks(self):
+		client = APIClient()
+		client.force_authenticate(self.staff)
+		response = client.get('/api/orders/export/')
+		# Заказы и пользователи - один запрос (курсор), позиции - по запросу на порцию из 2 заказов
+		with self.assertNumQueries(3):
+			content = b''.join(response.streaming_content)
+		self.assertEqual(content.count(b'\n'), 6)
+
+	@override_settings(ORDER_EXPORT_CHUNK_SIZE=3)
+	def test_reads_by_key_without_server_side_cursors(self):
+		client = APIClient()
+		client.force_authenticate(self.staff)
+		with patch.dict(connection.settings_dict, DISABLE_SERVER_SIDE_CURSORS=True):
+			response = client.get('/api/orders/export/', {'export_format': 'ndjson'})
+			# Порции из 3 и 1 заказа (заказы и позиции), затем пустая порция
+			with self.assertNumQueries(5):
+				content = b''.join(response.streaming_content)
+		self.assertEqual([json.loads(line)['id'] for line in content.splitlines()], [order.pk for order in self.orders])
+
+	async def test_asgi_streams_async_iterator(self):
+		# Синхронный итератор Django под ASGI собрал бы в список целиком
+		token = await sync_to_async(AccessToken.for_user)(self.staff)
+		response = await AsyncClient().get('/api/orders/export/', headers={'Authorization': f'Bearer {token}'})
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.is_async)
+		content = b''.join([chunk async for chunk in response.streaming_content])
+		_, expected = await sync_to_async(self.export)(self.staff)
+		self.assertEqual(content.decode(), expected)
+
+	def test_validation_and_authentication(self):
+		client = APIClient()
+		self.assertEqual(client.get('/api/orders/export/').status_code, 401)
+		client.force_authenticate(self.buyer)
+		self.assertEqual(client.get('/api/orders/export/', {'export_format': 'xml'}).status_code, 400)
+		self.assertEqual(
+			client.get('/api/orders/export/', {'created_from': '2026-02-01', 'created_to': '2026-01-01'}).status_code, 400,
+		)
+
+
+class OpenAPISchemaTests(TestCase):
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.path = os.path.join(directory.name, 'openapi.json')
+		settings_override = override_settings(OPENAPI_SCHEMA_FILE=self.path)
+		settings_override.enable()
+		self.addCleanup(settings_override.disable)
+		precomputed_schema.reset()
+		self.addCleanup(precomputed_schema.reset)
+
+	def test_served_from_generated_file(self):
+		call_command('generate_openapi_schema', stdout=StringIO())
+		with open(self.path, 'rb') as schema_file:
+			content = schema_file.read()
+		schema = json.loads(content)
+		self.assertEqual(schema['x-code-version'], code_version())
+		self.assertIn('/products/', schema['paths'])
+		self.assertNotIn('host', schema)
+
+		with patch('api.openapi.generate_schema') as generate:
+			response = self.client.get('/swagger/', {'format': 'openapi'})
+			self.assertEqual(response.status_code, 200)
+			self.assertEqual(response.content, content)
+			self.assertEqual(response['Cache-Control'], 'no-cache')
+
+			response = self.client.get('/swagger/', {'format': 'openapi'}, HTTP_IF_NONE_MATCH=response['ETag'])
+			self.assertEqual(response.status_code, 304)
+			self.assertEqual(self.client.get('/redoc/', {'format': 'yaml'}).content.split(b'\n')[0], b"swagger: '2.0'")
+		generate.assert_not_called()
+		self.assertEqual(self.client.get('/swagger/').status_code, 200)
+
+	def test_regenerated_when_code_version_changes(self):
+		with open(self.path, 'w') as schema_file:
+			json.dump({'swagger': '2.0', 'paths': {}, 'x-code-version': 'previous'}, schema_file)
+
+		response = self.client.get('/swagger/', {'format': 'openapi'})
+		self.assertIn('/orders/export/', response.json()['paths'])
+		with open(self.path, 'rb') as schema_file:
+			self.assertEqual(schema_file.read(), response.content)
+
+	def test_command_skips_up_to_date_schema(self):
+		call_command('generate_openapi_schema', stdout=StringIO())
+		output = StringIO()
+		with patch('api.management.commands.generate_openapi_schema.generate_schema') as generate:
+			call_command('generate_openapi_schema', stdout=output)
+		generate.assert_not_called()
+		self.assertIn('up to date', output.getvalue())
+
+	@override_settings(CODE_VERSION='build-42')
+	def test_code_version_from_settings(self):
+		code_version.cache_clear()
+		self.addCleanup(code_version.cache_clear)
+		self.assertEqual(code_version(), 'build-42')
+
+
+@override_settings(DATABASE_REPLICAS={'replica_1': 3, 'replica_2': 1}, READ_YOUR_WRITES_SECONDS=10)
+class ReplicaRouterTests(SimpleTestCase):
+	# Без транзакции TestCase: внутри неё все чтения идут в основную БД
+	databases = {'default'}
+
+	def setUp(self):
+		self.router = ReplicaRouter()
+		self.buyer = User(pk=1, username='buyer')
+		cache.clear()
+
+	def request(self, method='get', user=None):
+		request = getattr(RequestFactory(), method)('/api/products/')
+		request.user = user or AnonymousUser()
+		return request
+
+	def test_safe_catalog_reads_go_to_weighted_replicas(self):
+		chosen = Counter()
+		for _ in range(2000):
+			with read_routing(self.request()):
+				alias = self.router.db_for_read(Product)
+				# Все чтения запроса - из одной реплики
+				self.assertEqual(self.router.db_for_read(Review), alias)
+				self.assertEqual(self.router.db_for_read(Order), 'default')
+			chosen[alias] += 1
+		self.assertEqual(set(chosen), {'replica_1', 'replica_2'})
+		self.assertAlmostEqual(chosen['replica_1'] / 2000, 0.75, delta=0.05)
+
+	def test_primary_outside_requests_transactions_and_writes(self):
+		self.assertEqual(self.router.db_for_read(Product), 'default')
+		with read_routing(self.request('post', self.buyer)):
+			self.assertEqual(self.router.db_for_read(Product), 'default')
+		with read_routing(self.request()):
+			with primary_reads():
+				self.assertEqual(self.router.db_for_read(Product), 'default')
+			with patch.object(connection, 'in_atomic_block', True):
+				self.assertEqual(self.router.db_for_read(Product), 'default')
+			self.assertEqual(self.router.db_for_write(Product), 'default')
+			self.assertEqual(self.router.db_for_read(Product), 'default')
+
+	def test_reads_your_writes_after_write(self):
+		with read_routing(self.request('post', self.buyer)):
+			self.router.db_for_write(Review)
+		with read_routing(self.request(user=self.buyer)):
+			self.assertEqual(self.router.db_for_read(Review), 'default')
+		with read_routing(self.request(user=User(pk=2, username='other'))):
+			self.assertNotEqual(self.router.db_for_read(Review), 'default')
+
+		cache.delete(primary_key(self.buyer.pk))  # Прошло READ_YOUR_WRITES_SECONDS
+		with read_routing(self.request(user=self.buyer)):
+			self.assertNotEqual(self.router.db_for_read(Review), 'default')
+
+	def test_catalog_change_marks_replicas_stale(self):
+		self.assertFalse(catalog_changed_recently())
+		bump_catalog_version()
+		self.assertTrue(catalog_changed_recently())
+
+	def test_replicas_are_not_migrated(self):
+		self.assertTrue(self.router.allow_migrate('default', 'api'))
+		self.assertFalse(self.router.allow_migrate('replica_1', 'api'))
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'DB_REPLICAS is not configured')
+class ReplicaRoutingTests(TransactionTestCase):
+	"""С DB_REPLICAS реплики в тестах - зеркала тестовой БД"""
+	databases = '__all__'
+
+	def setUp(self):
+		cache.clear()
+		self.category = Category.objects.create(name='Beans')
+		self.product = Product.objects.create(
+			name='Kenya', description='Test', price=Decimal('10.00'), category=self.category, origin='Kenya',
+		)
+		self.buyer = User.objects.create_user('buyer')
+		self.client = APIClient()
+		self.client.force_authenticate(self.buyer)
+		cache.delete(CATALOG_CHANGED_KEY)  # Реплики успели получить товар из setUp
+
+	def test_counts_queries_per_alias(self):
+		performance_registry.reset()
+		response = self.client.get('/api/products/')
+		self.assertEqual(response.status_code, 200)
+		self.assertRegex(response['Server-Timing'], r'db-replica_\d+;desc="\d+ queries"')
+		stats = performance_registry.snapshot()['GET /api/products/']
+		self.assertTrue(any(alias.startswith('replica_') for alias in stats['queries_by_alias']))
+
+	async def test_asgi_request_reads_from_replica(self):
+		self.assertTrue(iscoroutinefunction(ReadReplicaMiddleware(PerformanceMiddlewareTests.async_view)))
+		response = await AsyncClient().get('/api/products/')
+		self.assertEqual(response.status_code, 200)
+		self.assertRegex(response['Server-Timing'], r'db-replica_\d+;desc="\d+ queries"')
+
+	def test_own_review_is_read_from_primary(self):
+		response = self.client.post('/api/reviews/', {'product': self.product.pk, 'rating': 5, 'comment': 'Good'})
+		self.assertEqual(response.status_code, 201)
+		response = self.client.get('/api/reviews/')
+		self.assertEqual(response.json()['results'][0]['id'], Review.objects.get().pk)
+		self.assertNotIn('db-replica', response['Server-Timing'])
+
+
+class ProductMultiGetTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		category = Category.objects.create(name='Beans')
+		self.products = [
+			Product.objects.create(name=f'Product {i}', description='Test', price=Decimal('10.00') + i, category=category, origin='Kenya')
+			for i in range(12)
+		]
+		self.hidden = Product.objects.create(
+			name='Hidden', description='Test', price=Decimal('5.00'), category=category, origin='Kenya', is_available=False,
+		)
+
+	def test_returns_requested_products_in_order(self):
+		ids = [product.pk for product in reversed(self.products[1:])]
+		query = ','.join(map(str, ids + [self.hidden.pk, 999999, ids[0]]))
+		# Валидаторы ETag и сами товары; страниц и COUNT нет
+		with self.assertNumQueries(2):
+			response = self.client.get('/api/products/', {'ids': query})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual([product['id'] for product in response.json()], ids)
+
+		response = self.client.get('/api/products/', {'ids': query, 'ordering': 'price'})
+		self.assertEqual([product['id'] for product in response.json()], sorted(ids))
+		self.assertEqual(response['X-Cache'], 'MISS')
+
+	def test_invalid_ids(self):
+		self.assertEqual(self.client.get('/api/products/', {'ids': '1,abc'}).status_code, 400)
+		# Пустой список не отдаёт весь каталог без пагинации
+		for ids in ('', ','):
+			response = self.client.get('/api/products/', {'ids': ids})
+			self.assertEqual(response.status_code, 400, ids)
+			self.assertIn('ids', response.json())
+		with override_settings(PRODUCT_MULTI_GET_MAX_IDS=2):
+			response = self.client.get('/api/products/', {'ids': '1,2,3'})
+		self.assertEqual(response.status_code, 400)
+		self.assertIn('ids', response.json())
+
+
+class BatchRequestTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = User.objects.create_user('buyer', 'buyer@example.com')
+		category = Category.objects.create(name='Beans')
+		self.product = Product.objects.create(
+			name='Kenya', description='Test', price=Decimal('10.00'), category=category, origin='Kenya',
+		)
+		Review.objects.create(product=self.product, user=self.user, rating=5, comment='Good')
+		self.client = APIClient()
+		token = ClaimsTokenObtainPairSerializer.get_token(self.user).access_token
+		self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+	def batch(self, *paths, client=None):
+		return (client or self.client).post(
+			'/api/batch/', {'requests': [{'path': path} for path in paths]}, format='json',
+		)
+
+	def test_runs_subrequests_with_shared_authentication(self):
+		authenticate = ClaimsJWTAuthentication.authenticate
+		with patch.object(ClaimsJWTAuthentication, 'authenticate', autospec=True, side_effect=authenticate) as spy:
+			response = self.batch(
+				f'/api/products/?ids={self.product.pk}',
+				f'/api/products/{self.product.pk}/reviews/',
+				'/api/auth/profile/',
+				'/api/reviews/?ordering=-rating',
+				'/api/products/999999/',
+				'/api/unknown/',
+			)
+		self.assertEqual(response.status_code, 200)
+		# Токен проверяется один раз на пакет
+		self.assertEqual(spy.call_count, 1)
+
+		products, reviews, profile, own_reviews, missing, unknown = response.json()['responses']
+		self.assertEqual(products['status'], 200)
+		self.assertEqual(products['body'], self.client.get('/api/products/', {'ids': self.product.pk}).json())
+		self.assertIn('ETag', products['headers'])
+		self.assertEqual(reviews['body']['results'][0]['comment'], 'Good')
+		self.assertEqual(profile['body']['username'], 'buyer')
+		self.assertEqual(own_reviews['body']['count'], 1)
+		self.assertEqual((missing['status'], unknown['status']), (404, 404))
+
+	def test_anonymous_batch_and_permissions(self):
+		response = self.batch(f'/api/products/{self.product.pk}/', '/api/auth/profile/', client=APIClient())
+		product, profile = response.json()['responses']
+		self.assertEqual((product['status'], profile['status']), (200, 401))
+
+	def test_repeated_subrequests_run_once(self):
+		path = f'/api/products/{self.product.pk}/reviews/'
+		with CaptureQueriesContext(connection) as single:
+			self.batch(path)
+		with self.assertNumQueries(len(single)):
+			response = self.batch(path, path, path)
+		self.assertEqual(len({json.dumps(item) for item in response.json()['responses']}), 1)
+
+	def test_unsupported_subrequests(self):
+		_, nested, export = self.batch(
+			f'/api/products/{self.product.pk}/', '/api/batch/', '/api/orders/export/',
+		).json()['responses']
+		self.assertEqual((nested['status'], export['status']), (400, 400))
+
+		self.assertEqual(self.batch('/admin/').status_code, 400)
+		self.assertEqual(self.batch().status_code, 400)
+		response = self.client.post('/api/batch/', {'requests': [{'method': 'POST', 'path': '/api/orders/'}]}, format='json')
+		self.assertEqual(response.status_code, 400)
+		with override_settings(BATCH_MAX_REQUESTS=2):
+			self.assertEqual(self.batch('/api/products/', '/api/categories/', '/api/reviews/').status_code, 400)
+
+
+class JSONRenderingTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		category = Category.objects.create(name='Beans')
+		for i in range(30):
+			Product.objects.create(
+				name=f'Product {i}', description='Chocolate notes ' * 5, price=Decimal('10.50') + i, category=category, origin='Kenya',
+			)
+
+	def test_same_output_as_json_renderer(self):
+		moment = timezone.now().replace(microsecond=123456)
+		data = ReturnDict({
+			'price': Decimal('10.50'), 'utc': moment, 'moscow': moment.astimezone(ZoneInfo('Europe/Moscow')),
+			'naive': moment.replace(tzinfo=None), 'whole_second': moment.replace(microsecond=0),
+			'date': moment.date(), 'time': moment.time(), 'duration': timedelta(minutes=90),
+			'uuid': uuid.UUID(int=1), 'lazy': gettext_lazy('Order'), 'queryset': Category.objects.values_list('name', flat=True),
+			'text': 'Кофе «Эфиопия»', 'keys': {1: 'one', None: 'none'}, 'nested': [None, True, 1.5, (1, 2)],
+			'huge': 2 ** 70,
+		}, serializer=None)
+		self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+		self.assertEqual(ORJSONRenderer().render(data, 'application/json; indent=2'), JSONRenderer().render(data, 'application/json; indent=2'))
+		self.assertEqual(ORJSONRenderer().render(None), b'')
+
+	def test_product_page_rendered_with_orjson(self):
+		response = self.client.get('/api/products/', {'page_size': 30})
+		self.assertIsInstance(response.accepted_renderer, ORJSONRenderer)
+		self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+	def test_parses_json_bodies(self):
+		user = User.objects.create_user('buyer', 'buyer@example.com')
+		client = APIClient()
+		client.force_authenticate(user)
+		product = Product.objects.first()
+		response = client.post('/api/reviews/', {'product': product.pk, 'rating': 5, 'comment': 'Кофе'}, format='json')
+		self.assertEqual(response.status_code, 201, response.content)
+		self.assertEqual(Review.objects.get().comment, 'Кофе')
+
+		response = client.post('/api/reviews/', b'{"rating": NaN}', content_type='application/json')
+		self.assertEqual(response.status_code, 400)
+		self.assertIn('JSON parse error', response.json()['detail'])
+
+
+class ResponseCompressionTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		category = Category.objects.create(name='Beans')
+		for i in range(30):
+			Product.objects.create(
+				name=f'Product {i}', description='Chocolate notes ' * 5, price=Decimal('10.50') + i, category=category, origin='Kenya',
+			)
+
+	def test_large_responses_are_gzipped(self):
+		plain = self.client.get('/api/products/', {'page_size': 30})
+		self.assertNotIn('Content-Encoding', plain)
+
+		response = self.client.get('/api/products/', {'page_size': 30}, HTTP_ACCEPT_ENCODING='gzip, br')
+		self.assertEqual(response['Content-Encoding'], 'gzip')
+		self.assertIn('Accept-Encoding', response['Vary'])
+		self.assertLess(len(response.content), len(plain.content))
+		self.assertEqual(gzip.decompress(response.content), plain.content)
+
+		# Сжатие делает ETag слабым; условный запрос с ним по-прежнему даёт 304
+		self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+		response = self.client.get(
+			'/api/products/', {'page_size': 30}, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'],
+		)
+		self.assertEqual(response.status_code, 304)
+
+	def test_small_responses_are_not_compressed(self):
+		product = Product.objects.first()
+		response = self.client.get(f'/api/products/{product.pk}/', HTTP_ACCEPT_ENCODING='gzip')
+		self.assertLess(len(response.content), settings.RESPONSE_COMPRESSION_MIN_BYTES)
+		self.assertNotIn('Content-Encoding', response)
+
+		with override_settings(RESPONSE_COMPRESSION_MIN_BYTES=100):
+			response = self.client.get(f'/api/products/{product.pk}/', HTTP_ACCEPT_ENCODING='gzip')
+		self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+class CoPurchaseIndexTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.client = APIClient()
+		self.client.force_authenticate(User.objects.create_user('buyer'))
+		category = Category.objects.create(name='Beans')
+		self.a, self.b, self.c, self.d = [
+			Product.objects.create(name=name, description='Test', price=Decimal('10.00'), category=category, origin='Kenya')
+			for name in ('A', 'B', 'C', 'D')
+		]
+
+	def place(self, *products):
+		return self.client.post('/api/orders/', {
+			'shipping_address': 'Moscow', 'items': [{'product': product.pk, 'quantity': 1} for product in products],
+		}, format='json').data['id']
+
+	def run_jobs(self):
+		while jobs := claim_jobs('default', 100, 'test-worker'):
+			for job in jobs:
+				self.assertEqual(run_job(job), Job.SUCCEEDED)
+
+	def recommended(self, product):
+		response = self.client.get(f'/api/products/{product.pk}/frequently-bought-together/')
+		self.assertEqual(response.status_code, 200, response.content)
+		return [item['name'] for item in response.json()]
+
+	def index(self):
+		return dict(ProductCoPurchase.objects.values_list('product_id', 'neighbours'))
+
+	def test_incremental_updates_and_endpoint(self):
+		self.place(self.a, self.b, self.c)
+		second = self.place(self.a, self.b)
+		self.place(self.a, self.d)
+		cancelled = self.place(self.a, self.c)
+		self.client.patch(f'/api/orders/{cancelled}/', {'status': 'cancelled'})
+		self.place(self.b)
+		self.run_jobs()
+
+		# Товар, строка индекса и товары-соседи по первичному ключу
+		with self.assertNumQueries(3):
+			self.assertEqual(self.recommended(self.a), ['B', 'C', 'D'])
+		self.assertEqual(self.recommended(self.d), ['A'])
+		self.assertEqual(self.index()[self.a.pk], [[self.b.pk, 2], [self.c.pk, 1], [self.d.pk, 1]])
+
+		self.client.patch(f'/api/orders/{second}/', {'status': 'cancelled'})
+		self.client.patch(f'/api/orders/{cancelled}/', {'status': 'pending'})
+		self.run_jobs()
+		self.assertEqual(self.index()[self.a.pk], [[self.c.pk, 2], [self.b.pk, 1], [self.d.pk, 1]])
+
+		# Снятые с продажи соседи не показываются; rebuild даёт те же счётчики
+		Product.objects.filter(pk=self.c.pk).update(is_available=False)
+		with override_settings(CO_PURCHASE_TOP_K=1):
+			self.assertEqual(self.recommended(self.a), ['B'])
+		incremental = self.index()
+		call_command('rebuild_co_purchase_index', batch_size=2, stdout=StringIO())
+		self.assertEqual(self.index(), incremental)
+
+		Order.objects.get(pk=cancelled).delete()
+		self.assertEqual(self.index()[self.a.pk], [[self.b.pk, 1], [self.c.pk, 1], [self.d.pk, 1]])
+		self.assertEqual(self.client.get('/api/products/999999/frequently-bought-together/').status_code, 404)
+
+	def test_rebuild_counts_bulk_loaded_orders(self):
+		user = User.objects.get()
+		orders = Order.objects.bulk_create([
+			Order(user=user, shipping_address='Moscow', status=status) for status in ('delivered', 'delivered', 'cancelled')
+		])
+		OrderItem.objects.bulk_create([
+			OrderItem(order=order, product=product, price=product.price)
+			for order, products in zip(orders, ((self.a, self.b, self.c), (self.a, self.b), (self.a, self.d)))
+			for product in products
+		])
+		output = StringIO()
+		call_command('rebuild_co_purchase_index', stdout=output)
+		self.assertIn('3 products, 6 pairs', output.getvalue())
+		self.assertEqual(self.index()[self.a.pk], [[self.b.pk, 2], [self.c.pk, 1]])
+		self.assertEqual(
+			list(Order.objects.order_by('pk').values_list('co_purchase_counted', flat=True)), [True, True, False],
+		)
+
+	def test_space_saving_keeps_frequent_neighbours(self):
+		neighbours = merge_neighbours([], [1, 2], 1, slots=2)
+		self.assertEqual(neighbours, [[1, 1], [2, 1]])
+		# Список заполнен: новый сосед вытесняет самого редкого и наследует его счётчик
+		neighbours = merge_neighbours(neighbours, [1, 3], 1, slots=2)
+		self.assertEqual(neighbours, [[1, 2], [3, 2]])
+		# Вытесненную пару вычитать не из чего
+		self.assertEqual(merge_neighbours(neighbours, [2, 3], -1, slots=2), [[1, 2], [3, 1]])
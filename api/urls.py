@@ -3,7 +3,8 @@ from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import (
 	CategoryViewSet, ProductViewSet, OrderViewSet,
-	ReviewViewSet, UserRegistrationView, UserProfileView
+	ReviewViewSet, UserRegistrationView, UserProfileView, PerformanceStatsView, SalesAnalyticsView,
+	BatchView,
 )
 
 router = DefaultRouter()
@@ -18,4 +19,7 @@ urlpatterns = [
 	path('auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
 	path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 	path('auth/profile/', UserProfileView.as_view(), name='user_profile'),
+	path('stats/performance/', PerformanceStatsView.as_view(), name='performance_stats'),
+	path('analytics/', SalesAnalyticsView.as_view(), name='sales_analytics'),
+	path('batch/', BatchView.as_view(), name='batch'),
 ]
\ No newline at end of file
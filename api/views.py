@@ -1,45 +1,84 @@
+from datetime import datetime, time, timedelta
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from django.db.models import Avg, Count
-from .models import Category, Product, Order, Review
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Prefetch, Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from .models import Category, Product, Order, OrderItem, Review
 from .serializers import (
-	CategorySerializer, ProductSerializer, OrderSerializer,
-	ReviewSerializer, UserRegisterSerializer, UserSerializer
+	CategorySerializer, ProductSerializer, OrderSerializer, OrderCreateSerializer,
+	ReviewSerializer, UserRegisterSerializer, UserSerializer,
+	SalesReportQuerySerializer, SalesReportRowSerializer, SalesTotalsSerializer, OrderExportQuerySerializer,
+	BatchRequestSerializer,
 )
 from .permissions import IsOwnerOrReadOnly
+from .cache import CatalogCacheMixin
+from .filters import ProductFilter
+from .search import ProductSearchFilter
+from .pagination import PageNumberOrKeysetPagination
+from .projections import Projection, ProjectionListMixin
+from .conditional import ConditionalGetMixin
+from .performance import registry as performance_registry
+from .analytics import sales_report
+from .exports import export_queryset, stream_orders
+from .batch import run_batch
+from .recommendations import co_purchased_ids
+
+def start_of_day(day):
+	"""Начало дня в текущем часовом поясе"""
+	return timezone.make_aware(datetime.combine(day, time.min))
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CatalogCacheMixin, ConditionalGetMixin, ProjectionListMixin, viewsets.ModelViewSet):
 	"""
 	ViewSet для категорий товаров.
 	"""
 	queryset = Category.objects.all()
 	serializer_class = CategorySerializer
+	projection = Projection(CategorySerializer)  # Быстрый путь для list
 	permission_classes = [AllowAny]
 	filter_backends = [SearchFilter, OrderingFilter]
 	search_fields = ['name']
 	ordering_fields = ['name', 'created_at']
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CatalogCacheMixin, ConditionalGetMixin, ProjectionListMixin, viewsets.ModelViewSet):
 	"""
 	ViewSet для товаров.
 	"""
-	queryset = Product.objects.filter(is_available=True)
+	queryset = Product.objects.filter(is_available=True).select_related('category')
 	serializer_class = ProductSerializer
+	projection = Projection(ProductSerializer)  # Быстрый путь для list
+	last_modified_fields = ('updated_at', 'category__updated_at')  # category_name в ответе
 	permission_classes = [AllowAny]
-	filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-	filterset_fields = ['category', 'roast_level', 'is_available']
-	search_fields = ['name', 'description', 'origin']
+	pagination_class = PageNumberOrKeysetPagination
+	filter_backends = [DjangoFilterBackend, ProductSearchFilter, OrderingFilter]
+	filterset_class = ProductFilter
 	ordering_fields = ['name', 'price', 'created_at']
 
+	@property
+	def paginator(self):
+		"""С ?ids= в ответе все запрошенные товары, без страниц"""
+		if self.request is not None and 'ids' in self.request.query_params:
+			return None
+		return super().paginator
+
+	def get_featured_queryset(self):
+		"""Товары с рейтингом >= 4; агрегаты хранятся в Product, это чтение по индексу product_featured_idx"""
+		return self.get_queryset().filter(
+			avg_rating__gte=4.0, review_count__gte=1
+		).order_by('-avg_rating')[:8]
+
 	@action(detail=True, methods=['get'])
 	def reviews(self, request, pk=None):
 		"""Custom action: получить все отзывы для конкретного товара"""
 		product = self.get_object()
-		reviews = product.reviews.all()
+		reviews = product.reviews.select_related('user')
 		page = self.paginate_queryset(reviews)
 		if page is not None:
 			serializer = ReviewSerializer(page, many=True)
@@ -47,56 +86,125 @@ class ProductViewSet(viewsets.ModelViewSet):
 		serializer = ReviewSerializer(reviews, many=True)
 		return Response(serializer.data)
 
+	@action(detail=True, methods=['get'], url_path='frequently-bought-together')
+	def frequently_bought_together(self, request, pk=None):
+		"""
+		Custom action: до CO_PURCHASE_TOP_K товаров в продаже, которые чаще всего
+		покупают вместе с этим. Индекс ProductCoPurchase: одна строка по ключу и товары по id
+		"""
+		product = self.get_object()
+		ids = co_purchased_ids(product.pk)
+		products = {item.pk: item for item in self.get_queryset().filter(pk__in=ids)}
+		ranked = [products[pk] for pk in ids if pk in products][:settings.CO_PURCHASE_TOP_K]
+		return Response(self.get_serializer(ranked, many=True).data)
+
 	@action(detail=False, methods=['get'])
 	def featured(self, request):
 		"""Custom action: получить рекомендованные товары (рейтинг >= 4)"""
-		featured_products = self.get_queryset().annotate(
-			avg_rating=Avg('reviews__rating'),
-			review_count=Count('reviews')
-		).filter(avg_rating__gte=4.0, review_count__gte=1).order_by('-avg_rating')[:8]
+		return self.get_cached_response(request, self._featured)
 
+	def _featured(self, request):
+		featured_products = self.get_featured_queryset()
 		serializer = self.get_serializer(featured_products, many=True)
 		return Response(serializer.data)
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
 	"""
 	ViewSet для заказов.
 	Пользователи видят только свои заказы.
 	"""
 	serializer_class = OrderSerializer
 	permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+	pagination_class = PageNumberOrKeysetPagination
 	filter_backends = [DjangoFilterBackend, OrderingFilter]
 	filterset_fields = ['status']
 	ordering_fields = ['created_at', 'total_amount']
+	# В ответе позиции с названием и ценой товара. У позиций нет updated_at -
+	# их состав и количества попадают в ETag через агрегаты
+	last_modified_fields = ('updated_at', 'items__product__updated_at')
+	etag_aggregates = {
+		'items_count': Count('items'), 'item_ids': Sum('items__pk'), 'item_quantities': Sum('items__quantity'),
+	}
 
 	# ЯВНО УКАЗЫВАЕМ queryset ДЛЯ АВТОМАТИЧЕСКОГО ОПРЕДЕЛЕНИЯ BASENAME
-	queryset = Order.objects.all()
+	# Пользователь и позиции заказа с товарами загружаются заранее, без N+1
+	queryset = Order.objects.select_related('user').prefetch_related(
+		Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+	)
 
 	def get_queryset(self):
 		"""Возвращаем только заказы текущего пользователя"""
-		return self.queryset.filter(user=self.request.user)
+		return self.queryset.filter(user_id=self.request.user.pk)
+
+	def get_serializer_class(self):
+		"""Для оформления заказа - сериализатор, принимающий позиции"""
+		if self.action == 'create':
+			return OrderCreateSerializer
+		return OrderSerializer
+
+	def create(self, request, *args, **kwargs):
+		"""Оформление заказа со всеми позициями, в ответе - полный заказ"""
+		serializer = self.get_serializer(data=request.data)
+		serializer.is_valid(raise_exception=True)
+		self.perform_create(serializer)
+		order = self.get_queryset().get(pk=serializer.instance.pk)
+		data = OrderSerializer(order, context=self.get_serializer_context()).data
+		return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
 
 	def perform_create(self, serializer):
 		"""Автоматически устанавливаем пользователя при создании заказа"""
 		serializer.save(user=self.request.user)
 
-class ReviewViewSet(viewsets.ModelViewSet):
+	@action(detail=False, methods=['get'])
+	def export(self, request):
+		"""
+		Custom action: выгрузка всех заказов потоком в CSV или NDJSON (export_format),
+		с фильтрами status и created_from/created_to. Персонал выгружает заказы
+		всех пользователей (user - одного пользователя), остальные - свои
+		"""
+		query = OrderExportQuerySerializer(data=request.query_params)
+		query.is_valid(raise_exception=True)
+		params = query.validated_data
+
+		orders = export_queryset()
+		if not request.user.is_staff:
+			orders = orders.filter(user_id=request.user.pk)
+		elif 'user' in params:
+			orders = orders.filter(user_id=params['user'])
+		if params.get('status'):
+			orders = orders.filter(status__in=params['status'])
+		# Границы дат - моменты времени: фильтр по created_at остаётся индексируемым
+		if 'created_from' in params:
+			orders = orders.filter(created_at__gte=start_of_day(params['created_from']))
+		if 'created_to' in params:
+			orders = orders.filter(created_at__lt=start_of_day(params['created_to'] + timedelta(days=1)))
+
+		# Под ASGI - асинхронный итератор, иначе Django соберёт весь ответ в память
+		content_type, extension, chunks = stream_orders(
+			orders, params['export_format'], asynchronous=isinstance(request._request, ASGIRequest),
+		)
+		response = StreamingHttpResponse(chunks, content_type=content_type)
+		response['Content-Disposition'] = f'attachment; filename="orders-{timezone.localdate():%Y%m%d}.{extension}"'
+		return response
+
+class ReviewViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
 	"""
 	ViewSet для отзывов.
 	Пользователи могут управлять только своими отзывами.
 	"""
 	serializer_class = ReviewSerializer
 	permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+	pagination_class = PageNumberOrKeysetPagination
 	filter_backends = [DjangoFilterBackend, OrderingFilter]
 	filterset_fields = ['product', 'rating']
 	ordering_fields = ['created_at', 'rating']
 
 	# ЯВНО УКАЗЫВАЕМ queryset ДЛЯ АВТОМАТИЧЕСКОГО ОПРЕДЕЛЕНИЯ BASENAME
-	queryset = Review.objects.all()
+	queryset = Review.objects.select_related('user')
 
 	def get_queryset(self):
 		"""Возвращаем только отзывы текущего пользователя"""
-		return self.queryset.filter(user=self.request.user)
+		return self.queryset.filter(user_id=self.request.user.pk)
 
 	def perform_create(self, serializer):
 		"""Автоматически устанавливаем пользователя при создании отзыва"""
@@ -138,4 +246,59 @@ class UserProfileView(APIView):
 		if serializer.is_valid():
 			serializer.save()
 			return Response(serializer.data)
-		return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+		return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class PerformanceStatsView(APIView):
+	"""
+	Статистика задержек по endpoint'ам текущего процесса (только для персонала).
+	DELETE сбрасывает накопленные гистограммы
+	"""
+	permission_classes = [IsAdminUser]
+
+	def get(self, request):
+		return Response(performance_registry.snapshot())
+
+	def delete(self, request):
+		performance_registry.reset()
+		return Response(status=status.HTTP_204_NO_CONTENT)
+
+class SalesAnalyticsView(APIView):
+	"""
+	Отчёт о продажах за период (только для персонала). Читает только дневные
+	сводки, поэтому время ответа зависит от длины периода, а не от числа заказов.
+	Параметры: date_from, date_to, status (несколько), group_by=category|product,
+	id (несколько, при group_by), interval=day|month|total, limit
+	"""
+	permission_classes = [IsAdminUser]
+
+	def get(self, request):
+		query = SalesReportQuerySerializer(data=request.query_params)
+		query.is_valid(raise_exception=True)
+		params = query.validated_data
+		rows, totals = sales_report(
+			params['date_from'], params['date_to'], params['status'], params.get('group_by'),
+			params['interval'], params.get('id'), params['limit'],
+		)
+		return Response({
+			'date_from': params['date_from'],
+			'date_to': params['date_to'],
+			'status': params['status'],
+			'group_by': params.get('group_by'),
+			'interval': params['interval'],
+			'totals': SalesTotalsSerializer(totals).data,
+			'results': SalesReportRowSerializer(rows, many=True).data,
+		})
+
+class BatchView(APIView):
+	"""
+	Несколько GET-запросов к API за один HTTP-запрос (api/batch.py): корзина,
+	отзывы и профиль без отдельных round trip'ов. Каждый подзапрос проверяет
+	права как обычно; ответ - статус, ETag/Last-Modified и тело каждого подзапроса
+	"""
+	permission_classes = [AllowAny]
+
+	def post(self, request):
+		serializer = BatchRequestSerializer(data=request.data)
+		serializer.is_valid(raise_exception=True)
+		paths = [item['path'] for item in serializer.validated_data['requests']]
+		return Response({'responses': run_batch(request, paths)})
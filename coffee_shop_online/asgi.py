@@ -2,6 +2,8 @@
 ASGI config for coffee_shop_online project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+GET/HEAD requests to the catalog endpoints are served by the async views in
+``api/async_views.py`` (see ``api.middleware.AsyncCatalogRoutingMiddleware``).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
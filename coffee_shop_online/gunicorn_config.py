@@ -0,0 +1,85 @@
+"""
+Профиль gunicorn для продакшена:
+
+	gunicorn -c python:coffee_shop_online.gunicorn_config
+
+SERVER_INTERFACE=wsgi (по умолчанию) - gthread worker'ы: синхронные view DRF
+выполняются в потоках, соединение с БД у каждого потока своё и живёт CONN_MAX_AGE.
+SERVER_INTERFACE=asgi - uvicorn worker'ы с асинхронным каталогом (api.async_views).
+
+Соединений с БД открывается до workers * threads. Это число ограничено
+DB_MAX_CONNECTIONS (80: из max_connections=100 PostgreSQL по умолчанию остаются
+соединения для worker'ов run_jobs, миграций и psql): процессов по числу ядер,
+но не больше, чем помещается в бюджет. WEB_CONCURRENCY и GUNICORN_THREADS задают
+их явно; превышение бюджета - предупреждение при старте. За pgbouncer бюджет -
+это max_client_conn пула.
+
+DEBUG=True или GUNICORN_RELOAD=true - перезапуск worker'ов при изменении кода
+(для разработки с примонтированными исходниками, см. docker-compose.yml)
+"""
+import multiprocessing
+import os
+
+import decouple
+
+cpu_count = multiprocessing.cpu_count()
+interface = os.getenv('SERVER_INTERFACE', 'wsgi')
+db_max_connections = decouple.config('DB_MAX_CONNECTIONS', default=80, cast=int)
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+if interface == 'asgi':
+	# Один цикл событий на ядро; синхронный код Django под ASGI выполняется в отдельном
+	# потоке на каждый запрос, и соединения с БД не переживают запрос - Django советует
+	# отключать постоянные соединения под ASGI
+	wsgi_app = 'coffee_shop_online.asgi:application'
+	worker_class = 'uvicorn.workers.UvicornWorker'
+	workers = int(os.getenv('WEB_CONCURRENCY', cpu_count))
+	threads = 1
+	os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+else:
+	# Запрос в основном ждёт БД и кэш, поэтому на ядро - два процесса по несколько потоков
+	wsgi_app = 'coffee_shop_online.wsgi:application'
+	worker_class = 'gthread'
+	threads = int(os.getenv('GUNICORN_THREADS', 4))
+	workers = int(os.getenv('WEB_CONCURRENCY', max(1, min(cpu_count * 2 + 1, db_max_connections // threads))))
+
+# Приложение загружается один раз в мастере: быстрее старт worker'ов и общая память
+# после fork. Несовместимо с перезагрузкой кода - она включается для разработки
+reload = decouple.config('GUNICORN_RELOAD', default=False, cast=bool) or decouple.config('DEBUG', default=False, cast=bool)
+preload_app = not reload
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5  # Секунды ожидания следующего запроса в keep-alive соединении от балансировщика
+# Перезапуск worker'а после стольких запросов ограничивает рост памяти; разброс - чтобы не все сразу
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+# Heartbeat worker'ов в памяти, а не на диске контейнера
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+	if interface == 'asgi':
+		server.log.info('asgi: %s workers (%s), database connection per request', workers, worker_class)
+	else:
+		server.log.info(
+			'wsgi: %s workers x %s threads, up to %s persistent database connections',
+			workers, threads, workers * threads,
+		)
+		if workers * threads > db_max_connections:
+			server.log.warning(
+				'%s database connections exceed DB_MAX_CONNECTIONS=%s: lower WEB_CONCURRENCY or GUNICORN_THREADS',
+				workers * threads, db_max_connections,
+			)
+
+
+def post_fork(server, worker):
+	# Соединения, открытые в мастере при preload, не должны достаться нескольким процессам
+	from django.db import connections
+	for connection in connections.all(initialized_only=True):
+		connection.close()
@@ -24,6 +24,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # Поиск: tsvector и pg_trgm
 
 	# Сторонние приложения
 	'rest_framework',           # Django REST Framework
@@ -38,6 +39,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
 	'corsheaders.middleware.CorsMiddleware',
+	'api.middleware.CompressionMiddleware',  # gzip для больших ответов по Accept-Encoding
+	'api.middleware.PerformanceMiddleware',  # Server-Timing и статистика по endpoint'ам
+	'api.middleware.ReadReplicaMiddleware',  # Чтение каталога с реплик БД
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -45,6 +49,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+	'api.middleware.AsyncCatalogRoutingMiddleware',  # Асинхронный каталог под ASGI
 ]
 
 ROOT_URLCONF = 'coffee_shop_online.urls'
@@ -66,10 +71,17 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'coffee_shop_online.wsgi.application'
 
+# URLconf с асинхронными endpoints каталога для запросов через ASGI (пусто - отключено)
+ASYNC_CATALOG_URLCONF = config('ASYNC_CATALOG_URLCONF', default='api.async_urls')
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Подключение через pgbouncer в режиме pool_mode=transaction: соседние запросы
+# одного соединения Django могут попасть в разные серверные соединения
+DB_PGBOUNCER = config('DB_PGBOUNCER', default=False, cast=bool)
+
 # Настройки БД
 DATABASES = {
 	'default': {
@@ -79,17 +91,119 @@ DATABASES = {
 		'PASSWORD': os.getenv('DB_PASSWORD', 'coffee_password'),
 		'HOST': os.getenv('DB_HOST', 'db'),  # 'db' для Docker
 		'PORT': os.getenv('DB_PORT', '5432'),
+		# Соединение переиспользуется запросами потока до DB_CONN_MAX_AGE секунд (0 - новое
+		# на каждый запрос) и проверяется перед первым запросом после простоя
+		'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+		'CONN_HEALTH_CHECKS': True,
+		# Серверный курсор (iterator()) живёт между запросами транзакции и не переносит смену
+		# серверного соединения в pgbouncer; выгрузки тогда читают порции по ключу
+		'DISABLE_SERVER_SIDE_CURSORS': DB_PGBOUNCER,
+		'OPTIONS': {
+			'connect_timeout': config('DB_CONNECT_TIMEOUT', default=5, cast=int),
+		},
 	}
 }
 
-# Для разработки можно использовать SQLite
-#if config('USE_SQLITE', default=False, cast=bool):
-#	DATABASES = {
-#		'default': {
-#			'ENGINE': 'django.db.backends.sqlite3',
-#			'NAME': BASE_DIR / 'db.sqlite3',
-#		}
-#	}
+# Для разработки и тестов можно использовать SQLite
+if config('USE_SQLITE', default=False, cast=bool):
+	DATABASES = {
+		'default': {
+			'ENGINE': 'django.db.backends.sqlite3',
+			'NAME': BASE_DIR / 'db.sqlite3',
+		}
+	}
+
+# Реплики для чтения каталога и отзывов (api.replicas): DB_REPLICAS=хост[:порт][=вес],...
+# Для SQLite вместо хостов - файлы БД (например, тот же db.sqlite3 для проверки маршрутизации)
+DATABASE_REPLICAS = {}
+for number, replica in enumerate(filter(None, config('DB_REPLICAS', default='').split(',')), start=1):
+	address, _, weight = replica.strip().partition('=')
+	if DATABASES['default']['ENGINE'].endswith('sqlite3'):
+		location = {'NAME': address}
+	else:
+		host, _, port = address.partition(':')
+		location = {'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+	# В тестах реплика - та же тестовая БД
+	DATABASES[f'replica_{number}'] = {**DATABASES['default'], **location, 'TEST': {'MIRROR': 'default'}}
+	DATABASE_REPLICAS[f'replica_{number}'] = int(weight or 1)
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+# Модели, которые читаются с реплик, и сколько секунд после записи пользователь читает из основной БД
+REPLICA_MODELS = {'api.Category', 'api.Product', 'api.Review', 'api.ProductSearchDocument'}
+READ_YOUR_WRITES_SECONDS = config('READ_YOUR_WRITES_SECONDS', default=10, cast=int)
+
+# Кэш: локальная память по умолчанию, общий Redis в продакшене
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+	CACHES = {
+		'default': {
+			'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+			'LOCATION': REDIS_URL,
+		}
+	}
+else:
+	CACHES = {
+		'default': {
+			'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+		}
+	}
+
+# Время жизни закэшированных ответов каталога (секунды)
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=300, cast=int)
+
+# Полнотекстовый поиск товаров: конфигурация tsvector в PostgreSQL
+# и ограничение числа результатов для поиска в памяти на других СУБД
+PRODUCT_SEARCH_CONFIG = config('PRODUCT_SEARCH_CONFIG', default='english')
+PRODUCT_SEARCH_MAX_RESULTS = 1000
+# Сколько товаров можно запросить одним ?ids=
+PRODUCT_MULTI_GET_MAX_IDS = 1000
+# Наибольшее количество одного товара в позиции заказа
+ORDER_ITEM_MAX_QUANTITY = 1000
+
+# Уменьшенные копии изображений товаров: вариант -> максимальная сторона в пикселях,
+# форматы и качество, число потоков и процессов для их построения (api.images)
+PRODUCT_IMAGE_VARIANTS = {'thumb': 160, 'small': 320, 'medium': 640, 'large': 1280}
+PRODUCT_IMAGE_FORMATS = ('webp', 'jpeg')
+PRODUCT_IMAGE_QUALITY = 80
+PRODUCT_IMAGE_WORKERS = config('PRODUCT_IMAGE_WORKERS', default=2, cast=int)
+
+# Фоновые задания (api.jobs, worker - manage.py run_jobs): очередь -> сколько
+# её заданий один worker выполняет одновременно
+JOB_QUEUES = {
+	'default': config('JOB_CONCURRENCY', default=4, cast=int),
+	'images': PRODUCT_IMAGE_WORKERS,
+}
+JOB_POLL_INTERVAL = 1.0  # Секунды между опросами пустой очереди
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BASE_DELAY = 2  # Секунды до первого повтора, дальше удваивается
+JOB_RETRY_MAX_DELAY = 600
+JOB_LOCK_TIMEOUT = 300  # Задание без отметки worker'а дольше этого времени считается зависшим
+JOB_RETENTION_DAYS = 7  # Сколько хранить выполненные задания (и их idempotency_key)
+
+# Почта: без настроек SMTP письма выводятся в консоль
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='orders@coffee-shop.local')
+
+# «С этим товаром покупают» (api.recommendations): сколько товаров отдаётся и сколько
+# пар хранится на товар - запас на случай, когда часть соседей снята с продажи
+CO_PURCHASE_TOP_K = config('CO_PURCHASE_TOP_K', default=10, cast=int)
+CO_PURCHASE_SLOTS = config('CO_PURCHASE_SLOTS', default=40, cast=int)
+
+# Пакетные запросы (/api/batch/): подзапросов в одном пакете
+BATCH_MAX_REQUESTS = config('BATCH_MAX_REQUESTS', default=25, cast=int)
+
+# Выгрузка заказов (/api/orders/export/): заказов в одной порции чтения из БД
+ORDER_EXPORT_CHUNK_SIZE = config('ORDER_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Версия кода (например, коммит при сборке образа): при её смене схема OpenAPI
+# строится заново. Пусто - версия считается по хешу исходников (api.openapi)
+CODE_VERSION = config('CODE_VERSION', default='')
+OPENAPI_SCHEMA_FILE = config('OPENAPI_SCHEMA_FILE', default=str(BASE_DIR / 'openapi.json'))
+
+# Инструментирование запросов (api.middleware.PerformanceMiddleware):
+# порог медленного запроса в мс (0 - не логировать) и число SQL в логе
+PERFORMANCE_INSTRUMENTATION = config('PERFORMANCE_INSTRUMENTATION', default=True, cast=bool)
+PERFORMANCE_SLOW_REQUEST_MS = config('PERFORMANCE_SLOW_REQUEST_MS', default=1000, cast=int)
+PERFORMANCE_SLOW_QUERIES_LOGGED = 5
 
 
 # Password validation
@@ -142,25 +256,43 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
 	# Классы аутентификации - JWT будет основным
 	'DEFAULT_AUTHENTICATION_CLASSES': (
-		'rest_framework_simplejwt.authentication.JWTAuthentication',
+		'api.authentication.ClaimsJWTAuthentication',  # Пользователь из claims токена, без запроса к БД
 	),
 	# Права доступа по умолчанию
 	'DEFAULT_PERMISSION_CLASSES': (
 		'rest_framework.permissions.IsAuthenticatedOrReadOnly',  # Чтение для всех, запись для авторизованных
 	),
+	# JSON через orjson - тот же формат, что у стандартных JSONRenderer/JSONParser
+	'DEFAULT_RENDERER_CLASSES': (
+		'api.renderers.ORJSONRenderer',
+		'rest_framework.renderers.BrowsableAPIRenderer',
+	),
+	'DEFAULT_PARSER_CLASSES': (
+		'api.renderers.ORJSONParser',
+		'rest_framework.parsers.FormParser',
+		'rest_framework.parsers.MultiPartParser',
+	),
 	# Пагинация для всех списковых endpoints
 	'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
 	'PAGE_SIZE': 10  # 10 элементов на страницу
 }
 
+# Ответы меньше этого размера (байт) не сжимаются: выигрыш меньше затрат на gzip
+RESPONSE_COMPRESSION_MIN_BYTES = config('RESPONSE_COMPRESSION_MIN_BYTES', default=1024, cast=int)
+
 # Настройки JWT токенов
 SIMPLE_JWT = {
 	'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),   # Время жизни access токена
 	'REFRESH_TOKEN_LIFETIME': timedelta(days=1),      # Время жизни refresh токена
 	'ROTATE_REFRESH_TOKENS': False,
 	'BLACKLIST_AFTER_ROTATION': True,
+	'TOKEN_OBTAIN_SERIALIZER': 'api.authentication.ClaimsTokenObtainPairSerializer',
+	'TOKEN_REFRESH_SERIALIZER': 'api.authentication.ClaimsTokenRefreshSerializer',
 }
 
+# Сколько секунд держать в кэше пользователя, загруженного по JWT (сбрасывается при сохранении)
+AUTH_USER_CACHE_TIMEOUT = config('AUTH_USER_CACHE_TIMEOUT', default=60, cast=int)
+
 # CORS настройки для фронтенда
 CORS_ALLOWED_ORIGINS = [
 	"http://localhost:3000",  # React dev server
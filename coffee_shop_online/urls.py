@@ -3,23 +3,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.http import HttpResponseRedirect
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
 
-# Настройка Swagger документации
-schema_view = get_schema_view(
-	openapi.Info(
-		title="Coffee Shop API",
-		default_version='v1',
-		description="API for Coffee Shop E-commerce",
-		terms_of_service="https://www.google.com/policies/terms/",
-		contact=openapi.Contact(email="contact@coffeeshop.local"),
-		license=openapi.License(name="BSD License"),
-	),
-	public=True,
-	permission_classes=(permissions.AllowAny,),
-)
+from api.openapi import PrecomputedSchemaView as schema_view
 
 def redirect_to_swagger(request):
 	"""Перенаправление с корневого URL на Swagger документацию"""
@@ -35,7 +20,7 @@ urlpatterns = [
 	# Основные API endpoints
 	path('api/', include('api.urls')),
 
-	# Swagger документация
+	# Swagger документация: схема строится заранее (api.openapi, manage.py generate_openapi_schema)
 	path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
 	path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 ]
@@ -0,0 +1,77 @@
+"""
+Сравнение пропускной способности каталога через WSGI и ASGI при параллельных запросах.
+
+Оба сервера запускаются заранее на одной базе, например:
+
+	gunicorn coffee_shop_online.wsgi:application --bind 0.0.0.0:8000 --workers 2
+	gunicorn coffee_shop_online.asgi:application --bind 0.0.0.0:8001 --workers 2 \\
+		--worker-class uvicorn.workers.UvicornWorker
+
+	python scripts/benchmark_async.py --wsgi http://localhost:8000 --asgi http://localhost:8001
+"""
+import argparse
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+PATHS = [
+	'/api/products/',
+	'/api/products/?ordering=-price&roast_level=medium',
+	'/api/products/featured/',
+	'/api/categories/',
+]
+
+
+def fetch(url):
+	started = time.perf_counter()
+	try:
+		with urllib.request.urlopen(url) as response:
+			response.read()
+			status = response.status
+	except urllib.error.HTTPError as exc:
+		status = exc.code
+	return status, time.perf_counter() - started
+
+
+def run(base_url, concurrency, requests):
+	"""Отправляет requests запросов с заданной параллельностью, возвращает статистику"""
+	urls = [base_url.rstrip('/') + PATHS[i % len(PATHS)] for i in range(requests)]
+	for url in urls[:len(PATHS)]:
+		fetch(url)  # Прогрев
+
+	started = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=concurrency) as pool:
+		results = list(pool.map(fetch, urls))
+	elapsed = time.perf_counter() - started
+
+	latencies = sorted(latency for _, latency in results)
+	return {
+		'errors': sum(status != 200 for status, _ in results),
+		'rps': requests / elapsed,
+		'p50': statistics.median(latencies) * 1000,
+		'p95': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--wsgi', default='http://localhost:8000')
+	parser.add_argument('--asgi', default='http://localhost:8001')
+	parser.add_argument('--requests', type=int, default=2000)
+	parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+	args = parser.parse_args()
+
+	print(f'{"server":>6} {"conc":>5} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"errors":>7}')
+	for concurrency in args.concurrency:
+		for name, url in (('wsgi', args.wsgi), ('asgi', args.asgi)):
+			stats = run(url, concurrency, args.requests)
+			print(
+				f'{name:>6} {concurrency:>5} {stats["rps"]:>9.1f} {stats["p50"]:>8.1f} '
+				f'{stats["p95"]:>8.1f} {stats["errors"]:>7}'
+			)
+
+
+if __name__ == '__main__':
+	main()
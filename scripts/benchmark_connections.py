@@ -0,0 +1,136 @@
+"""
+Цена установки соединения с БД на пути запроса: одни и те же запросы через
+WSGI-приложение Django в текущем процессе с CONN_MAX_AGE=0 (новое соединение на каждый запрос, как было раньше)
+и с постоянными соединениями (CONN_MAX_AGE из настроек, 60 по умолчанию).
+
+Параллельные клиенты работают в потоках, как запросы в gthread worker'е gunicorn;
+у каждого потока своё соединение. Запускать на PostgreSQL, лучше через сеть
+(или через pgbouncer с DB_PGBOUNCER=True):
+
+	python scripts/benchmark_connections.py --requests 2000 --concurrency 1 8
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'coffee_shop_online.settings')
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connection, connections
+from django.core.wsgi import get_wsgi_application
+from django.db.backends.signals import connection_created
+from rest_framework_simplejwt.tokens import AccessToken
+
+# Endpoints без кэша ответов: каждый запрос читает из БД
+PATHS = [('/api/reviews/', ''), ('/api/reviews/', 'ordering=-rating'), ('/api/orders/', '')]
+
+application = get_wsgi_application()
+
+connects = 0
+connects_lock = threading.Lock()
+
+
+def count_connect(sender, **kwargs):
+	global connects
+	with connects_lock:
+		connects += 1
+
+
+def connect_time(samples=20):
+	"""Среднее время открытия соединения (TCP, аутентификация, настройка сессии), мс"""
+	timings = []
+	for _ in range(samples):
+		connection.close()
+		started = time.perf_counter()
+		connection.ensure_connection()
+		timings.append(time.perf_counter() - started)
+	connection.close()
+	return statistics.mean(timings) * 1000
+
+
+def request(path, query, token):
+	"""
+	Запрос через WSGI-обработчик, как от gunicorn: в отличие от тестового клиента,
+	он закрывает соединения по CONN_MAX_AGE в начале и в конце запроса
+	"""
+	statuses = []
+	environ = {
+		'PATH_INFO': path, 'QUERY_STRING': query,
+		'HTTP_HOST': settings.ALLOWED_HOSTS[0], 'HTTP_AUTHORIZATION': f'Bearer {token}',
+	}
+	setup_testing_defaults(environ)
+	response = application(environ, lambda status, headers: statuses.append(status))
+	try:
+		b''.join(response)
+	finally:
+		response.close()
+	assert statuses[0].startswith('200'), statuses[0]
+
+
+def worker(requests, token):
+	"""Запросы одного потока; соединение потока закрывается в конце, как при остановке worker'а"""
+	latencies = []
+	try:
+		for i in range(requests):
+			started = time.perf_counter()
+			request(*PATHS[i % len(PATHS)], token)
+			latencies.append(time.perf_counter() - started)
+	finally:
+		connections.close_all()
+	return latencies
+
+
+def run(conn_max_age, concurrency, requests, token):
+	global connects
+	for alias in connections:
+		connections[alias].settings_dict['CONN_MAX_AGE'] = conn_max_age
+	close_old_connections()
+	worker(len(PATHS), token)  # Прогрев
+	connects = 0
+
+	started = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=concurrency) as pool:
+		results = pool.map(worker, [requests // concurrency] * concurrency, [token] * concurrency)
+		latencies = sorted(latency for thread in results for latency in thread)
+	elapsed = time.perf_counter() - started
+	return {
+		'rps': len(latencies) / elapsed,
+		'p50': statistics.median(latencies) * 1000,
+		'p95': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+		'connects': connects,
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--requests', type=int, default=2000)
+	parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8])
+	args = parser.parse_args()
+
+	persistent = connection.settings_dict['CONN_MAX_AGE'] or 60
+	user, _ = User.objects.get_or_create(username='benchmark_connections')
+	token = str(AccessToken.for_user(user))
+	connection_created.connect(count_connect)
+	print(f'{connection.vendor} {connection.settings_dict["HOST"] or "local"}: connect {connect_time():.2f} ms')
+	print(f'{"conn_max_age":>12} {"conc":>5} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"connects":>9}')
+	for concurrency in args.concurrency:
+		for conn_max_age in (0, persistent):
+			stats = run(conn_max_age, concurrency, args.requests, token)
+			print(
+				f'{conn_max_age:>12} {concurrency:>5} {stats["rps"]:>9.1f} {stats["p50"]:>8.2f} '
+				f'{stats["p95"]:>8.2f} {stats["connects"]:>9}'
+			)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,379 @@
+"""
+Бенчмарк всех маршрутов api/urls.py с сохранением результатов в JSON.
+
+Запросы идут через тестовый клиент Django в текущем процессе (по базе из настроек)
+или на запущенный сервер (--base-url). Для каждого сценария считаются p50/p95/p99,
+пропускная способность одного клиента и число SQL-запросов (из заголовка
+Server-Timing). Отчёты для персонала (статистика, аналитика продаж) выполняются
+от имени --staff-username, без него пропускаются. Данные для базы удобно создать
+командой generate_synthetic_data:
+
+	python manage.py generate_synthetic_data --products 100000 --orders 1000000 --reviews 5000000
+	python scripts/benchmark_endpoints.py --output baseline.json
+	# ... изменения ...
+	python scripts/benchmark_endpoints.py --output current.json --compare baseline.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'coffee_shop_online.settings')
+django.setup()
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import URLResolver, reverse
+from django.utils import timezone
+
+import api.urls
+
+QUERIES_RE = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+class Scenario:
+	"""
+	Один запрос к маршруту url_name; kwargs, строка запроса и тело могут зависеть от контекста.
+	staff - от имени --staff-username (токен staff_access в контексте)
+	"""
+
+	def __init__(self, name, url_name, method='GET', kwargs=None, query='', body=None,
+			auth=False, staff=False, expect=(200,), writes=False, requires=()):
+		self.name = name
+		self.url_name = url_name
+		self.method = method
+		self.kwargs = kwargs or {}
+		self.query = query
+		self.body = body
+		self.auth = auth or staff
+		self.staff = staff
+		self.expect = expect
+		self.writes = writes
+		self.requires = (*requires, 'staff_access') if staff else requires
+
+	def path(self, context):
+		kwargs = {key: context[value] for key, value in self.kwargs.items()}
+		path = reverse(self.url_name, kwargs=kwargs)
+		query = self.query(context) if callable(self.query) else self.query
+		return f'{path}?{query}' if query else path
+
+	def token(self, context):
+		if self.staff:
+			return context['staff_access']
+		return context['access'] if self.auth else None
+
+	def payload(self, context):
+		return self.body(context) if callable(self.body) else self.body
+
+
+SCENARIOS = [
+	Scenario('api root', 'api-root'),
+	Scenario('category list', 'category-list'),
+	Scenario('category detail', 'category-detail', kwargs={'pk': 'category'}, requires=('category',)),
+	Scenario('product list', 'product-list'),
+	Scenario('product list page 5', 'product-list', query='page=5'),
+	Scenario('product list keyset', 'product-list', query='pagination=cursor'),
+	Scenario('product list filtered', 'product-list', query='roast_level=dark&ordering=-price'),
+	Scenario('product search', 'product-list', query='search=espresso'),
+	Scenario('product detail', 'product-detail', kwargs={'pk': 'product'}, requires=('product',)),
+	Scenario('product featured', 'product-featured'),
+	Scenario('product reviews', 'product-reviews', kwargs={'pk': 'product'}, requires=('product',)),
+	Scenario(
+		'product bought together', 'product-frequently-bought-together', kwargs={'pk': 'product'}, requires=('product',),
+	),
+	Scenario('order list', 'order-list', auth=True),
+	Scenario('order list keyset', 'order-list', query='pagination=cursor', auth=True),
+	Scenario('order detail', 'order-detail', kwargs={'pk': 'order'}, auth=True, requires=('order',)),
+	Scenario('order export', 'order-export', query='export_format=ndjson', auth=True),
+	Scenario(
+		'order create', 'order-list', method='POST', auth=True, expect=(201,), writes=True,
+		body=lambda context: {
+			'shipping_address': 'Benchmark street 1',
+			'items': [{'product': context['product'], 'quantity': 1}],
+		},
+		requires=('product',),
+	),
+	Scenario('review list', 'review-list', auth=True),
+	Scenario('review detail', 'review-detail', kwargs={'pk': 'review'}, auth=True, requires=('review',)),
+	Scenario(
+		'register', 'register', method='POST', expect=(201,), writes=True,
+		body=lambda context: {
+			'username': f'bench_{uuid.uuid4().hex[:12]}', 'password': 'Bench-pass-2025!',
+			'password2': 'Bench-pass-2025!', 'email': 'bench@example.com',
+		},
+	),
+	Scenario(
+		'token obtain', 'token_obtain_pair', method='POST',
+		body=lambda context: {'username': context['username'], 'password': context['password']},
+	),
+	Scenario('token refresh', 'token_refresh', method='POST', body=lambda context: {'refresh': context['refresh']}),
+	Scenario('profile', 'user_profile', auth=True),
+	Scenario(
+		'batch', 'batch', method='POST', auth=True,
+		body=lambda context: {'requests': [
+			{'path': f'{reverse("product-list")}?ids={context["product"]}'},
+			{'path': reverse('user_profile')},
+		]},
+		requires=('product',),
+	),
+	Scenario('performance stats', 'performance_stats', staff=True),
+	Scenario(
+		# Последние 365 дней - период, за который generate_synthetic_data создаёт заказы
+		'sales analytics', 'sales_analytics', staff=True,
+		query=lambda context: (
+			f'date_from={timezone.localdate() - timedelta(days=364)}&date_to={timezone.localdate()}'
+			'&group_by=category&interval=month'
+		),
+	),
+]
+
+
+class InProcessClient:
+	"""Тестовый клиент Django в текущем процессе"""
+	mode = 'in-process'
+
+	def __init__(self):
+		self.client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+
+	def request(self, method, path, body=None, token=None):
+		headers = {'Authorization': f'Bearer {token}'} if token else {}
+		response = self.client.generic(
+			method, path, json.dumps(body) if body is not None else '',
+			content_type='application/json', headers=headers,
+		)
+		# Потоковый ответ (выгрузка заказов) читается целиком - как его получил бы клиент
+		content = b''.join(response.streaming_content) if response.streaming else response.content
+		return response.status_code, content, response.headers.get('Server-Timing', '')
+
+
+class HttpClient:
+	"""HTTP-запросы к запущенному серверу"""
+	mode = 'http'
+
+	def __init__(self, base_url):
+		self.base_url = base_url.rstrip('/')
+
+	def request(self, method, path, body=None, token=None):
+		request = urllib.request.Request(
+			self.base_url + path, method=method,
+			data=json.dumps(body).encode() if body is not None else None,
+			headers={'Content-Type': 'application/json'},
+		)
+		if token:
+			request.add_header('Authorization', f'Bearer {token}')
+		try:
+			with urllib.request.urlopen(request) as response:
+				return response.status, response.read(), response.headers.get('Server-Timing', '')
+		except urllib.error.HTTPError as exc:
+			return exc.code, exc.read(), exc.headers.get('Server-Timing', '')
+
+
+def route_names(patterns):
+	"""Имена всех маршрутов urlpatterns (включая вложенные include)"""
+	names = set()
+	for pattern in patterns:
+		if isinstance(pattern, URLResolver):
+			names |= route_names(pattern.url_patterns)
+		elif pattern.name:
+			names.add(pattern.name)
+	return names
+
+
+def first_id(client, path, token=None):
+	status, content, _ = client.request('GET', path, token=token)
+	if status != 200:
+		return None
+	data = json.loads(content)
+	results = data['results'] if isinstance(data, dict) else data
+	return results[0]['id'] if results else None
+
+
+def obtain_tokens(client, username, password):
+	status, content, _ = client.request(
+		'POST', reverse('token_obtain_pair'), {'username': username, 'password': password},
+	)
+	if status != 200:
+		raise SystemExit(f'Cannot obtain token for {username!r}: {status} {content[:200]!r}')
+	return json.loads(content)
+
+
+def build_context(client, username, password, staff_username=None, staff_password=None):
+	"""Токены и идентификаторы объектов для маршрутов с параметрами"""
+	tokens = obtain_tokens(client, username, password)
+	context = {'username': username, 'password': password, 'access': tokens['access'], 'refresh': tokens['refresh']}
+	if staff_username:
+		context['staff_access'] = obtain_tokens(client, staff_username, staff_password)['access']
+	for key, url_name, auth in (
+		('category', 'category-list', False),
+		('product', 'product-list', False),
+		('order', 'order-list', True),
+		('review', 'review-list', True),
+	):
+		value = first_id(client, reverse(url_name), context['access'] if auth else None)
+		if value is not None:
+			context[key] = value
+	return context
+
+
+def percentile(values, fraction):
+	"""Перцентиль методом ближайшего ранга"""
+	ordered = sorted(values)
+	return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def run_scenario(client, scenario, context, iterations, warmup):
+	path = scenario.path(context)
+	token = scenario.token(context)
+	latencies, queries, errors = [], [], 0
+	for index in range(warmup + iterations):
+		body = scenario.payload(context)
+		started = time.perf_counter()
+		status, _, server_timing = client.request(scenario.method, path, body, token)
+		elapsed = time.perf_counter() - started
+		if index < warmup:
+			continue
+		latencies.append(elapsed)
+		errors += status not in scenario.expect
+		match = QUERIES_RE.search(server_timing)
+		if match:
+			queries.append(int(match.group(1)))
+
+	return {
+		'method': scenario.method,
+		'path': path,
+		'requests': iterations,
+		'errors': errors,
+		'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+		'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+		'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+		'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+		'rps': round(len(latencies) / sum(latencies), 1),
+		'queries': max(queries) if queries else None,
+	}
+
+
+def git_revision():
+	try:
+		return subprocess.check_output(
+			['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL,
+		).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+	"""
+	Печатает изменения относительно baseline, возвращает число регрессий:
+	p95 вырос больше чем на threshold (и на min_delta_ms) или выросло число запросов
+	"""
+	regressions = 0
+	print(f'\n{"scenario":<24} {"p95 before":>11} {"p95 now":>9} {"change":>8} {"queries":>9}')
+	for name, current in results.items():
+		previous = baseline.get(name)
+		if previous is None:
+			print(f'{name:<24} {"-":>11} {current["p95_ms"]:>9.2f} {"new":>8}')
+			continue
+		change = current['p95_ms'] / previous['p95_ms'] - 1 if previous['p95_ms'] else 0.0
+		queries = f'{previous["queries"]}->{current["queries"]}'
+		slower = change > threshold and current['p95_ms'] - previous['p95_ms'] > min_delta_ms
+		more_queries = (current['queries'] or 0) > (previous['queries'] or 0)
+		regressions += slower or more_queries
+		flag = '  REGRESSION' if slower or more_queries else ''
+		print(
+			f'{name:<24} {previous["p95_ms"]:>11.2f} {current["p95_ms"]:>9.2f} '
+			f'{change:>+8.0%} {queries:>9}{flag}'
+		)
+	return regressions
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--base-url', help='Benchmark a running server instead of the in-process test client')
+	parser.add_argument('--username', default='synthetic_user_0')
+	parser.add_argument('--password', default='synthetic-password')
+	parser.add_argument('--staff-username', help='Staff user for the staff-only reports (skipped without it)')
+	parser.add_argument('--staff-password', help='Defaults to --password')
+	parser.add_argument('--iterations', type=int, default=50)
+	parser.add_argument('--warmup', type=int, default=3)
+	parser.add_argument('--read-only', action='store_true', help='Skip scenarios that create data')
+	parser.add_argument('--only', help='Run scenarios whose name contains this substring')
+	parser.add_argument('--output', default='benchmark_results.json')
+	parser.add_argument('--compare', help='Baseline JSON to diff against')
+	parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative p95 slowdown')
+	parser.add_argument('--min-delta-ms', type=float, default=1.0, help='Ignore p95 changes smaller than this')
+	parser.add_argument(
+		'--no-cache', action='store_true',
+		help='In-process only: disable the catalog response cache to measure the database path',
+	)
+	args = parser.parse_args()
+
+	if args.no_cache and not args.base_url:
+		override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}).enable()
+	client = HttpClient(args.base_url) if args.base_url else InProcessClient()
+	context = build_context(
+		client, args.username, args.password, args.staff_username, args.staff_password or args.password,
+	)
+
+	uncovered = route_names(api.urls.urlpatterns) - {scenario.url_name for scenario in SCENARIOS}
+	if uncovered:
+		print(f'Warning: routes without a scenario: {", ".join(sorted(uncovered))}')
+
+	results = {}
+	print(f'{"scenario":<24} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"req/s":>8} {"queries":>8} {"errors":>7}')
+	for scenario in SCENARIOS:
+		if args.only and args.only not in scenario.name:
+			continue
+		if args.read_only and scenario.writes:
+			continue
+		missing = [key for key in scenario.requires if key not in context]
+		if missing == ['staff_access']:
+			print(f'{scenario.name:<24} skipped: no --staff-username')
+			continue
+		if missing:
+			print(f'{scenario.name:<24} skipped: no {", ".join(missing)} for {args.username}')
+			continue
+		stats = results[scenario.name] = run_scenario(client, scenario, context, args.iterations, args.warmup)
+		print(
+			f'{scenario.name:<24} {stats["p50_ms"]:>8.2f} {stats["p95_ms"]:>8.2f} {stats["p99_ms"]:>8.2f} '
+			f'{stats["rps"]:>8.1f} {str(stats["queries"]):>8} {stats["errors"]:>7}'
+		)
+
+	report = {
+		'meta': {
+			'revision': git_revision(),
+			'created_at': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+			'mode': client.mode,
+			'base_url': args.base_url,
+			'database': connection.vendor if not args.base_url else None,
+			'python': platform.python_version(),
+			'iterations': args.iterations,
+			'cache': not args.no_cache,
+		},
+		'results': results,
+	}
+	with open(args.output, 'w') as output:
+		json.dump(report, output, indent=2)
+	print(f'\nSaved to {args.output}')
+
+	if args.compare:
+		with open(args.compare) as baseline:
+			regressions = compare(results, json.load(baseline)['results'], args.threshold, args.min_delta_ms)
+		if regressions:
+			raise SystemExit(f'{regressions} scenario(s) regressed')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'coffee_shop_online.settings')
+django.setup()
+
+from django.utils.text import compress_string
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from api.renderers import ORJSONRenderer
+from api.views import ProductViewSet
+
+PAGE_SIZES = (10, 100, 1000)
+REPEAT = 20
+NOW = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def product_page(size):
+	"""Страница /api/products/ в том виде, в котором её отдаёт Projection"""
+	context = {'request': APIRequestFactory().get('/api/products/', HTTP_HOST='localhost')}
+	rows = [
+		{
+			'id': i, 'name': f'Product {i}', 'description': 'Rich and bold with chocolate notes',
+			'price': Decimal('10.50') + i % 50, 'category': 1, 'category__name': 'Coffee Beans',
+			'roast_level': 'medium', 'origin': 'Brazil', 'weight_grams': 250, 'is_available': True,
+			'stock': i % 40, 'image': f'products/{i}.jpg' if i % 2 else '', 'sku': f'SKU-{i:06d}',
+			'image_variants': {'thumb': {'webp': f'products/variants/{i}-thumb.webp'}} if i % 2 else {},
+			'rating_sum': i * 4, 'review_count': i % 7, 'avg_rating': (i * 4) / (i % 7) if i % 7 else None,
+			'created_at': NOW - timedelta(minutes=i), 'updated_at': NOW,
+		}
+		for i in range(size)
+	]
+	return page(ProductViewSet.projection.serialize(rows, context))
+
+
+def order_page(size):
+	"""Страница /api/orders/ в формате OrderSerializer: заказы с тремя позициями"""
+	money = serializers.DecimalField(max_digits=10, decimal_places=2)
+	moment = serializers.DateTimeField()
+	orders = []
+	for i in range(size):
+		items = [
+			{
+				'id': i * 3 + j, 'product_name': f'Product {j}', 'product_price': money.to_representation(Decimal('12.50') + j),
+				'quantity': j + 1, 'price': money.to_representation(Decimal('12.50') + j), 'order': i, 'product': j,
+			}
+			for j in range(3)
+		]
+		orders.append({
+			'id': i, 'items': items, 'user_email': f'user{i % 50}@example.com', 'user_name': f'User {i % 50}',
+			'status': 'delivered', 'total_amount': money.to_representation(Decimal('75.00')),
+			'shipping_address': 'Moscow, Tverskaya 1', 'created_at': moment.to_representation(NOW - timedelta(hours=i)),
+			'updated_at': moment.to_representation(NOW), 'user': i % 50,
+		})
+	return page(orders)
+
+
+def page(results):
+	return {'count': 5000, 'next': 'http://localhost/api/?page=2', 'previous': None, 'results': results}
+
+
+def main():
+	renderers = {'JSONRenderer': JSONRenderer(), 'ORJSONRenderer': ORJSONRenderer()}
+	print(f'Encoding API pages, best of {REPEAT} runs')
+	print(f'{"page":>18} {"renderer":>15} {"encode":>10} {"bytes":>10} {"gzip":>10} {"gzip time":>10}')
+	for name, build in (('products', product_page), ('orders', order_page)):
+		for size in PAGE_SIZES:
+			data = build(size)
+			outputs = {label: renderer.render(data) for label, renderer in renderers.items()}
+			assert outputs['JSONRenderer'] == outputs['ORJSONRenderer']
+			compressed = compress_string(outputs['ORJSONRenderer'])
+			gzip_time = min(timeit.repeat(lambda: compress_string(outputs['ORJSONRenderer']), number=1, repeat=REPEAT))
+			times = {}
+			for label, renderer in renderers.items():
+				times[label] = min(timeit.repeat(lambda: renderer.render(data), number=1, repeat=REPEAT))
+				print(
+					f'{f"{name} x{size}":>18} {label:>15} {times[label] * 1000:8.2f}ms '
+					f'{len(outputs[label]):10d} {len(compressed):10d} {gzip_time * 1000:8.2f}ms'
+				)
+			print(f'{"":>18} {"speedup":>15} {times["JSONRenderer"] / times["ORJSONRenderer"]:8.2f}x')
+
+
+if __name__ == '__main__':
+	main()
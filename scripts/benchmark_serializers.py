@@ -0,0 +1,91 @@
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'coffee_shop_online.settings')
+django.setup()
+
+from rest_framework.test import APIRequestFactory
+from api.models import Category, Product
+from api.serializers import ProductSerializer
+from api.views import ProductViewSet
+
+ROWS = 1000
+REPEAT = 5
+
+
+def make_row(model, **values):
+	"""Строка в порядке concrete_fields модели; поля, не заданные явно, - значения по умолчанию"""
+	return tuple(
+		values[field.attname] if field.attname in values else field.get_default()
+		for field in model._meta.concrete_fields
+	)
+
+
+def make_rows(count):
+	"""Строки в том виде, в котором их возвращает БД: (category, product)"""
+	now = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+	category = make_row(
+		Category, id=1, name='Coffee Beans', description='Fresh roasted coffee beans',
+		created_at=now, updated_at=now,
+	)
+	products = [
+		make_row(
+			Product, id=i, name=f'Product {i}', description='Rich and bold with chocolate notes',
+			price=Decimal('10.50') + i % 50, category_id=1, origin='Brazil',
+			image=f'products/{i}.jpg' if i % 2 else '',
+			rating_sum=i * 4, review_count=i % 7, avg_rating=(i * 4) / (i % 7) if i % 7 else 0.0,
+			created_at=now - timedelta(minutes=i), updated_at=now,
+		)
+		for i in range(count)
+	]
+	return category, products
+
+
+def serializer_path(category_row, product_rows, context):
+	"""Текущий путь: экземпляры моделей + ProductSerializer"""
+	product_fields = [field.attname for field in Product._meta.concrete_fields]
+	category_fields = [field.attname for field in Category._meta.concrete_fields]
+	category = Category.from_db('default', category_fields, category_row)
+	products = []
+	for row in product_rows:
+		product = Product.from_db('default', product_fields, row)
+		product.category = category
+		products.append(product)
+	return ProductSerializer(products, many=True, context=context).data
+
+
+def projection_path(category_row, product_rows, context):
+	"""Быстрый путь: словари из .values() + Projection"""
+	product_fields = [field.attname for field in Product._meta.concrete_fields]
+	category_fields = [field.attname for field in Category._meta.concrete_fields]
+	rows = []
+	for row in product_rows:
+		values = dict(zip(product_fields, row))
+		values['category'] = values['category_id']
+		values['category__name'] = category_row[category_fields.index('name')]
+		rows.append(values)
+	return ProductViewSet.projection.serialize(rows, context)
+
+
+def main(rows=ROWS, repeat=REPEAT):
+	category_row, product_rows = make_rows(rows)
+	context = {'request': APIRequestFactory().get('/api/products/', HTTP_HOST='localhost')}
+	assert serializer_path(category_row, product_rows, context) == projection_path(category_row, product_rows, context)
+
+	print(f'Serializing {rows} products, best of {repeat} runs')
+	results = {}
+	for name, func in (('ProductSerializer', serializer_path), ('Projection', projection_path)):
+		best = min(timeit.repeat(lambda: func(category_row, product_rows, context), number=1, repeat=repeat))
+		results[name] = best
+		print(f'{name:>18}: {best * 1000:8.2f} ms per {rows} rows, {rows / best:10.0f} rows/s')
+	print(f'{"speedup":>18}: {results["ProductSerializer"] / results["Projection"]:8.2f}x')
+
+
+if __name__ == '__main__':
+	main()